@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""Report what a run's model objects weigh in memory, per track.
+
+Builds what collect_tracks holds for a large run with each service's model
+classes: tracks a dozen to an album, each credited to an artist object of
+its own, as from_dict builds them. It then reports the bytes tracemalloc
+saw allocated per track. The IDs and names are made before measuring, so the
+figure is what the objects themselves cost. Run it before and after a
+change to the model classes to see what the change saves or costs:
+
+    uv run python3 scripts/bench_model_memory.py --tracks 50000
+"""
+
+import argparse
+import gc
+import tracemalloc
+
+from shuffleupagus.core import model
+from shuffleupagus.services.appleMusic import model as apple_music
+from shuffleupagus.services.spotify import model as spotify
+from shuffleupagus.services.youtube import model as youtube
+
+_TRACKS_PER_ALBUM = 12
+
+FAMILIES = {
+    "core": (model.Artist, model.Album, model.Track),
+    "spotify": (spotify.SpotifyArtist, spotify.SpotifyAlbum, spotify.SpotifyTrack),
+    "youtube": (youtube.YoutubeArtist, youtube.YoutubeAlbum, youtube.YoutubeTrack),
+    "appleMusic": (apple_music.AppleMusicArtist, apple_music.AppleMusicAlbum, apple_music.AppleMusicTrack),
+}
+
+
+def measure(classes: tuple[type, type, type], count: int) -> int:
+    """Bytes allocated building count tracks with classes, albums and artists included."""
+    artist_type, album_type, track_type = classes
+    ids = [f"{n:022d}" for n in range(count)]
+    names = [f"Track number {n}" for n in range(count)]
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    tracks = []
+    album = None
+    for n in range(count):
+        if n % _TRACKS_PER_ALBUM == 0:
+            album = album_type(ids[n], names[n], "2020-01-01")
+        artists = [artist_type(ids[n], names[n])]
+        tracks.append(track_type(ids[n], names[n], 180_000 + n, "ISRC", album=album, artists=artists))
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return used
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tracks", type=int, default=50_000, help="tracks to build per family (default 50000)")
+    args = parser.parse_args()
+    print(f"{'family':<12} {'bytes/track':>12} {'total':>10}")
+    for family, classes in FAMILIES.items():
+        used = measure(classes, args.tracks)
+        print(f"{family:<12} {used / args.tracks:>12.0f} {used / 2**20:>8.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
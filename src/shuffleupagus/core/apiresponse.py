@@ -106,3 +106,29 @@ def api_has(payload: object, key: str) -> bool:
     is not an object simply has no fields.
     """
     return isinstance(payload, dict) and key in payload
+
+
+def api_project(payload: object, fields: object, service: str, what: str = "response") -> object:
+    """Return payload cut down to the fields a parser reads, checking each container on the way.
+
+    fields mirrors the payload: a dict maps each field to keep to its own
+    fields, None keeps a value whole, and a one-element list applies its
+    element to every entry of a list. A field the payload lacks is left out
+    rather than raised: optional fields stay optional, and a required one is
+    still reported by the parser that requires it. A container of the wrong
+    type is raised here, named the same way api_object and api_array name it.
+
+    Projecting what is already projected changes nothing, so a cached value
+    can go through it again.
+    """
+    if fields is None:
+        return payload
+    if isinstance(fields, list):
+        (entry,) = fields
+        return [api_project(item, entry, service, f"{what}[] entry") for item in api_array(payload, what, service)]
+    obj = api_object(payload, what, service)
+    return {
+        key: api_project(obj[key], inner, service, f"{what}.{key}")
+        for key, inner in api_object(fields, "projection", service).items()
+        if key in obj
+    }
@@ -0,0 +1,296 @@
+"""Stores a Cache can share its rows through, behind its own sqlite file.
+
+A Cache keeps everything it does in the sqlite file it opens: group commits,
+the pooled readers, range deletes, the LRU trim and snapshots are all SQL. What
+a backend adds is a second tier several processes can reach. A row that
+misses in the file is looked for in the backend, and every change is
+passed on to it. Two CI runners pointed at one server therefore start with each
+other's catalogue instead of each fetching it again.
+
+Rows cross in their stored form, the one Cache already holds in memory for a
+commit: compressed values stay compressed, and nothing is decoded on the way.
+"""
+
+import json
+import socket
+import threading
+import time
+from typing import BinaryIO, NamedTuple, Protocol
+from urllib.parse import urlsplit
+
+_RESP_PORT = 6379
+_RESP_TIMEOUT = 5.0
+
+# How long past its TTL a row stays on the server, for read_stale. The same
+# day an ABSENT entry lasts: long enough for the next run to fall back on it
+# when the service is down, short enough that the server never fills up with
+# what every runner has long since refetched.
+_STALE_FOR = 60 * 60 * 24 * 1.0
+
+
+def _redacted(url: str) -> str:
+    """url with any password in it starred out, for an error message."""
+    parts = urlsplit(url)
+    if parts.password is None:
+        return url
+    return url.replace(":" + parts.password + "@", ":***@", 1)
+
+
+class StoredRow(NamedTuple):
+    """One cache row as stored: value as the codec left it, and when it was written for how long."""
+
+    value: str | bytes
+    codec: int
+    stored_at: float
+    ttl: float
+    projection: int
+
+    @property
+    def expires_at(self) -> float:
+        return self.stored_at + self.ttl
+
+
+class BackendError(OSError):
+    """The backend answered something other than what the protocol allows.
+
+    An OSError, like the connection failures beside it: to a Cache they are
+    the same "the shared tier is not there", and it goes on without it.
+    """
+
+
+class CacheBackend(Protocol):
+    """What a Cache needs of a shared tier. Raises OSError when it cannot be reached."""
+
+    def read(self, key: str) -> StoredRow | None:
+        """The row for key if present and not expired, else None."""
+        ...
+
+    def read_stale(self, key: str) -> StoredRow | None:
+        """The row for key whether or not it has expired, or None if absent."""
+        ...
+
+    def write(self, key: str, row: StoredRow) -> None:
+        """Store row for key, replacing whatever was there."""
+        ...
+
+    def touch(self, key: str) -> bool:
+        """Restart key's TTL from now. False means it was not there."""
+        ...
+
+    def delete(self, key: str) -> bool:
+        """Remove key. False means it was not there."""
+        ...
+
+    def clean(self) -> int:
+        """Drop expired rows, returning how many."""
+        ...
+
+    def close(self) -> None:
+        """Release what the backend holds. Idempotent."""
+        ...
+
+
+class MemoryBackend:
+    """A CacheBackend in a dict, for tests and benchmarks. One instance stands in for the server."""
+
+    def __init__(self) -> None:
+        self._rows: dict[str, StoredRow] = {}
+        self._lock = threading.Lock()
+
+    def read(self, key: str) -> StoredRow | None:
+        row = self.read_stale(key)
+        return row if row is not None and row.expires_at >= time.time() else None
+
+    def read_stale(self, key: str) -> StoredRow | None:
+        with self._lock:
+            return self._rows.get(key)
+
+    def write(self, key: str, row: StoredRow) -> None:
+        with self._lock:
+            self._rows[key] = row
+
+    def touch(self, key: str) -> bool:
+        with self._lock:
+            row = self._rows.get(key)
+            if row is None:
+                return False
+            self._rows[key] = row._replace(stored_at=time.time())
+            return True
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            return self._rows.pop(key, None) is not None
+
+    def clean(self) -> int:
+        now = time.time()
+        with self._lock:
+            expired = [key for key, row in self._rows.items() if row.expires_at < now]
+            for key in expired:
+                del self._rows[key]
+        return len(expired)
+
+    def close(self) -> None:
+        pass
+
+
+class RespBackend:
+    """A CacheBackend on a server speaking RESP, Redis's protocol: Redis, Valkey, KeyDB and the like.
+
+    Only GET, SET, DEL, SELECT and, with a password in the URL, AUTH are
+    used, so anything that implements those will do. Each row is stored
+    under "shuffleupagus:<namespace>:<key>" as a line of JSON describing it
+    followed by the value's bytes. The server expires the row _STALE_FOR
+    after its TTL, which is why clean() has nothing to do.
+
+    One connection, opened on first use and used under a lock. A failure
+    closes it and raises, and the next call connects again.
+    """
+
+    def __init__(self, url: str, namespace: str, timeout: float = _RESP_TIMEOUT, stale_for: float = _STALE_FOR):
+        """url is redis://[[user]:password@]host[:port][/db]."""
+        parts = urlsplit(url)
+        if parts.scheme != "redis" or not parts.hostname:
+            raise ValueError(f"shared cache url must be redis://host[:port][/db], got {_redacted(url)!r:.60}")
+        self._address = (parts.hostname, parts.port or _RESP_PORT)
+        database = parts.path.strip("/")
+        if database and not database.isdigit():
+            raise ValueError(f"shared cache database must be a number, got {database!r:.60}")
+        self._database = int(database or 0)
+        # AUTH takes a user only from Redis 6 on, so one is sent only when given.
+        self._auth = [arg for arg in (parts.username, parts.password) if arg] if parts.password else []
+        self._prefix = f"shuffleupagus:{namespace}:"
+        self._timeout = timeout
+        self._stale_for = stale_for
+        self._conn: tuple[socket.socket, BinaryIO] | None = None
+        self._lock = threading.Lock()
+
+    def _command(self, *args: str | bytes):
+        """Send one command and return its reply. The caller holds _lock."""
+        try:
+            sock, reader = self._conn or self._connect()
+            sock.sendall(self._pack(args))
+            return self._reply(reader)
+        except OSError:
+            self._disconnect()
+            raise
+        except ValueError as exc:
+            # A length or count that is not a number: the stream is out of
+            # step, and nothing more can be read from it.
+            self._disconnect()
+            raise BackendError("shared cache sent a malformed reply") from exc
+
+    def _connect(self) -> tuple[socket.socket, BinaryIO]:
+        sock = socket.create_connection(self._address, timeout=self._timeout)
+        self._conn = sock, sock.makefile("rb")
+        if self._auth:
+            sock.sendall(self._pack(("AUTH", *self._auth)))
+            self._reply(self._conn[1])
+        if self._database:
+            sock.sendall(self._pack(("SELECT", str(self._database))))
+            self._reply(self._conn[1])
+        return self._conn
+
+    def _disconnect(self) -> None:
+        if self._conn is not None:
+            self._conn[0].close()
+        self._conn = None
+
+    @staticmethod
+    def _pack(args) -> bytes:
+        """A command as a RESP array of bulk strings."""
+        out = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg.encode() if isinstance(arg, str) else arg
+            out += [b"$%d\r\n" % len(data), data, b"\r\n"]
+        return b"".join(out)
+
+    def _reply(self, reader: BinaryIO):
+        """Read one reply: a str, an int, bytes, None, or a list of those."""
+        line = reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise BackendError("shared cache closed the connection")
+        kind, body = line[:1], line[1:-2]
+        if kind == b"+":
+            return body.decode()
+        if kind == b"-":
+            raise BackendError(f"shared cache refused a command: {body.decode(errors='replace')[:60]}")
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            size = int(body)
+            if size < 0:
+                return None
+            data = reader.read(size + 2)
+            if len(data) != size + 2:
+                raise BackendError("shared cache closed the connection")
+            return data[:-2]
+        if kind == b"*":
+            size = int(body)
+            return None if size < 0 else [self._reply(reader) for _ in range(size)]
+        raise BackendError(f"shared cache sent a reply of unknown type {kind!r}")
+
+    def _get(self, key: str) -> StoredRow | None:
+        """The row stored for key, expired or not. The caller holds _lock."""
+        data = self._command("GET", self._prefix + key)
+        if data is None:
+            return None
+        header, _, value = data.partition(b"\n")
+        try:
+            meta = json.loads(header)
+            return StoredRow(
+                value if meta["binary"] else value.decode(),
+                meta["codec"],
+                meta["stored_at"],
+                meta["ttl"],
+                meta["projection"],
+            )
+        except (KeyError, TypeError, ValueError) as exc:
+            raise BackendError(f"shared cache holds a row this version cannot read under {key!r:.60}") from exc
+
+    def _set(self, key: str, row: StoredRow) -> None:
+        """Store row for key, to be dropped _stale_for after it expires. The caller holds _lock."""
+        binary = isinstance(row.value, bytes)
+        header = json.dumps(
+            {
+                "binary": binary,
+                "codec": row.codec,
+                "stored_at": row.stored_at,
+                "ttl": row.ttl,
+                "projection": row.projection,
+            }
+        )
+        value = row.value if isinstance(row.value, bytes) else row.value.encode()
+        keep = max(1, int((row.expires_at + self._stale_for - time.time()) * 1000))
+        self._command("SET", self._prefix + key, header.encode() + b"\n" + value, "PX", str(keep))
+
+    def read(self, key: str) -> StoredRow | None:
+        row = self.read_stale(key)
+        return row if row is not None and row.expires_at >= time.time() else None
+
+    def read_stale(self, key: str) -> StoredRow | None:
+        with self._lock:
+            return self._get(key)
+
+    def write(self, key: str, row: StoredRow) -> None:
+        with self._lock:
+            self._set(key, row)
+
+    def touch(self, key: str) -> bool:
+        """A read and a write, so not atomic: a write from elsewhere in between is overwritten."""
+        with self._lock:
+            row = self._get(key)
+            if row is None:
+                return False
+            self._set(key, row._replace(stored_at=time.time()))
+            return True
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            return self._command("DEL", self._prefix + key) > 0
+
+    def clean(self) -> int:
+        return 0
+
+    def close(self) -> None:
+        with self._lock:
+            self._disconnect()
@@ -1,15 +1,30 @@
+import asyncio
+import contextlib
+import gzip
 import json
 import os
+import random
+import shutil
 import sqlite3
 import stat
+import sys
+import tempfile
 import threading
 import time
+import zlib
+from collections import Counter, OrderedDict, defaultdict
+from collections.abc import Callable, Iterable, Mapping
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
-from typing import Self
+from queue import Empty, SimpleQueue
+from typing import Any, NamedTuple, Self
 
+from .backend import CacheBackend, StoredRow
 from .config import contained_path
 
 CACHE_DEFAULT_CUTOFF = 60 * 60 * 24 * 7 * 1.0  # 1 week
+CACHE_ABSENT_CUTOFF = 60 * 60 * 24 * 1.0  # 1 day
 
 _CACHE_DIR = Path("~/.cache/shuffleupagus").expanduser()
 
@@ -17,6 +32,290 @@ _CACHE_DIR = Path("~/.cache/shuffleupagus").expanduser()
 # set, so the open still works and _prepare_file falls back to an islink check.
 _O_NOFOLLOW = getattr(os, "O_NOFOLLOW", 0)
 
+# Keys bound into one `IN (...)` list. sqlite builds before 3.32 cap bound
+# parameters at 999, and the stdlib can still be linked against one of those,
+# so a longer read_many is split rather than failing with "too many SQL
+# variables". An artist's key set is far below this, so it stays one statement.
+_IN_CHUNK = 500
+
+# Group commit bounds. Changes made inside batch(), or with write-behind on,
+# are committed together once this many are pending or the oldest has waited
+# this long — whichever comes first — and always at save() and close(). The
+# count bounds what a crash can lose; the age bounds how long this process
+# holds sqlite's write lock against another one.
+_GROUP_LIMIT = 1000
+_GROUP_SECONDS = 5.0
+
+# How long a connection waits for another process to let go of the write
+# lock before sqlite reports it busy: the stdlib's own default.
+_BUSY_TIMEOUT = 5.0
+
+# A statement or commit refused because another process holds the lock is
+# tried this many times in all, with a jittered pause doubling from
+# _LOCK_BACKOFF between tries. busy_timeout has already waited by then, or
+# sqlite refused to wait at all, which it does rather than risk a deadlock.
+_LOCK_RETRIES = 3
+_LOCK_BACKOFF = 0.05
+
+# A process waiting on another's lease checks back this often, doubling up
+# to the longest pause, until the value is there or the lease is gone.
+_LEASE_POLL = 0.05
+_LEASE_POLL_MAX = 1.0
+
+_LEASE_SCHEMA = """CREATE TABLE IF NOT EXISTS leases (
+    key TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    waiting INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID"""
+
+# Prefetched rows held for the reads that follow. A prefetched row is handed out
+# once and dropped, so this only bounds rows prefetched and then never read.
+_STAGE_LIMIT = 2048
+
+# How a row's value is stored, recorded per row in the codec column. Rows
+# written before the column existed read back as _PLAIN, which is what they
+# are. Values shorter than _COMPRESS_MIN stay plain: zlib's header and the
+# time spent would outweigh what it saves on a short fingerprint or an ID.
+_PLAIN = 0
+_ZLIB = 1
+_COMPRESS_MIN = 512
+
+# A row recording that the service confirmed the key is not there. Its value
+# is empty and never decoded, so no JSON a service returns can be mistaken for
+# one, and it reads back as ABSENT rather than as a value.
+_ABSENT = 2
+
+# The layout of the cache table, recorded in PRAGMA user_version. 0 is every
+# database from before the layout had a version, with or without the codec
+# column; _migrate brings any of them up to this.
+_SCHEMA_VERSION = 5
+
+# expires_at is kept equal to stored_at + ttl by sqlite itself, so nothing that
+# writes stored_at — a write, a touch, a test backdating a row — can leave it
+# stale, and size likewise follows the row it measures. Generated columns need
+# sqlite 3.31 (2020); anything older fails the CREATE and the cache degrades
+# rather than the run failing. length() counts characters in text, which
+# json.dumps keeps to ASCII, and bytes in a compressed value.
+_SCHEMA = """CREATE TABLE {table} (
+    key         TEXT PRIMARY KEY,
+    value       TEXT NOT NULL,
+    codec       INTEGER NOT NULL DEFAULT 0,
+    stored_at   REAL NOT NULL,
+    ttl         REAL NOT NULL,
+    accessed_at REAL NOT NULL DEFAULT 0,
+    projection  INTEGER NOT NULL DEFAULT 0,
+    expires_at  REAL GENERATED ALWAYS AS (stored_at + ttl) STORED,
+    size        INTEGER GENERATED ALWAYS AS (length(key) + length(value)) STORED
+) WITHOUT ROWID"""
+
+# accessed_at leads with size alongside, so both the walk from the least
+# recently used row and the SUM(size) that decides how far to walk are read
+# from the index alone, without touching a single value.
+_INDEXES = (
+    "CREATE INDEX cache_expires_at ON cache (expires_at)",
+    "CREATE INDEX cache_accessed_at ON cache (accessed_at, size)",
+)
+
+# An artist's catalog, one row per track in the order the service listed
+# them, beside the cache rows it was built from. tracks_dedupe hands
+# catalog() each dedupe_hash's tracks together, first listed first, so the
+# dedupe is a walk of the index. A source's stored_at is NULL for an optional
+# key that was not cached when the catalog was stored, and it must stay so.
+_CATALOG_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS tracks (
+    artist_id      TEXT NOT NULL,
+    ordinal        INTEGER NOT NULL,
+    id             TEXT NOT NULL,
+    name           TEXT NOT NULL,
+    duration_ms    INTEGER NOT NULL,
+    isrc           TEXT,
+    dedupe_hash    TEXT NOT NULL,
+    album_id       TEXT NOT NULL,
+    album_name     TEXT NOT NULL,
+    album_released TEXT,
+    PRIMARY KEY (artist_id, ordinal)
+) WITHOUT ROWID""",
+    "CREATE INDEX IF NOT EXISTS tracks_dedupe ON tracks (artist_id, dedupe_hash, ordinal)",
+    """CREATE TABLE IF NOT EXISTS catalog_sources (
+    artist_id TEXT NOT NULL,
+    key       TEXT NOT NULL,
+    stored_at REAL,
+    PRIMARY KEY (artist_id, key)
+) WITHOUT ROWID""",
+)
+
+# A catalog is current while every row it was built from is still the one it
+# was built from and has not expired, and every key that was missing still is.
+# Anything that changes a source — a write, a touch, a delete, an eviction,
+# expire_ahead — turns its catalog stale with no bookkeeping of its own.
+_CATALOG_CURRENT = (
+    "SELECT count(*), total(CASE WHEN c.key IS NULL THEN s.stored_at IS NULL "
+    "ELSE c.stored_at = s.stored_at AND c.expires_at >= ? END) "
+    "FROM catalog_sources s LEFT JOIN cache c ON c.key = s.key WHERE s.artist_id = ?"
+)
+_CATALOG_STALE = (
+    "SELECT DISTINCT s.artist_id FROM catalog_sources s LEFT JOIN cache c ON c.key = s.key "
+    "WHERE NOT (CASE WHEN c.key IS NULL THEN s.stored_at IS NULL "
+    "ELSE c.stored_at = s.stored_at AND c.expires_at >= ? END)"
+)
+
+# One track of each dedupe_hash, the first listed, leaving out what the
+# caller excludes. Exclusions are bound as JSON arrays, however many there are.
+_CATALOG_CANDIDATES = (
+    "SELECT id, name, duration_ms, isrc, dedupe_hash, album_id, album_name, album_released, min(ordinal) "
+    "FROM tracks WHERE artist_id = ? AND duration_ms <= ? "
+    "AND id NOT IN (SELECT value FROM json_each(?)) "
+    "AND album_id NOT IN (SELECT value FROM json_each(?)) "
+    "AND dedupe_hash NOT IN (SELECT value FROM json_each(?)) "
+    "GROUP BY dedupe_hash ORDER BY min(ordinal)"
+)
+
+# Rows evicted per statement. Each chunk commits and releases _lock before the
+# next, so a large eviction lets reads and writes through in between.
+_EVICT_CHUNK = 500
+
+# A file this much larger than max_bytes once the free pages are released is
+# fragmented — pages kept alive by a few surviving rows — and only a full
+# VACUUM gives that back. It rewrites the whole file, so at most once a run.
+_VACUUM_SLACK = 1.25
+
+# What a read finds for a key whose delete is waiting for its group commit.
+# Empty, so "if not row" covers it and an absent row alike.
+_GONE: tuple = ()
+
+
+class _Absent:
+    """The type of ABSENT. Falsy, so code testing a value for truth skips it."""
+
+    __slots__ = ()
+
+    def __bool__(self) -> bool:
+        return False
+
+    def __repr__(self) -> str:
+        return "ABSENT"
+
+
+# What read() answers for a key the service said it does not have, where a
+# miss answers None: "known absent, don't ask again" rather than "not cached".
+# Stored with write(key, ABSENT), and answered by a get_or_fetch fetcher that
+# has just been told so.
+ABSENT = _Absent()
+
+
+class _Unchanged:
+    """The type of UNCHANGED."""
+
+    __slots__ = ()
+
+    def __repr__(self) -> str:
+        return "UNCHANGED"
+
+
+# Answered by a get_or_fetch fetcher that found the expired entry still
+# current. The entry is touched, which restarts its TTL, rather than written
+# again, and its value is what get_or_fetch answers.
+UNCHANGED = _Unchanged()
+
+
+# What get_or_fetch writes a fetched value with: a TTL, one worked out from
+# the value as it is written, or None for the cache's own.
+FetchTTL = float | Callable[[Any], float] | None
+
+
+class CatalogTrack(NamedTuple):
+    """One track of an artist's catalog as store_catalog keeps it, with the album it is on."""
+
+    id: str
+    name: str
+    duration_ms: int
+    isrc: str | None
+    dedupe_hash: str
+    album_id: str
+    album_name: str
+    album_released: str | None
+
+
+class Projection(NamedTuple):
+    """What get_or_fetch keeps of a fetched value, and which version of that choice it is.
+
+    project must be idempotent, since a stale value it already projected
+    can come back through it, and version goes up whenever what it keeps
+    changes. Every row records the version it was written under in its
+    projection column; 0 is a value stored whole.
+    """
+
+    version: int
+    project: Callable[[object], object]
+
+
+def _ttl_rules(policy: Mapping[str, float]) -> list[tuple[str, str, float]]:
+    """A TTL policy as (prefix, suffix, ttl), the most specific pattern first.
+
+    A pattern is a key prefix, optionally followed by * and a suffix:
+    "top-tracks:" and "top-tracks:*" both match every top-tracks key, and
+    "album:*:tracks" only the tracklists. Where several match, the longest
+    pattern wins, so "album:*:tracks" overrides "album:" for a tracklist.
+    """
+    rules = []
+    for pattern, ttl in policy.items():
+        prefix, _, suffix = pattern.partition("*")
+        if "*" in suffix:
+            raise ValueError(f"a TTL pattern takes at most one *, got {pattern!r}")
+        rules.append((prefix, suffix, ttl))
+    return sorted(rules, key=lambda rule: len(rule[0]) + len(rule[1]), reverse=True)
+
+
+def key_class(key: str) -> str:
+    """The class a key is counted under: everything up to its first colon.
+
+    "artist:X" and "artist:X:albums" are both "artist:", "album:Y:tracks" is
+    "album:". A key with no colon, like the rate-limit window, is its own class.
+    """
+    head, colon, _ = key.partition(":")
+    return head + colon
+
+
+def _prefix_end(prefix: str) -> str | None:
+    """The least key after every key starting with prefix, or None when nothing comes after them.
+
+    sqlite compares TEXT keys as UTF-8 bytes, which orders them the way their
+    code points order, so bumping the last character that can be bumped
+    bounds the range. Surrogates are skipped: they cannot be encoded.
+    """
+    while prefix:
+        last = ord(prefix[-1]) + 1
+        if last <= sys.maxunicode:
+            return prefix[:-1] + chr(0xE000 if 0xD800 <= last <= 0xDFFF else last)
+        prefix = prefix[:-1]
+    return None
+
+
+def _prefix_range(prefix: str) -> tuple[str, tuple[str, ...]]:
+    """A WHERE condition on key for every key starting with prefix, and its bound values."""
+    end = _prefix_end(prefix)
+    return ("key >= ? AND key < ?", (prefix, end)) if end is not None else ("key >= ?", (prefix,))
+
+
+def _contended(exc: Exception) -> bool:
+    """Whether exc is sqlite saying another connection holds the lock it needs."""
+    return isinstance(exc, sqlite3.OperationalError) and ("locked" in str(exc) or "busy" in str(exc))
+
+
+def _stored_size(value) -> int:
+    """Bytes a stored value takes. json.dumps escapes to ASCII, so text is one byte a character."""
+    return len(value) if isinstance(value, str | bytes) else 0
+
+
+def _human(size: int) -> str:
+    """A byte count the way the end-of-run report prints it."""
+    if size < 1000:
+        return f"{size} B"
+    if size < 1000**2:
+        return f"{size / 1000:.1f} kB"
+    return f"{size / 1000**2:.1f} MB"
+
 
 class CacheClosedError(RuntimeError):
     """A closed Cache was used.
@@ -49,46 +348,307 @@ class Cache:
     the test suite, which is why nothing under `src/` uses them. Production
     teardown goes through `Service.close()` instead, and both paths evict before
     closing so they leave the same thing on disk.
+
+    **Threads.** Every change goes through one writer connection under _lock.
+    Reads take _lock only to check state and then run on a pooled read-only
+    connection outside it, so the artist and album worker pools read in
+    parallel, which WAL allows, instead of queueing behind each other.
     """
 
     name: str
     cutoff: float
+    absent_ttl: float
+    # The timer that commits a group once its oldest change is _GROUP_SECONDS
+    # old, armed by the first change a group defers. Guarded by _lock.
+    _flusher: threading.Timer | None = None
+    # Whether a shared row that would not decode has been reported yet.
+    _shared_unreadable = False
+
+    def __init__(
+        self,
+        name: str,
+        cutoff: float = CACHE_DEFAULT_CUTOFF,
+        write_behind: int = 0,
+        memory_entries: int = 0,
+        memory_bytes: int = 0,
+        evict_interval: float = 0,
+        max_bytes: int = 0,
+        refresh_budget: int = 0,
+        absent_ttl: float = CACHE_ABSENT_CUTOFF,
+        ttl_jitter: float = 0,
+        refresh_ahead: int = 0,
+        ttl_policy: Mapping[str, float] | None = None,
+        shared: CacheBackend | None = None,
+        busy_timeout: float = _BUSY_TIMEOUT,
+        lease_seconds: float = 0,
+    ):
+        """write_behind > 0 commits changes in groups of that many instead of one at a time.
+
+        Grouped changes are visible to reads as soon as they are made — they
+        sit in the connection's open transaction — but reach disk only at the
+        group commit, so a crash loses at most one group. That is the same
+        trade the rest of this class makes: everything here can be fetched
+        again, except what callers mark required=True, which never waits.
+
+        memory_entries and memory_bytes turn on an in-process tier of decoded
+        values in front of sqlite, least recently used out first. Either budget
+        alone is enough; with both, an entry goes as soon as either is over.
+        Bytes are counted as the JSON text, before any compression, which
+        tracks the decoded size closely enough to budget by.
+
+        evict_interval > 0 evicts one chunk of expired rows every that many
+        seconds on a background thread, so the eviction at close() finds
+        little left to do however large the file has grown.
+
+        max_bytes > 0 caps what the rows take, counted as key plus stored
+        value: past it, save() and the background eviction drop the least
+        recently used rows until they fit, then hand the freed pages back to
+        the filesystem. Reads record when each key was last used in memory,
+        and those times reach the database together, ahead of each trim.
+
+        refresh_budget > 0 lets get_or_fetch(revalidate=True) answer an
+        expired entry at once and refresh it in the background, that many
+        times a run. Past the budget, an expired entry is fetched in line again.
+
+        absent_ttl is how long an ABSENT entry lasts when written without a
+        ttl of its own: short, since a catalogue does gain what it lacked.
+
+        ttl_jitter spreads the TTL of entries written without one of their
+        own by up to that fraction either way, so a cache filled in one run
+        does not come due all in one later run. A ttl passed in is exact.
+
+        refresh_ahead > 0 is how many entries expire_ahead() may bring due
+        early each run, so that refetching goes on a steady amount at a time
+        instead of waiting for whole fills to expire together.
+
+        ttl_policy maps key patterns to the TTL written for the keys they
+        match, in place of cutoff: a tracklist that never changes can last
+        months while top tracks come due in days. See _ttl_rules for the
+        patterns. Keys it does not match get cutoff.
+
+        shared is a tier behind the file that other processes reach too; see
+        backend.py. A read the file cannot answer fresh is looked for there,
+        and kept in the file when found. Writes, touches and deletes are
+        passed on to it. It is closed with the cache.
 
-    def __init__(self, name: str, cutoff: float = CACHE_DEFAULT_CUTOFF):
+        busy_timeout is how long a statement waits for another process using
+        the same file to let go of the lock. Past that, a change is tried
+        again a few times and then skipped; the cache stays in use either way.
+
+        lease_seconds > 0 makes get_or_fetch single-flight across processes
+        too: before fetching, a process takes a lease on the key for that
+        long, and another process missing the same key waits for its value
+        instead of fetching it again. The lease outlives a process that
+        died holding it by no more than that.
+        """
         self.name = name
         self.cutoff = cutoff
+        self.absent_ttl = absent_ttl
+        self._ttl_rules = _ttl_rules(ttl_policy or {})
+        self._ttl_jitter = ttl_jitter
+        self._refresh_ahead = refresh_ahead
+        self._shared = shared
+        self._busy_timeout = busy_timeout
+        self._lease_seconds = lease_seconds
+        # The lease file's connection, in autocommit, under a lock of its
+        # own, and whether open() got that far, which is when a busy
+        # database stops being fatal.
+        self._leases: sqlite3.Connection | None = None
+        self._lease_lock = threading.Lock()
+        self._opened = False
+        self._write_behind = write_behind
+        self._memory_entries = memory_entries
+        self._memory_bytes = memory_bytes
+        self._max_bytes = max_bytes
+        # key -> when a read last answered it, not yet in accessed_at. A lock
+        # of its own, so a read records a use without queueing on _lock again.
+        self._accessed: dict[str, float] = {}
+        self._access_lock = threading.Lock()
+        self._vacuumed = False
+        # key -> (decoded value, expires_at, size, projection), least
+        # recently used first. _generation counts changes, so a value decoded outside the
+        # lock is only remembered if nothing changed while it was decoding.
+        self._memory: OrderedDict[str, tuple[object, float, int, int]] = OrderedDict()
+        self._memory_size = 0
+        self._generation = 0
         self._lock = threading.Lock()
+        # Uncommitted changes, when the first of them was made, and how many
+        # batch() blocks are open. All guarded by _lock.
+        self._pending = 0
+        self._pending_since = 0.0
+        self._batch_depth = 0
         self._closed = False
         self._degraded = False
         self._reported: set[str] = set()
+        # key -> (value, codec, expires_at, projection) as stored, filled by
+        # prefetch(). Guarded by _lock, like everything else here.
+        self._staged: dict[str, tuple[str | bytes, int, float, int]] = {}
+        # Idle reader connections, and how many reads are running on one
+        # outside _lock. close() waits for that count to reach zero before it
+        # closes anything, and _closing turns new operations away meanwhile.
+        self._readers: list[sqlite3.Connection] = []
+        self._reading = 0
+        self._closing = False
+        self._drained = threading.Condition(self._lock)
+        # Changes made on the writer but not yet committed, which the readers
+        # cannot see: key -> (value, codec, expires_at, projection), or None
+        # for a delete. Emptied by every commit.
+        self._unflushed: dict[str, tuple | None] = {}
+        # key -> the fetch get_or_fetch is running for it, which callers
+        # missing the same key wait on rather than fetching again.
+        self._inflight: dict[str, Future] = {}
+        # Background refreshes: how many this run may still start, and the
+        # one worker they queue on, started with the first of them.
+        self._refresh_budget = refresh_budget
+        self._refresher: ThreadPoolExecutor | None = None
+        self._stop = threading.Event()
+        self._evictor: threading.Thread | None = None
+        # key_class -> event -> count, for stats(). A lock of its own, held only
+        # for the increment, so counting adds nothing to contention on _lock.
+        self._stats: defaultdict[str, Counter[str]] = defaultdict(Counter)
+        self._stats_lock = threading.Lock()
+        self._io = _AsyncIO(self)
         print(f"* loading '{name}' cache", flush=True)
-        path = self._db_path()
-        # Opening is inside the policy too. An unwritable cache directory or a
-        # database that will not open is the most common real breakage of a
-        # cache, and it is exactly the case where a rebuildable file should
-        # cost a slower run rather than the whole run.
+        self._path = self._db_path()
         self._conn: sqlite3.Connection | None = None
+        if self._open() and evict_interval > 0:
+            self._evictor = threading.Thread(
+                target=self._evict_in_background,
+                args=(evict_interval,),
+                name=f"cache-{name}-evict",
+                daemon=True,
+            )
+            self._evictor.start()
+
+    def _open(self) -> bool:
+        """Open and configure the database file. False when it would not, and the cache is degraded.
+
+        Opening is inside the policy too. An unwritable cache directory or a
+        database that will not open is the most common real breakage of a
+        cache, and it is exactly the case where a rebuildable file should
+        cost a slower run rather than the whole run.
+        """
+        path = self._path
         try:
             self._prepare_dir(os.path.dirname(path))
             self._prepare_file(path)
-            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn = sqlite3.connect(path, timeout=self._busy_timeout, check_same_thread=False)
         except (OSError, sqlite3.Error) as exc:
             self._degrade("opening", exc)
-            return
+            return False
         try:
-            self._conn.execute("PRAGMA journal_mode=WAL")
-            self._conn.execute("PRAGMA synchronous=NORMAL")
-            self._conn.execute(
-                """CREATE TABLE IF NOT EXISTS cache (
-                    key       TEXT PRIMARY KEY,
-                    value     TEXT NOT NULL,
-                    stored_at REAL NOT NULL,
-                    ttl       REAL NOT NULL
-                )"""
-            )
-            self._conn.commit()
+            self._configure()
         except sqlite3.DatabaseError as exc:
             self._degrade("opening", exc)
+            return False
+        self._opened = True
+        if self._lease_seconds > 0:
+            self._open_leases()
+        return True
+
+    @property
+    def _owner(self) -> str:
+        """Who this cache is to the other processes holding leases."""
+        return f"{os.getpid()}:{id(self):x}"
+
+    def _lease_path(self) -> str:
+        """The lease file, beside the database."""
+        return os.path.splitext(self._path)[0] + ".leases.db"
+
+    def _open_leases(self) -> None:
+        """Open the lease file, or carry on without leases when it will not open.
+
+        A file of its own rather than a table in the database: a lease is taken
+        and released in a transaction of its own, which in the database would
+        have to commit every change the group commit is holding back, and wait
+        behind another process's group for the write lock besides.
+        """
+        path = self._lease_path()
+        try:
+            self._prepare_file(path)
+            conn = sqlite3.connect(path, timeout=self._busy_timeout, isolation_level=None, check_same_thread=False)
+        except (OSError, sqlite3.Error) as exc:
+            self._drop_leases("opening", exc)
+            return
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(_LEASE_SCHEMA)
+        except sqlite3.Error as exc:
+            conn.close()
+            self._drop_leases("opening", exc)
+            return
+        self._leases = conn
+
+    def _configure(self) -> None:
+        """Set the connection's pragmas and bring the table up to date."""
+        db = self._db
+        if self._max_bytes:
+            # Applies to a new file as it is created, and to an existing one
+            # at its next VACUUM, which _reclaim runs when it must. Ahead of
+            # journal_mode, whose header write is what creates the file.
+            db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        self._migrate(db)
+
+    @staticmethod
+    def _migrate(db: sqlite3.Connection) -> None:
+        """Bring the table on db up to _SCHEMA_VERSION.
+
+        v2 is WITHOUT ROWID: every lookup is by key, and a rowid table keyed by
+        TEXT stores each key twice, once in the table and once in the index
+        behind its primary key. Its expires_at is indexed, so eviction is a
+        range on that index rather than a scan doing arithmetic on every row,
+        and a read compares one column. A rowid cannot be dropped in place, so
+        an older table is copied across once, on the first run after upgrading.
+        Rows from before the codec column existed come across as _PLAIN.
+
+        v3 adds accessed_at and size for the max_bytes trim. A stored generated
+        column cannot be added in place either, so v2 is copied the same way,
+        each row counting as last used when it was stored.
+
+        v4 adds projection, a plain column that v3 gains in place. Every row
+        already there was stored whole, which is what its default of 0 says.
+
+        v5 adds the catalog tables beside cache, which nothing older has, so
+        they start empty and fill as artists are processed.
+
+        BEGIN IMMEDIATE takes the write lock before the version is read, so a
+        second process opening the same file waits and then finds the work
+        done, and a migration that fails part way leaves the old table whole.
+
+        A static method because import_snapshot runs it on a snapshot too,
+        which may have been exported by an older version.
+        """
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            version = db.execute("PRAGMA user_version").fetchone()[0]
+            if version > _SCHEMA_VERSION:
+                raise sqlite3.DatabaseError(f"schema version {version} is newer than this shuffleupagus reads")
+            if version == 3:
+                db.execute("ALTER TABLE cache ADD COLUMN projection INTEGER NOT NULL DEFAULT 0")
+            elif version < 3:
+                columns = {row[1] for row in db.execute("PRAGMA table_info(cache)")}
+                db.execute(_SCHEMA.format(table="cache_next"))
+                if columns:
+                    # Only a column name or a constant is formatted in.
+                    codec = "codec" if "codec" in columns else str(_PLAIN)
+                    rows = f"SELECT key, value, {codec}, stored_at, ttl, stored_at FROM cache"  # noqa: S608
+                    db.execute("INSERT INTO cache_next (key, value, codec, stored_at, ttl, accessed_at) " + rows)
+                    # Takes the old table's indexes with it, freeing their names.
+                    db.execute("DROP TABLE cache")
+                db.execute("ALTER TABLE cache_next RENAME TO cache")
+                for index in _INDEXES:
+                    db.execute(index)
+            if version < 5:
+                for statement in _CATALOG_SCHEMA:
+                    db.execute(statement)
+            if version < _SCHEMA_VERSION:
+                db.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+            db.commit()
+        except sqlite3.Error:
+            db.rollback()
+            raise
 
     @property
     def _db(self) -> sqlite3.Connection:
@@ -177,6 +737,62 @@ class Cache:
             self._degrade("decoding", exc)
             return self._unusable(required, "decoded")
 
+    @staticmethod
+    def _encode(obj) -> tuple[str | bytes, int]:
+        """The stored form of a value, and the codec that reads it back.
+
+        Compressed only when that is actually smaller. Level 6 is zlib's own
+        default, and on API payloads it is within a few percent of level 9 at
+        a fraction of the time.
+        """
+        if obj is ABSENT:
+            return "", _ABSENT
+        text = json.dumps(obj)
+        if len(text) >= _COMPRESS_MIN:
+            packed = zlib.compress(text.encode(), 6)
+            if len(packed) < len(text):
+                return packed, _ZLIB
+        return text, _PLAIN
+
+    def _expand(self, value, codec, required: bool = False) -> str | None:
+        """The JSON text of a stored value, degrading to a miss if it will not inflate.
+
+        The same disposable-cache failure as a value that is not JSON: a
+        corrupt row, or a codec this version does not know, which is what a
+        database written by a newer version would hand back.
+        """
+        try:
+            return self._inflate(value, codec)
+        except (TypeError, ValueError, zlib.error) as exc:
+            return self._corrupt(exc, required)
+
+    @staticmethod
+    def _inflate(value, codec) -> str:
+        """The JSON text of a stored value that is not ABSENT. Raises for one that will not inflate."""
+        if codec == _PLAIN:
+            return value
+        if codec != _ZLIB:
+            raise ValueError(f"unknown codec {codec!r}")
+        return zlib.decompress(value).decode()
+
+    def _corrupt(self, exc: Exception, required: bool) -> None:
+        """Degrade for a value that will not inflate, and answer as _unusable does."""
+        self._degrade("decompressing", exc)
+        return self._unusable(required, "decoded")
+
+    def _load(self, key: str, row, generation: int, required: bool):
+        """Decode a (value, codec, expires_at, projection) row for _read(), remembering it."""
+        value, codec, expires_at, projection = row
+        if codec == _ABSENT:
+            self._remember(key, ABSENT, expires_at, value, generation, projection)
+            return ABSENT
+        text = self._expand(value, codec, required)
+        if text is None:
+            return None
+        decoded = self._decode(text, required)
+        self._remember(key, decoded, expires_at, text, generation, projection)
+        return decoded
+
     def _degrade(self, operation: str, exc: Exception) -> None:
         """Mark the cache unusable and say so, then let the run continue.
 
@@ -194,12 +810,21 @@ class Cache:
         latch would report "database is locked" and then stay quiet through a
         later "disk image is malformed", which is the more serious of the two
         and the one naming the real remedy.
+
+        Another process holding the lock is the exception: nothing is wrong
+        with the file, and the next statement may well get through. Once the
+        cache is open, that failure skips the one operation and leaves the
+        cache in use, so two overlapping runs do not turn each other's
+        caching off. Opening still degrades, since there is no cache yet.
         """
         if isinstance(exc, sqlite3.ProgrammingError):
             # A wrong binding count or bad SQL is a bug in this file, not a
             # broken file on disk. Degrading would hide it behind a cache miss,
             # and the tests assert miss-equivalent values, so it would pass them.
             raise exc
+        if self._opened and _contended(exc):
+            self._contend(operation, exc)
+            return
 
         self._degraded = True
         kind = type(exc).__name__
@@ -212,6 +837,17 @@ class Cache:
             flush=True,
         )
 
+    def _contend(self, operation: str, exc: Exception) -> None:
+        """Say, once, that an operation was skipped because another process held the lock."""
+        if "contended" in self._reported:
+            return
+        self._reported.add("contended")
+        print(
+            f"! cache '{self.name}' is busy, skipped {operation}: {self._brief(exc)}. {self._remedy(exc)} "
+            "This run goes on caching what it can.",
+            flush=True,
+        )
+
     @staticmethod
     def _brief(exc: Exception, limit: int = 60) -> str:
         """A bounded repr of an untrusted message, marked when it was cut.
@@ -230,7 +866,7 @@ class Cache:
         actively harmful for a lock: another shuffleupagus process is using
         that file, and deleting it destroys that run's cache.
         """
-        if isinstance(exc, sqlite3.OperationalError) and "locked" in str(exc):
+        if _contended(exc):
             return "Another shuffleupagus process is probably using it; wait for that run to finish."
         return f"Delete {self._db_path()} to rebuild it."
 
@@ -267,42 +903,239 @@ class Cache:
         Checked under the lock rather than before taking it: an unlocked check
         could pass and then have close() land before the statement runs, which
         turns a clear error back into the bare sqlite3.ProgrammingError this
-        exists to replace.
+        exists to replace. A close that is waiting for reads to finish already
+        counts as closed.
         """
-        if self._closed:
+        if self._closed or self._closing:
             raise CacheClosedError(f"cache '{self.name}' is closed")
 
+    @property
+    def _remembering(self) -> bool:
+        return bool(self._memory_entries or self._memory_bytes)
+
+    def _recall(self, key: str):
+        """The in-memory entry for a key, marked as just used. The caller holds _lock."""
+        entry = self._memory.get(key)
+        if entry is not None:
+            self._memory.move_to_end(key)
+        return entry
+
+    def _forget(self, key: str) -> None:
+        """Drop a key from memory and count a change. The caller holds _lock."""
+        self._generation += 1
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_size -= entry[2]
+
+    def _remember(self, key: str, value, expires_at, text, generation: int, projection: int = 0) -> None:
+        """Keep a value decoded outside the lock, unless the row changed meanwhile.
+
+        Values are shared with every later reader of the key, so callers treat
+        what the cache hands them as read-only — which every service here
+        already does, since they only ever read a response through api_*.
+        """
+        if not self._remembering:
+            return
+        # Only rows whose expiry the check can use. Anything else is the
+        # corrupt-row case read() guards against, and is left to sqlite.
+        if not isinstance(expires_at, int | float) or isinstance(expires_at, bool):
+            return
+        size = len(text) if isinstance(text, str | bytes) else 0
+        if self._memory_bytes and size > self._memory_bytes:
+            return
+        with self._lock:
+            if generation != self._generation or self._closed or self._degraded:
+                return
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._memory_size -= old[2]
+            self._memory[key] = (value, expires_at, size, projection)
+            self._memory_size += size
+            while self._memory and (
+                (self._memory_entries and len(self._memory) > self._memory_entries)
+                or (self._memory_bytes and self._memory_size > self._memory_bytes)
+            ):
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_size -= evicted[2]
+
+    def _used(self, *keys: str) -> None:
+        """Note that a read just answered keys, for the max_bytes trim. A no-op without one."""
+        if not self._max_bytes:
+            return
+        now = time.time()
+        with self._access_lock:
+            for key in keys:
+                self._accessed[key] = now
+
+    def _record_accesses(self) -> None:
+        """Write the uses _used noted to accessed_at, in one statement. The caller holds _lock."""
+        with self._access_lock:
+            accessed, self._accessed = self._accessed, {}
+        if accessed:
+            self._db.executemany(
+                "UPDATE cache SET accessed_at = ? WHERE key = ?", [(at, key) for key, at in accessed.items()]
+            )
+            self._changed()
+
+    def _count(self, key: str, event: str | None = None, read: int = 0, written: int = 0) -> None:
+        """Count one event against key's class, with the bytes it moved to or from disk."""
+        with self._stats_lock:
+            counts = self._stats[key_class(key)]
+            if event is not None:
+                counts[event] += 1
+            if read:
+                counts["bytes_read"] += read
+            if written:
+                counts["bytes_written"] += written
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        """What this cache has done since it was opened, by key class.
+
+        {"artist:": {"hits": 40, "misses": 2, ...}, "album:": {...}}. The events:
+        hits (fresh), misses (absent), expired (present but past its TTL) — one
+        of those three per key a read or read_many asks for — then stale (a
+        read_stale that answered), touches (an entry whose TTL was extended),
+        writes, coalesced (a get_or_fetch that waited on another caller's
+        fetch instead of making its own), revalidated (an expired entry
+        answered while a background refresh was started for it),
+        reprojected (a value stored whole, cut down in place), advanced (an
+        entry expire_ahead brought due early), shared (a miss or expired
+        entry the shared tier answered instead), and bytes_read and
+        bytes_written, which count what crossed the connection: a read
+        answered from memory or a held row reads nothing. An event that never
+        happened is absent rather than zero. "catalog:" counts has_catalog()
+        as a read and each catalog kept as a write.
+        """
+        with self._stats_lock:
+            return {kind: dict(counts) for kind, counts in sorted(self._stats.items())}
+
+    def summary(self) -> list[str]:
+        """stats() as one line per key class, for the end-of-run report."""
+        lines = []
+        for kind, counts in self.stats().items():
+            hits, misses, expired = (counts.get(event, 0) for event in ("hits", "misses", "expired"))
+            lookups = hits + misses + expired
+            rate = f" ({hits / lookups:.0%} fresh)" if lookups else ""
+            lines.append(
+                f"{kind} {hits} hits, {misses} misses, {expired} expired{rate}; "
+                f"{counts.get('stale', 0)} served stale, {counts.get('touches', 0)} extended, "
+                f"{counts.get('writes', 0)} written; "
+                f"{_human(counts.get('bytes_read', 0))} read, {_human(counts.get('bytes_written', 0))} written"
+            )
+        return lines
+
+    def _open_reader(self) -> sqlite3.Connection:
+        """Open another connection to the database, for reads only.
+
+        query_only makes a stray write through it fail instead of committing
+        behind the writer's back. Readers move between worker threads with the
+        pool, hence check_same_thread=False; only one thread uses each at once.
+        """
+        conn = sqlite3.connect(self._path, timeout=self._busy_timeout, check_same_thread=False)
+        try:
+            conn.execute("PRAGMA query_only=ON")
+        except sqlite3.Error:
+            conn.close()
+            raise
+        return conn
+
+    def _checkout(self) -> sqlite3.Connection | None:
+        """Count a read in flight and take an idle reader, if any. The caller holds _lock.
+
+        Must be followed by _on_reader, which gives the count back.
+        """
+        self._reading += 1
+        return self._readers.pop() if self._readers else None
+
+    def _on_reader(self, conn: sqlite3.Connection | None, query: Callable[[sqlite3.Connection], object]):
+        """Run query(reader) outside _lock, then return the reader to the pool.
+
+        conn is None when the pool had nothing idle, and a reader is opened
+        here. The pool therefore grows to the most reads ever in flight at
+        once, which the worker pools bound.
+        """
+        try:
+            if conn is None:
+                conn = self._open_reader()
+            return query(conn)
+        finally:
+            with self._lock:
+                if conn is not None:
+                    self._readers.append(conn)
+                self._reading -= 1
+                if not self._reading:
+                    self._drained.notify_all()
+
+    def _held(self, key: str, stale: bool):
+        """A row for key that needs no trip to a reader, or None. The caller holds _lock.
+
+        Prefetched rows are handed out here, once. So are changes waiting for
+        their group commit, which no reader can see yet; a pending delete
+        answers _GONE. A held row that has expired stays held for a plain
+        read: the read_stale that follows an expired read in every service is
+        what consumes it.
+        """
+        row = self._staged.get(key)
+        if row is not None:
+            if stale or row[2] >= time.time():
+                del self._staged[key]
+            return row
+        if key in self._unflushed:
+            return self._unflushed[key] or _GONE
+        return None
+
     def read(self, key: str, required: bool = False):
         """Return the cached value if present and not expired, else None.
 
+        A key stored as ABSENT answers ABSENT until it expires, and None after.
+
         A database failure answers None, the same as a miss, unless the caller
         passes required=True — see CacheUnavailableError.
         """
+        return self._read(key, required)[0]
+
+    def _read(self, key: str, required: bool = False) -> tuple[object, int]:
+        """read(), with the projection version the value was stored under."""
         with self._lock:
             self._require_open()
             if self._degraded:
-                return self._unusable(required, "read")
-            try:
-                row = self._db.execute(
-                    "SELECT value, stored_at, ttl FROM cache WHERE key = ?",
-                    (key,),
-                ).fetchone()
-                if row is None:
-                    return None
-                # Unpacked and compared inside the guard: the columns are not
-                # STRICT, so a corrupt row can hold text where a time should be,
-                # and the subtraction below would then raise TypeError.
-                value, stored_at, ttl = row
-                expired = time.time() - stored_at > ttl
-            except sqlite3.DatabaseError as exc:
-                self._degrade("reading", exc)
-                return self._unusable(required, "read")
-            except (TypeError, ValueError) as exc:
-                self._degrade("reading", exc)
-                return self._unusable(required, "read")
+                return self._unusable(required, "read"), 0
+            generation = self._generation
+            entry = self._recall(key)
+            if entry is not None:
+                fresh = entry[1] >= time.time()
+                self._count(key, "hits" if fresh else "expired")
+                if fresh:
+                    self._used(key)
+                    return entry[0], entry[3]
+                row, from_disk, conn = _GONE, False, None
+            else:
+                row = self._held(key, stale=False)
+                from_disk = row is None
+                conn = self._checkout() if from_disk else None
+        if entry is not None:
+            return self._from_shared(key, generation, stale=False, required=required)
+        try:
+            if row is None:
+                row = self._on_reader(conn, partial(self._select_one, key))
+            # Unpacked and compared inside the guard: the columns are not
+            # STRICT, so a corrupt row can hold text where a time should be,
+            # and the comparison below would then raise TypeError.
+            expired = True
+            if row:
+                _, _, expires_at, _ = row
+                expired = expires_at < time.time()
+        except (sqlite3.DatabaseError, TypeError, ValueError) as exc:
+            self._degrade("reading", exc)
+            return self._unusable(required, "read"), 0
+        if not row:
+            self._count(key, "misses")
+        else:
+            self._count(key, "expired" if expired else "hits", read=_stored_size(row[0]) if from_disk else 0)
         if expired:
-            return None
-        return self._decode(value, required)
+            return self._from_shared(key, generation, stale=False, required=required)
+        self._used(key)
+        return self._load(key, row, generation, required), row[3]
 
     def read_stale(self, key: str, required: bool = False):
         """Return the cached value regardless of TTL, or None if absent.
@@ -310,20 +1143,386 @@ class Cache:
         required=True turns a database failure into CacheUnavailableError
         rather than an answer indistinguishable from "no such key".
         """
+        return self._read_stale(key, required)[0]
+
+    def _read_stale(self, key: str, required: bool = False) -> tuple[object, int]:
+        """read_stale(), with the projection version the value was stored under."""
         with self._lock:
             self._require_open()
             if self._degraded:
-                return self._unusable(required, "read")
-            try:
-                row = self._db.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
-            except sqlite3.DatabaseError as exc:
-                self._degrade("reading", exc)
-                return self._unusable(required, "read")
-        if row is None:
+                return self._unusable(required, "read"), 0
+            entry = self._recall(key)
+            if entry is not None:
+                self._count(key, "stale")
+                self._used(key)
+                return entry[0], entry[3]
+            generation = self._generation
+            row = self._held(key, stale=True)
+            from_disk = row is None
+            conn = self._checkout() if from_disk else None
+        try:
+            if row is None:
+                row = self._on_reader(conn, partial(self._select_one, key))
+        except sqlite3.DatabaseError as exc:
+            self._degrade("reading", exc)
+            return self._unusable(required, "read"), 0
+        if not row:
+            return self._from_shared(key, generation, stale=True, required=required)
+        self._count(key, "stale", read=_stored_size(row[0]) if from_disk else 0)
+        self._used(key)
+        return self._load(key, row, generation, required), row[3]
+
+    def _from_shared(self, key: str, generation: int, stale: bool, required: bool) -> tuple[object, int]:
+        """_read() or _read_stale() answered by the shared tier, for a key the file could not answer.
+
+        (None, 0) when there is no shared tier or it has nothing either. A
+        row it has is written to the file as it came, keeping its own age, so
+        the next read of it stays local. Not when anything changed since the
+        read began: that could be a newer write of this very key, which the
+        shared copy must not overwrite. The answer stands either way.
+
+        The row is decoded before it goes anywhere near the file. One that
+        will not decode, from a newer version's codec or a corrupt server,
+        is a miss: nothing is wrong with the file, so it must not degrade.
+        """
+        if self._shared is None:
+            return None, 0
+        found = self._share("reading", "read_stale" if stale else "read", key)
+        if found is None:
+            return None, 0
+        try:
+            text = found.value if found.codec == _ABSENT else self._inflate(found.value, found.codec)
+            value = ABSENT if found.codec == _ABSENT else json.loads(text)
+        except (TypeError, ValueError, zlib.error) as exc:
+            if not self._shared_unreadable:
+                self._shared_unreadable = True
+                print(
+                    f"! shared cache for '{self.name}' holds rows this version cannot read, "
+                    f"treating them as misses: {self._brief(exc)}",
+                    flush=True,
+                )
+            return None, 0
+        row = (found.value, found.codec, found.expires_at, found.projection)
+        with self._lock:
+            if not (self._closing or self._closed or self._degraded) and self._generation == generation:
+                self._staged.pop(key, None)
+                # The expired value memory may still hold goes, and the
+                # generation this moves to is the one the value is kept under.
+                self._forget(key)
+                generation = self._generation
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO cache (key, value, codec, stored_at, ttl, accessed_at, projection) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (key, found.value, found.codec, found.stored_at, found.ttl, time.time(), found.projection),
+                    )
+                    self._unflushed[key] = row
+                    self._changed()
+                    self._count(key, written=_stored_size(found.value))
+                except sqlite3.DatabaseError as exc:
+                    self._degrade("writing", exc)
+        self._count(key, "shared")
+        self._used(key)
+        self._remember(key, value, found.expires_at, text, generation, found.projection)
+        return value, found.projection
+
+    def _share(self, operation: str, method: str, *args):
+        """Call method on the shared tier and return what it answers, or None without one.
+
+        The shared tier is a network away, so it is called outside _lock.
+        Failing is no more than a miss, the same as it is for the file: the
+        first failure says so once and the run goes on without the tier,
+        rather than waiting out a timeout on every read of a server that is
+        not coming back.
+        """
+        shared = self._shared
+        if shared is None:
+            return None
+        try:
+            return getattr(shared, method)(*args)
+        except OSError as exc:
+            with self._lock:
+                if self._shared is not shared:
+                    return None
+                self._shared = None
+            with contextlib.suppress(OSError):
+                shared.close()
+            print(
+                f"! shared cache for '{self.name}' is unreachable, continuing without it ({operation}): "
+                f"{self._brief(exc)}",
+                flush=True,
+            )
             return None
-        return self._decode(row[0], required)
 
-    def write(self, key: str, obj, ttl: float | None = None, required: bool = False):
+    @staticmethod
+    def _select_one(key: str, conn: sqlite3.Connection):
+        """Fetch (value, codec, expires_at, projection) for one key, or None."""
+        return conn.execute("SELECT value, codec, expires_at, projection FROM cache WHERE key = ?", (key,)).fetchone()
+
+    @staticmethod
+    def _select(keys: list[str], conn: sqlite3.Connection) -> list:
+        """Fetch (key, value, codec, expires_at, projection) for every present key."""
+        rows = []
+        for start in range(0, len(keys), _IN_CHUNK):
+            chunk = keys[start : start + _IN_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            rows += conn.execute(
+                # Only the placeholder count is formatted in; every key is bound.
+                f"SELECT key, value, codec, expires_at, projection FROM cache WHERE key IN ({placeholders})",  # noqa: S608
+                chunk,
+            ).fetchall()
+        return rows
+
+    def _select_checked(self, select: Callable[[], list], required: bool) -> list | None:
+        """The rows select() returns, with the timestamps validated. None means the cache just degraded.
+
+        The same guard read() keeps around its expiry check: the columns are
+        not STRICT, so a corrupt row can hold text where a time should be.
+        """
+        try:
+            return [
+                (key, value, codec, float(expires_at), projection)
+                for key, value, codec, expires_at, projection in select()
+            ]
+        except sqlite3.DatabaseError as exc:
+            self._degrade("reading", exc)
+        except (TypeError, ValueError) as exc:
+            self._degrade("reading", exc)
+        self._unusable(required, "read")
+        return None
+
+    def _decode_rows(self, rows: list, required: bool) -> dict | None:
+        """Decode _select rows to {key: (value, JSON text)}.
+
+        None means a value was corrupt and the cache degraded. One corrupt row
+        degrades the cache, and a degraded cache answers as a miss, so no
+        partial answer leaks.
+        """
+        decoded = {}
+        for key, value, codec, *_ in rows:
+            if codec == _ABSENT:
+                decoded[key] = (ABSENT, value)
+                continue
+            text = self._expand(value, codec, required)
+            if text is None:
+                return None
+            try:
+                decoded[key] = (json.loads(text), text)
+            except (TypeError, ValueError) as exc:
+                # See _decode.
+                self._degrade("decoding", exc)
+                self._unusable(required, "decoded")
+                return None
+        return decoded
+
+    def read_many(self, keys, required: bool = False) -> dict:
+        """Return {key: value} for every key present and not expired, in one statement.
+
+        A key that is missing or expired is left out of the answer, where read()
+        would have answered None for it, and one stored as ABSENT answers
+        ABSENT. A database failure answers {}, the same as all misses, unless
+        the caller passes required=True.
+        """
+        wanted = list(dict.fromkeys(keys))
+        if not wanted:
+            return {}
+        found = {}
+        with self._lock:
+            self._require_open()
+            if self._degraded:
+                self._unusable(required, "read")
+                return {}
+            now = time.time()
+            rest = []
+            held = []
+            aged = set()
+            for key in wanted:
+                entry = self._recall(key)
+                if entry is not None:
+                    if entry[1] >= now:
+                        found[key] = entry[0]
+                    else:
+                        aged.add(key)
+                elif key in self._unflushed:
+                    row = self._unflushed[key]
+                    if row:
+                        held.append((key, *row))
+                else:
+                    rest.append(key)
+            generation = self._generation
+            conn = self._checkout() if rest else None
+
+        def select() -> list:
+            return held + (self._on_reader(conn, partial(self._select, rest)) if rest else [])
+
+        rows = self._select_checked(select, required)
+        if rows is None:
+            return {}
+        fresh = [row for row in rows if row[3] >= now]
+        decoded = self._decode_rows(fresh, required)
+        if decoded is None:
+            return {}
+        for key, _, _, expires_at, projection in fresh:
+            value, text = decoded[key]
+            found[key] = value
+            self._remember(key, value, expires_at, text, generation, projection)
+        # select() put the held rows first; the rest crossed the connection.
+        from_disk = {key: value for key, value, *_ in rows[len(held) :]}
+        self._count_many(wanted, found, aged | {row[0] for row in rows}, from_disk)
+        self._used(*found)
+        return found
+
+    def _count_many(self, wanted: list[str], found: dict, present: set, from_disk: dict) -> None:
+        """Count read_many's answer key by key, as that many read() calls would have been."""
+        for key in wanted:
+            event = "hits" if key in found else "expired" if key in present else "misses"
+            self._count(key, event, read=_stored_size(from_disk.get(key)))
+
+    def prefetch(self, keys) -> dict:
+        """Load a set of rows in one statement, so the reads that follow skip sqlite.
+
+        Each row is held until read() or read_stale() hands it out, once, and
+        is then dropped: this saves the round trip for a key a caller is about
+        to ask for, and is not a second cache. Rows are held as stored, and
+        taken in the same critical section as the SELECT, so a write() landing
+        afterwards drops them rather than racing them.
+
+        Returns every key that was present with its value, expired or not. The
+        caller uses that to work out which keys to ask for next — an artist's
+        album list names the tracklists worth prefetching.
+
+        Only a hint: a failure degrades the cache exactly as a read would, and
+        answers {}.
+        """
+        wanted = list(dict.fromkeys(keys))
+        if not wanted:
+            return {}
+        found = {}
+        with self._lock:
+            self._require_open()
+            if self._degraded:
+                return {}
+            # Keys already in memory need no round trip, and no holding.
+            rest = []
+            for key in wanted:
+                entry = self._memory.get(key)
+                if entry is None:
+                    rest.append(key)
+                else:
+                    found[key] = entry[0]
+            # On the writer, under _lock, unlike every other read: holding a row
+            # is only safe if no write can land between the SELECT and the
+            # holding, and the writer also sees changes not yet committed.
+            rows = self._select_checked(partial(self._select, rest, self._db), False) if rest else []
+            if rows is None:
+                return {}
+            for key, value, codec, expires_at, projection in rows:
+                self._staged[key] = (value, codec, expires_at, projection)
+                self._count(key, read=_stored_size(value))
+            while len(self._staged) > _STAGE_LIMIT:
+                del self._staged[next(iter(self._staged))]
+        decoded = self._decode_rows(rows, False) or {}
+        return found | {key: value for key, (value, _) in decoded.items()}
+
+    def _retrying[T](self, statement: Callable[[], T]) -> T:
+        """statement(), tried again while another process holds the lock. The caller holds _lock.
+
+        Only _LOCK_RETRIES tries in all, each after a pause: every thread of
+        this process is waiting on _lock meanwhile, and a lock held for
+        longer than that is better answered by skipping one change.
+        """
+        attempt = 0
+        while True:
+            try:
+                return statement()
+            except sqlite3.OperationalError as exc:
+                attempt += 1
+                if attempt >= _LOCK_RETRIES or not _contended(exc):
+                    raise
+                time.sleep(_LOCK_BACKOFF * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+
+    def _changed(self, required: bool = False) -> None:
+        """Commit a change now, or count it toward the group commit it joins.
+
+        The caller holds _lock and has already executed the statement. A
+        required change commits immediately, and takes every pending one with
+        it: committing early is always safe, committing late is what the
+        caller asked not to risk.
+        """
+        if self._pending == 0:
+            self._pending_since = time.monotonic()
+        self._pending += 1
+        if not required and (self._batch_depth or self._write_behind):
+            limit = self._write_behind or _GROUP_LIMIT
+            if self._pending < limit and time.monotonic() - self._pending_since < _GROUP_SECONDS:
+                if self._flusher is None:
+                    self._arm_flusher(_GROUP_SECONDS)
+                return
+        self._retrying(self._db.commit)
+        self._pending = 0
+        self._unflushed.clear()
+
+    def _arm_flusher(self, delay: float) -> None:
+        """Start the timer that commits the pending group in delay seconds. The caller holds _lock."""
+        self._flusher = threading.Timer(delay, self._flush_due)
+        self._flusher.name = f"cache-{self.name}-flush"
+        self._flusher.daemon = True
+        self._flusher.start()
+
+    def _flush_due(self) -> None:
+        """Commit the pending group if it has waited _GROUP_SECONDS.
+
+        The age bound is otherwise only checked when the next change arrives,
+        and a quiet stretch of the run, like a playlist sync, would hold the
+        write lock, and the changes a crash would lose, until save().
+        """
+        with self._lock:
+            self._flusher = None
+            if self._closed or self._closing or not self._pending:
+                return
+            waited = time.monotonic() - self._pending_since
+            if waited < _GROUP_SECONDS:
+                # A commit in between started a younger group.
+                self._arm_flusher(_GROUP_SECONDS - waited)
+                return
+            self._flush()
+
+    def _flush(self) -> None:
+        """Commit whatever is pending. The caller holds _lock."""
+        if not self._pending or self._degraded:
+            return
+        try:
+            self._retrying(self._db.commit)
+        except sqlite3.DatabaseError as exc:
+            self._degrade("committing", exc)
+            return
+        self._pending = 0
+        self._unflushed.clear()
+
+    @contextlib.contextmanager
+    def batch(self):
+        """Commit the changes made inside this block together, instead of one at a time.
+
+        The cache is one connection shared by every thread, so the block
+        groups every holder's changes, not only the ones made on this thread,
+        and nested or overlapping blocks commit when the last one exits. The
+        group bounds still apply inside a block, so a long one does not hold
+        the whole run's writes uncommitted. required=True writes still commit
+        immediately.
+        """
+        with self._lock:
+            self._require_open()
+            self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._batch_depth -= 1
+                # Closed inside the block: close() already committed.
+                if not self._batch_depth and not self._closed:
+                    self._flush()
+
+    def write(self, key: str, obj, ttl: float | None = None, required: bool = False, projection: int = 0):
         """Store a value and return it.
 
         The value is returned whether or not the store succeeded, because
@@ -331,26 +1530,363 @@ class Cache:
         must not turn a good fetch into None. That makes the return value
         useless as a success signal, which is why a caller that needs the store
         to have happened passes required=True and gets an exception instead.
+
+        Without a ttl, the entry lasts what ttl_policy gives its key, or
+        cutoff where it names none; obj may be ABSENT, which lasts absent_ttl.
+        Either default is spread by ttl_jitter, and a ttl given is kept exact.
+        projection is the version of the Projection obj was cut down by, 0
+        for a value stored whole.
         """
-        effective_ttl = ttl if ttl is not None else self.cutoff
+        effective_ttl = (
+            ttl if ttl is not None else self._jittered(self.absent_ttl if obj is ABSENT else self._lifetime(key))
+        )
+        # Encoded before taking the lock: compressing a large payload is the
+        # slowest step of a write, and nothing it touches is shared.
+        value, codec = self._encode(obj)
         with self._lock:
             self._require_open()
             if self._degraded:
                 self._unusable(required, "written")
                 return obj
+            self._staged.pop(key, None)
+            self._forget(key)
+            now = time.time()
             try:
-                self._db.execute(
-                    "INSERT OR REPLACE INTO cache (key, value, stored_at, ttl) VALUES (?, ?, ?, ?)",
-                    (key, json.dumps(obj), time.time(), effective_ttl),
+                self._retrying(
+                    partial(
+                        self._db.execute,
+                        "INSERT OR REPLACE INTO cache (key, value, codec, stored_at, ttl, accessed_at, projection) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (key, value, codec, now, effective_ttl, now, projection),
+                    )
                 )
-                self._db.commit()
+                self._unflushed[key] = (value, codec, now + effective_ttl, projection)
+                self._changed(required)
+                self._count(key, "writes", written=_stored_size(value))
             except sqlite3.DatabaseError as exc:
                 self._degrade("writing", exc)
                 self._unusable(required, "written")
+                return obj
+        self._share("writing", "write", key, StoredRow(value, codec, now, effective_ttl, projection))
         return obj
 
+    async def aread(self, key: str, required: bool = False):
+        """read(), for a caller on an event loop: run on the cache's I/O thread, see _AsyncIO."""
+        return await self._io.run(partial(self.read, key, required))
+
+    async def aread_many(self, keys, required: bool = False) -> dict:
+        """read_many(), for a caller on an event loop: run on the cache's I/O thread, see _AsyncIO."""
+        return await self._io.run(partial(self.read_many, list(keys), required))
+
+    async def awrite(self, key: str, obj, ttl: float | None = None, required: bool = False, projection: int = 0):
+        """write(), for a caller on an event loop: run on the cache's I/O thread, see _AsyncIO.
+
+        Writes queued together commit together, as inside batch().
+        """
+        return await self._io.run(partial(self.write, key, obj, ttl, required, projection))
+
+    def _lifetime(self, key: str) -> float:
+        """The TTL ttl_policy gives key, or cutoff when no pattern matches it."""
+        for prefix, suffix, ttl in self._ttl_rules:
+            if key.startswith(prefix) and key.endswith(suffix) and len(key) >= len(prefix) + len(suffix):
+                return ttl
+        return self.cutoff
+
+    def _jittered(self, ttl: float) -> float:
+        """ttl moved by up to ttl_jitter of itself, either way."""
+        return ttl * (1 + self._ttl_jitter * random.uniform(-1, 1))
+
+    def get_or_fetch(
+        self,
+        key: str,
+        fetcher: Callable[[], object],
+        ttl: FetchTTL = None,
+        revalidate: bool = False,
+        projection: Projection | None = None,
+    ):
+        """The fresh cached value for key, or else fetcher()'s, written with ttl.
+
+        Single-flight: one fetch per key runs at a time. A caller that misses
+        while another is already fetching the same key waits for that fetch
+        and gets its answer, value or exception alike, so the album pool
+        resolving one featured artist from several albums calls the API once.
+
+        A fetcher answering None has nothing to cache, and None is returned
+        as it is. Only None is a miss: a cached [] or {} is an answer.
+
+        A fetcher answering ABSENT has been told the key does not exist. That
+        is cached for absent_ttl, whatever ttl says, and until it expires the
+        key answers None here without calling fetcher at all.
+
+        A fetcher answering UNCHANGED has checked that the expired entry is
+        still current. It is touched rather than written, and answered.
+
+        ttl may be a function of the value, given it as it is written, for
+        an entry whose lifetime depends on what it holds. What it answers is
+        a default like the cache's own, so ttl_jitter spreads it.
+
+        revalidate=True is stale-while-revalidate, for data that rarely
+        changes: an expired entry is answered as it is and fetched again in
+        the background, off the caller's path, while the refresh budget
+        lasts. See _revalidate.
+
+        projection, when given, cuts what fetcher answers down before it is
+        written, and is applied to a cached value stored whole before it is
+        returned. See _current.
+        """
+        value, version = self._read(key)
+        if value is ABSENT:
+            return None
+        if value is not None:
+            value = self._current(key, value, version, projection)
+            if value is not None:
+                return value
+        if revalidate:
+            value = self._revalidate(key, fetcher, ttl, projection)
+            if value is not None:
+                return value
+        with self._lock:
+            flight = self._inflight.get(key)
+            leading = flight is None
+            if leading:
+                flight = self._inflight[key] = Future()
+        if not leading:
+            self._count(key, "coalesced")
+            return flight.result()
+        return self._lead(key, fetcher, ttl, projection, flight)
+
+    def _lead(
+        self,
+        key: str,
+        fetcher: Callable[[], object],
+        ttl: FetchTTL,
+        projection: Projection | None,
+        flight: Future,
+    ):
+        """Run the fetch the callers waiting on flight share, and write what it answers, projected.
+
+        With leases on, another process may be running the same fetch, and
+        its answer is taken instead; see _from_peer.
+        """
+        try:
+            value = self._from_peer(key, projection)
+            if value is None:
+                value = self._fetch(key, fetcher, ttl, projection)
+            elif value is ABSENT:
+                value = None
+        except BaseException as exc:
+            flight.set_exception(exc)
+            raise
+        else:
+            flight.set_result(value)
+        finally:
+            self._release(key)
+            with self._lock:
+                del self._inflight[key]
+        return value
+
+    def _fetch(self, key: str, fetcher: Callable[[], object], ttl: FetchTTL, projection: Projection | None):
+        """fetcher()'s answer for key, written with ttl and projected; None for nothing to answer."""
+        value = fetcher()
+        if value is ABSENT:
+            self.write(key, value)
+            return None
+        if value is UNCHANGED:
+            stale, version = self._read_stale(key)
+            if stale is None or stale is ABSENT:
+                return None
+            self.touch(key)
+            return self._current(key, stale, version, projection)
+        if value is None:
+            return None
+        version = 0
+        if projection is not None:
+            value, version = projection.project(value), projection.version
+        if ttl is not None and not isinstance(ttl, int | float):
+            ttl = self._jittered(ttl(value))
+        return self.write(key, value, ttl=ttl, projection=version)
+
+    def _from_peer(self, key: str, projection: Projection | None):
+        """What another process fetched for key while this one waited on its lease, or None to fetch it here.
+
+        None also once this process holds the lease, and always with leases
+        off. A waiting process flags the lease, so the holder commits as it
+        lets go and the value is there to read at once, whatever its group
+        commit was holding back. A holder that fails lets go with nothing
+        written, and the next process to take the lease fetches instead.
+        """
+        pause = _LEASE_POLL
+        while True:
+            held_until = self._claim(key)
+            if held_until is None:
+                return None
+            time.sleep(max(0.0, min(pause, held_until - time.time())))
+            pause = min(pause * 2, _LEASE_POLL_MAX)
+            value, version = self._read(key)
+            if value is ABSENT:
+                return ABSENT
+            if value is not None:
+                value = self._current(key, value, version, projection)
+                if value is not None:
+                    return value
+
+    def _claim(self, key: str) -> float | None:
+        """Take the lease on key, or flag it as waited on. None when taken; else when the holder's runs out.
+
+        A lease past its time is taken over: its holder died, or is taking
+        far longer than a fetch should.
+        """
+        with self._lease_lock:
+            if self._leases is None:
+                return None
+            now = time.time()
+            try:
+                taken = self._leases.execute(
+                    "INSERT INTO leases (key, owner, expires_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT (key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at, "
+                    "waiting = 0 WHERE leases.expires_at < ? OR leases.owner = excluded.owner RETURNING 1",
+                    (key, self._owner, now + self._lease_seconds, now),
+                ).fetchone()
+                if taken:
+                    return None
+                held = self._leases.execute(
+                    "UPDATE leases SET waiting = 1 WHERE key = ? RETURNING expires_at", (key,)
+                ).fetchone()
+            except sqlite3.Error as exc:
+                self._drop_leases("leasing", exc)
+                return None
+        # Let go between the two statements: try again straight away.
+        return held[0] if held else now
+
+    def _release(self, key: str) -> None:
+        """Let go of the lease on key, committing first if another process is waiting for the value."""
+        with self._lease_lock:
+            if self._leases is None:
+                return
+            try:
+                waited = self._leases.execute(
+                    "DELETE FROM leases WHERE key = ? AND owner = ? RETURNING waiting", (key, self._owner)
+                ).fetchone()
+            except sqlite3.Error as exc:
+                self._drop_leases("leasing", exc)
+                return
+        if waited and waited[0]:
+            with self._lock:
+                if not (self._closed or self._closing):
+                    self._flush()
+
+    def _drop_leases(self, operation: str, exc: Exception) -> None:
+        """Carry on without leases, and say so once. The caller holds _lease_lock, or is still opening.
+
+        Leases only save fetches, so nothing else is lost.
+        """
+        if self._leases is not None:
+            with contextlib.suppress(sqlite3.Error):
+                self._leases.close()
+            self._leases = None
+        if "leases" in self._reported:
+            return
+        self._reported.add("leases")
+        print(
+            f"! cache '{self.name}' cannot coordinate with other processes, continuing without it "
+            f"({operation}): {self._brief(exc)}",
+            flush=True,
+        )
+
+    def _current(self, key: str, value, version: int, projection: Projection | None):
+        """A cached value as projection keeps it, or None when it has to be fetched again.
+
+        A value stored whole, from before its key was projected, is projected
+        now and written back in place. One cut down by another version may
+        lack a field this one keeps, and nothing short of a fetch puts it back.
+        """
+        if projection is None or version == projection.version:
+            return value
+        if version:
+            return None
+        value = projection.project(value)
+        self._reproject(key, value, projection.version)
+        return value
+
+    def _reproject(self, key: str, obj, version: int) -> None:
+        """Replace a row stored whole with its projection, keeping its stored_at and ttl.
+
+        In place rather than through write(), which would make an entry fresh
+        again just because it was read. Only a row still stored whole is
+        replaced, so a write landing in between wins.
+        """
+        value, codec = self._encode(obj)
+        with self._lock:
+            self._require_open()
+            if self._degraded:
+                return
+            try:
+                replaced = self._db.execute(
+                    "UPDATE cache SET value = ?, codec = ?, projection = ? WHERE key = ? AND projection = 0",
+                    (value, codec, version, key),
+                ).rowcount
+                if not replaced:
+                    return
+                self._staged.pop(key, None)
+                self._forget(key)
+                self._unflushed[key] = self._select_one(key, self._db)
+                self._changed()
+                self._count(key, "reprojected", written=_stored_size(value))
+            except sqlite3.DatabaseError as exc:
+                self._degrade("writing", exc)
+
+    def _revalidate(self, key: str, fetcher: Callable[[], object], ttl: FetchTTL, projection: Projection | None):
+        """The expired value for key, with a background refresh started for it; None to fetch in line.
+
+        None when there is nothing stale to answer with, or the budget is
+        spent. An expired ABSENT is nothing to answer with: the short TTL is
+        there so that the service is asked again. A key already being fetched
+        answers stale without starting a second fetch, whoever is running the
+        first.
+
+        One worker runs the refreshes, one at a time, so the background never
+        competes with the run's own pools for the API by more than a single
+        call. A refresh that fails leaves the stale entry for the next run;
+        the caller already has its answer, so nothing is raised to anyone but
+        a get_or_fetch that chose to wait on the same key.
+        """
+        stale, version = self._read_stale(key)
+        if stale is None or stale is ABSENT:
+            return None
+        stale = self._current(key, stale, version, projection)
+        if stale is None:
+            return None
+        with self._lock:
+            if key not in self._inflight:
+                if self._refresh_budget <= 0 or self._stop.is_set():
+                    return None
+                self._refresh_budget -= 1
+                flight = self._inflight[key] = Future()
+                if self._refresher is None:
+                    self._refresher = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"cache-{self.name}-refresh")
+                self._refresher.submit(self._refresh, key, fetcher, ttl, projection, flight)
+        self._count(key, "revalidated")
+        return stale
+
+    def _refresh(
+        self,
+        key: str,
+        fetcher: Callable[[], object],
+        ttl: FetchTTL,
+        projection: Projection | None,
+        flight: Future,
+    ) -> None:
+        """A background refresh. One still queued when close() begins is dropped."""
+        if self._stop.is_set():
+            flight.set_exception(CacheClosedError(f"cache '{self.name}' is closed"))
+            with self._lock:
+                del self._inflight[key]
+            return
+        with contextlib.suppress(Exception):
+            self._lead(key, fetcher, ttl, projection, flight)
+
     def touch(self, key: str) -> bool:
-        """Reset the timestamp of a cache entry to now.
+        """Reset the timestamp of a cache entry to now, which also counts as a use.
 
         False means the entry was not there, or the cache is unusable. No
         caller distinguishes the two: a failed touch just lets the entry
@@ -360,15 +1896,30 @@ class Cache:
             self._require_open()
             if self._degraded:
                 return False
+            self._staged.pop(key, None)
+            # Forgotten rather than renewed: memory holds only the expiry, and
+            # the TTL it was computed from is in the row.
+            self._forget(key)
             try:
-                cursor = self._db.execute(
-                    "UPDATE cache SET stored_at = ? WHERE key = ?",
-                    (time.time(), key),
+                now = time.time()
+                cursor = self._retrying(
+                    partial(
+                        self._db.execute,
+                        "UPDATE cache SET stored_at = ?, accessed_at = ? WHERE key = ?",
+                        (now, now, key),
+                    )
                 )
-                self._db.commit()
+                # Grouped, the new age is invisible to the readers until the
+                # commit, so the whole row is held where reads will find it.
+                if cursor.rowcount > 0 and (self._batch_depth or self._write_behind):
+                    self._unflushed[key] = self._select_one(key, self._db)
+                self._changed()
             except sqlite3.DatabaseError as exc:
                 self._degrade("updating", exc)
                 return False
+        self._share("updating", "touch", key)
+        if cursor.rowcount > 0:
+            self._count(key, "touches")
         return cursor.rowcount > 0
 
     def delete(self, key: str) -> bool:
@@ -377,45 +1928,619 @@ class Cache:
             self._require_open()
             if self._degraded:
                 return False
+            self._staged.pop(key, None)
+            self._forget(key)
             try:
-                cursor = self._db.execute("DELETE FROM cache WHERE key = ?", (key,))
-                self._db.commit()
+                cursor = self._retrying(partial(self._db.execute, "DELETE FROM cache WHERE key = ?", (key,)))
+                self._unflushed[key] = None
+                self._changed()
             except sqlite3.DatabaseError as exc:
                 self._degrade("deleting", exc)
                 return False
+        # Passed on whether or not the file held it: another process may have
+        # put it on the shared tier.
+        self._share("deleting", "delete", key)
         return cursor.rowcount > 0
 
-    def _clean(self):
-        """Evict expired entries. Returns the number of rows removed.
+    def keys(self, prefix: str = "") -> list[str]:
+        """Every key starting with prefix, expired or not, in key order. [] when the cache is unusable.
+
+        A range on the primary key, like invalidate_prefix, and read on the
+        writer so that changes not yet committed are counted.
+        """
+        where, bounds = _prefix_range(prefix)
+        with self._lock:
+            self._require_open()
+            if self._degraded:
+                return []
+            try:
+                # Only one of two fixed conditions is formatted in.
+                return [key for (key,) in self._db.execute(f"SELECT key FROM cache WHERE {where}", bounds)]  # noqa: S608
+            except sqlite3.DatabaseError as exc:
+                self._degrade("reading", exc)
+                return []
+
+    def invalidate_prefix(self, prefix: str) -> int:
+        """Delete every entry whose key starts with prefix. Returns the number removed.
+
+        The key is the table's primary key, so this is a range on it rather
+        than a scan: "album:" drops every album and tracklist, and costs the
+        rows it removes whatever else the cache holds. "" drops everything.
+        Deleted a chunk at a time, like eviction, for the same reason.
+
+        Zero means nothing matched, or the cache is unusable.
+
+        The shared tier has no ranges, so only the keys this file holds are
+        deleted from it, one at a time.
+        """
+        doomed = self.keys(prefix) if self._shared is not None else []
+        removed = self._invalidate(prefix)
+        for key in doomed:
+            self._share("deleting", "delete", key)
+        return removed
+
+    def _invalidate(self, prefix: str) -> int:
+        """invalidate_prefix() on the file alone."""
+        where, bounds = _prefix_range(prefix)
+        removed = 0
+        while True:
+            with self._lock:
+                self._require_open()
+                if self._degraded:
+                    return removed
+                # See _clean: a read decoding one of these now must not remember it.
+                self._generation += 1
+                for key in [key for key in self._staged if key.startswith(prefix)]:
+                    del self._staged[key]
+                for key in [key for key in self._memory if key.startswith(prefix)]:
+                    self._forget(key)
+                try:
+                    cursor = self._db.execute(
+                        # Only one of two fixed conditions is formatted in.
+                        f"DELETE FROM cache WHERE key IN (SELECT key FROM cache WHERE {where} LIMIT ?)",  # noqa: S608
+                        (*bounds, _EVICT_CHUNK),
+                    )
+                    self._changed(required=True)
+                except sqlite3.DatabaseError as exc:
+                    self._degrade("invalidating", exc)
+                    return removed
+            removed += cursor.rowcount
+            if cursor.rowcount < _EVICT_CHUNK:
+                return removed
+
+    def expire_ahead(self, first: Iterable[str] = ()) -> int:
+        """Bring up to refresh_ahead entries due now, the nearest to expiring first. Returns how many.
+
+        Only entries past half their TTL are brought forward, and only those
+        written with about the cache's own lifetime: a rate-limit window or a
+        fingerprint is short on purpose, and a permanent entry never comes
+        near its half. Keys in first go ahead of the rest, nearest to expiring
+        first among them too, so an entry of an artist that matters most is
+        never the one left for a later run.
+
+        Each row keeps its value and only its ttl is cut back, so the run's
+        own reads find it expired and fetch it again, and a get_or_fetch that
+        revalidates still answers it while it does. Its new TTL is jittered
+        like any other, which is what keeps the load spread out from then on.
+        """
+        with self._lock:
+            self._require_open()
+            if self._degraded or self._refresh_ahead <= 0:
+                return 0
+            now = time.time()
+            # Rows already brought due in this call end at now, so the later
+            # selects pass them over without being told which they were.
+            due = "expires_at > ? AND stored_at + ttl / 2 <= ? AND ttl >= ?"
+            bounds = (now, now, self.cutoff / 2)
+            try:
+                first = list(dict.fromkeys(first))
+                candidates: list[tuple[float, str]] = []
+                for start in range(0, len(first), _IN_CHUNK):
+                    chunk = first[start : start + _IN_CHUNK]
+                    placeholders = ",".join("?" * len(chunk))
+                    candidates += [
+                        (expires_at, key)
+                        for key, expires_at in self._db.execute(
+                            # Only the placeholder count and a fixed condition are formatted in.
+                            f"SELECT key, expires_at FROM cache WHERE key IN ({placeholders}) AND {due}",  # noqa: S608
+                            (*chunk, *bounds),
+                        )
+                    ]
+                keys = [key for _, key in sorted(candidates)[: self._refresh_ahead]]
+                self._expire(keys, now)
+                rest = self._db.execute(
+                    # Only a fixed condition is formatted in.
+                    f"SELECT key FROM cache WHERE {due} ORDER BY expires_at LIMIT ?",  # noqa: S608
+                    (*bounds, self._refresh_ahead - len(keys)),
+                ).fetchall()
+                self._expire([key for (key,) in rest], now)
+                self._changed(required=True)
+            except sqlite3.DatabaseError as exc:
+                self._degrade("updating", exc)
+                return 0
+        keys += [key for (key,) in rest]
+        for key in keys:
+            self._count(key, "advanced")
+            # Otherwise the shared copy, as fresh as this one was, answers
+            # the read that is meant to find it due.
+            self._share("deleting", "delete", key)
+        return len(keys)
+
+    def _expire(self, keys: list[str], now: float) -> None:
+        """Cut each key's ttl back so that it expires at now. The caller holds _lock and commits."""
+        for start in range(0, len(keys), _IN_CHUNK):
+            chunk = keys[start : start + _IN_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            self._db.execute(
+                # Only the placeholder count is formatted in; every key is bound.
+                f"UPDATE cache SET ttl = ? - stored_at WHERE key IN ({placeholders})",  # noqa: S608
+                (now, *chunk),
+            )
+        for key in keys:
+            self._staged.pop(key, None)
+            self._forget(key)
+
+    def has_catalog(self, artist_id: str) -> bool:
+        """Whether a current catalog is kept for artist_id: see store_catalog.
+
+        Counted under "catalog:" in stats() like a read: a hit, an expired
+        catalog one of whose sources has changed since, or a miss.
+        """
+        with self._lock:
+            self._require_open()
+            if self._degraded:
+                return False
+            try:
+                sources, current = self._db.execute(_CATALOG_CURRENT, (time.time(), artist_id)).fetchone()
+            except sqlite3.DatabaseError as exc:
+                self._degrade("reading", exc)
+                return False
+        self._count("catalog:", "hits" if sources and current == sources else "expired" if sources else "misses")
+        return bool(sources) and current == sources
+
+    def catalog(
+        self,
+        artist_id: str,
+        longest_ms: int,
+        excluded_ids: Iterable[str] = (),
+        excluded_albums: Iterable[str] = (),
+        excluded_hashes: Iterable[str] = (),
+    ) -> list[CatalogTrack] | None:
+        """The candidates in artist_id's catalog, in the order it was stored; None without a current one.
+
+        A candidate is no longer than longest_ms and excluded by neither its
+        ID, its album's nor its dedupe_hash, and it is the first listed of
+        the tracks sharing its dedupe_hash. One statement on tracks_dedupe
+        answers that, so a warm run never decodes the tracklists at all.
+        """
+        with self._lock:
+            self._require_open()
+            if self._degraded:
+                return None
+            db = self._db
+            try:
+                sources, current = db.execute(_CATALOG_CURRENT, (time.time(), artist_id)).fetchone()
+                if not sources or current != sources:
+                    return None
+                rows = db.execute(
+                    _CATALOG_CANDIDATES,
+                    (
+                        artist_id,
+                        longest_ms,
+                        json.dumps(list(excluded_ids)),
+                        json.dumps(list(excluded_albums)),
+                        json.dumps(list(excluded_hashes)),
+                    ),
+                ).fetchall()
+            except sqlite3.DatabaseError as exc:
+                self._degrade("reading", exc)
+                return None
+        return [CatalogTrack(*row[:-1]) for row in rows]
+
+    def store_catalog(
+        self,
+        artist_id: str,
+        tracks: Iterable[CatalogTrack],
+        sources: Iterable[str],
+        since: float,
+        optional: Iterable[str] = (),
+    ) -> bool:
+        """Keep tracks as artist_id's catalog, current while the rows at sources are. True when kept.
+
+        sources are the keys it was built from. Each one must be cached,
+        unexpired and stored no later than since, when the build began: a
+        row written while it was being read, like a refresh landing or
+        another process's fetch, may not be what the tracks came from, and
+        no catalog is better than one that passes for current when it is
+        not. A missing source is most often a fetch that failed, and a
+        catalog kept without it would stop it being tried again. Only the
+        keys in optional, which the service does not always write, may be
+        missing; that is recorded, and the catalog lasts only while it
+        stays that way.
+
+        tracks is only iterated when the catalog is kept, so a generator
+        builds nothing on a run that keeps none. Whatever was kept for
+        artist_id before is replaced, or dropped when this one is not kept.
+        The catalog tables are outside max_bytes, which counts the cache
+        rows the catalogs are built from.
+        """
+        keys = sorted(set(sources))
+        may_be_missing = set(optional)
+        with self._lock:
+            self._require_open()
+            if self._degraded:
+                return False
+            db = self._db
+            try:
+                stamps = {}
+                for start in range(0, len(keys), _IN_CHUNK):
+                    chunk = keys[start : start + _IN_CHUNK]
+                    placeholders = ",".join("?" * len(chunk))
+                    stamps.update(
+                        (key, (stored_at, usable))
+                        for key, stored_at, usable in db.execute(
+                            # Only the placeholder count is formatted in; every key is bound.
+                            "SELECT key, stored_at, stored_at <= ? AND expires_at >= ? "  # noqa: S608
+                            f"FROM cache WHERE key IN ({placeholders})",
+                            (since, time.time(), *chunk),
+                        )
+                    )
+                kept = bool(keys) and all(stamps[key][1] if key in stamps else key in may_be_missing for key in keys)
+                # Nothing to keep and nothing to replace: a cold run's every
+                # artist lands here, and need not make a write of it.
+                if (
+                    not kept
+                    and not db.execute(
+                        "SELECT EXISTS (SELECT 1 FROM catalog_sources WHERE artist_id = ?)", (artist_id,)
+                    ).fetchone()[0]
+                ):
+                    return False
+                rows = [(artist_id, ordinal, *track) for ordinal, track in enumerate(tracks)] if kept else []
+
+                def replace() -> None:
+                    db.execute("DELETE FROM tracks WHERE artist_id = ?", (artist_id,))
+                    db.execute("DELETE FROM catalog_sources WHERE artist_id = ?", (artist_id,))
+                    if kept:
+                        db.executemany(
+                            "INSERT INTO tracks (artist_id, ordinal, id, name, duration_ms, isrc, dedupe_hash, "
+                            "album_id, album_name, album_released) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            rows,
+                        )
+                        db.executemany(
+                            "INSERT INTO catalog_sources (artist_id, key, stored_at) VALUES (?, ?, ?)",
+                            [(artist_id, key, stamps[key][0] if key in stamps else None) for key in keys],
+                        )
+
+                self._retrying(replace)
+                self._changed()
+            except sqlite3.DatabaseError as exc:
+                self._degrade("writing", exc)
+                return False
+        if kept:
+            self._count("catalog:", "writes")
+        return kept
+
+    def _drop_stale_catalogs(self) -> int:
+        """Delete every catalog that is no longer current. Returns how many."""
+        with self._lock:
+            self._require_open()
+            if self._degraded:
+                return 0
+            db = self._db
+            try:
+                stale = db.execute(_CATALOG_STALE, (time.time(),)).fetchall()
+                db.executemany("DELETE FROM tracks WHERE artist_id = ?", stale)
+                db.executemany("DELETE FROM catalog_sources WHERE artist_id = ?", stale)
+                self._changed(required=True)
+            except sqlite3.DatabaseError as exc:
+                self._degrade("evicting", exc)
+                return 0
+        return len(stale)
+
+    def _clean(self, limit: int | None = None) -> int:
+        """Evict expired entries, a chunk at a time. Returns the number of rows removed.
+
+        Each chunk is a range on the expires_at index, deleted and committed
+        under _lock, which is then released before the next: a large eviction
+        lets reads and writes through in between rather than holding them all
+        off until it is done. limit stops after that many rows, which keeps
+        each pass of the background eviction short.
 
         Zero means nothing had expired, or the cache is unusable and nothing
         could be removed.
         """
+        removed = 0
+        while limit is None or removed < limit:
+            chunk = _EVICT_CHUNK if limit is None else min(_EVICT_CHUNK, limit - removed)
+            with self._lock:
+                self._require_open()
+                if self._degraded:
+                    return removed
+                now = time.time()
+                # Counted even when nothing held here has expired: a read_stale
+                # decoding an expired row right now must not remember it.
+                self._generation += 1
+                for key in [key for key, row in self._staged.items() if row[2] < now]:
+                    del self._staged[key]
+                for key in [key for key, entry in self._memory.items() if entry[1] < now]:
+                    self._forget(key)
+                try:
+                    cursor = self._db.execute(
+                        "DELETE FROM cache WHERE key IN (SELECT key FROM cache WHERE expires_at < ? LIMIT ?)",
+                        (now, chunk),
+                    )
+                    self._changed(required=True)
+                except sqlite3.DatabaseError as exc:
+                    self._degrade("evicting", exc)
+                    return removed
+            removed += cursor.rowcount
+            if cursor.rowcount < chunk:
+                break
+        return removed
+
+    def _trim(self, vacuum: bool = False) -> int:
+        """Drop the least recently used rows until the rest fit in max_bytes. Returns the number removed.
+
+        The uses reads have noted are written first, so the order is this
+        run's and not the last one's. The rows to drop are picked from the
+        accessed_at index in one pass, then deleted a chunk at a time with
+        _lock released in between, as _clean does; a row written or used
+        since it was picked has a later accessed_at and is left alone, for the
+        next pass to pick again if the rows are still over. vacuum
+        lets _reclaim rewrite the file when it must, which save() allows and
+        the background pass does not.
+        """
+        if not self._max_bytes:
+            return 0
         with self._lock:
             self._require_open()
             if self._degraded:
                 return 0
             try:
-                cursor = self._db.execute(
-                    "DELETE FROM cache WHERE (? - stored_at) > ttl",
-                    (time.time(),),
-                )
-                self._db.commit()
+                self._record_accesses()
+                total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+                victims, newest = self._least_recent(total - self._max_bytes)
             except sqlite3.DatabaseError as exc:
-                self._degrade("evicting", exc)
+                self._degrade("trimming", exc)
                 return 0
-        return cursor.rowcount
+        removed = 0
+        for start in range(0, len(victims), _EVICT_CHUNK):
+            chunk = victims[start : start + _EVICT_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            with self._lock:
+                self._require_open()
+                if self._degraded:
+                    return removed
+                for key in chunk:
+                    self._staged.pop(key, None)
+                    self._forget(key)
+                try:
+                    cursor = self._db.execute(
+                        # Only the placeholder count is formatted in; every key is bound.
+                        f"DELETE FROM cache WHERE key IN ({placeholders}) AND accessed_at <= ?",  # noqa: S608
+                        [*chunk, newest],
+                    )
+                    self._changed(required=True)
+                except sqlite3.DatabaseError as exc:
+                    self._degrade("trimming", exc)
+                    return removed
+            removed += cursor.rowcount
+        if removed:
+            self._reclaim(vacuum)
+        return removed
+
+    def _least_recent(self, excess: int) -> tuple[list[str], float]:
+        """The keys to drop to free excess bytes, least recently used first, and when the last was used.
+
+        The caller holds _lock. Reads the accessed_at index only as far as it
+        has to, which is nothing at all when excess is not positive.
+        """
+        victims: list[str] = []
+        freed = 0
+        newest = 0.0
+        if excess <= 0:
+            return victims, newest
+        with contextlib.closing(
+            self._db.execute("SELECT key, size, accessed_at FROM cache ORDER BY accessed_at")
+        ) as rows:
+            for key, size, accessed_at in rows:
+                victims.append(key)
+                freed += size
+                newest = accessed_at
+                if freed >= excess:
+                    break
+        return victims, newest
+
+    def _reclaim(self, vacuum: bool) -> None:
+        """Give the pages a trim freed back to the filesystem.
+
+        incremental_vacuum releases free pages cheaply, but only in a file
+        that has auto_vacuum on, and only pages that are entirely free. A file
+        from before max_bytes was set, or one whose free space is scattered
+        between live rows, stays large until a full VACUUM rewrites it. That
+        runs when vacuum is set and the file is still more than _VACUUM_SLACK
+        over max_bytes, at most once a run. Neither can run inside a
+        transaction, so whatever is pending is committed first.
+        """
+        with self._lock:
+            self._require_open()
+            self._flush()
+            if self._degraded:
+                return
+            db = self._db
+            try:
+                if db.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+                    db.execute("PRAGMA incremental_vacuum").fetchall()
+                if vacuum and not self._vacuumed:
+                    pages = db.execute("PRAGMA page_count").fetchone()[0]
+                    page_size = db.execute("PRAGMA page_size").fetchone()[0]
+                    if pages * page_size > self._max_bytes * _VACUUM_SLACK:
+                        self._vacuumed = True
+                        db.execute("VACUUM")
+            except sqlite3.DatabaseError as exc:
+                self._degrade("vacuuming", exc)
+
+    def compact(self) -> None:
+        """Give the file's free pages back to the filesystem, after a delete large enough to matter.
+
+        incremental_vacuum where auto_vacuum is on, which max_bytes turns on
+        for a new file; a full VACUUM otherwise, which rewrites the whole
+        file and so is for the occasional large removal, not every run.
+        """
+        with self._lock:
+            self._require_open()
+            self._flush()
+            if self._degraded:
+                return
+            try:
+                if self._db.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+                    self._db.execute("PRAGMA incremental_vacuum").fetchall()
+                else:
+                    self._db.execute("VACUUM")
+            except sqlite3.DatabaseError as exc:
+                self._degrade("vacuuming", exc)
+
+    def _evict_in_background(self, interval: float) -> None:
+        """Evict a chunk, and trim to max_bytes, every interval seconds until close()."""
+        while not self._stop.wait(interval):
+            try:
+                self._clean(limit=_EVICT_CHUNK)
+                self._trim()
+            except CacheClosedError:
+                return
 
     def save(self):
-        """Run eviction. Data is already durable on disk."""
+        """Run eviction and the max_bytes trim, committing any grouped changes with them.
+
+        Catalogs whose sources have changed are dropped along with the rows.
+
+        The shared tier, if any, is asked to drop its expired rows too.
+        """
         self._clean()
+        self._drop_stale_catalogs()
+        self._trim(vacuum=True)
+        self._share("cleaning", "clean")
+
+    def _require_usable(self, operation: str) -> None:
+        """Raise unless the cache can be read and written. The caller holds _lock.
+
+        For the snapshot commands, which the user asked for by name: answering
+        a broken cache with an empty snapshot, or an import that quietly did
+        nothing, is the silent failure degrading exists to avoid for a run.
+        """
+        self._require_open()
+        if self._degraded:
+            raise CacheUnavailableError(
+                f"cache '{self.name}' is unusable and cannot be {operation}. {self._remedy(sqlite3.DatabaseError())}"
+            )
+
+    def export_snapshot(self, path: str | os.PathLike) -> int:
+        """Write a gzip-compressed copy of this cache to path. Returns the number of rows in it.
+
+        Taken with sqlite's backup API, so the copy is consistent however
+        busy the cache is, then vacuumed so it carries no free pages, and
+        switched out of WAL so it is one self-contained file. Grouped changes
+        are committed first, so the snapshot has everything written so far.
+
+        The uncompressed copy is made inside the cache directory, which is
+        private, and the snapshot is written beside path and renamed into
+        place at the cache file's own mode: a half-written snapshot never
+        appears, and a finished one is no more readable than the cache is.
+        """
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(self._path)) as scratch:
+            copy_path = os.path.join(scratch, "snapshot.db")
+            copy = sqlite3.connect(copy_path)
+            try:
+                with self._lock:
+                    self._require_usable("exported")
+                    self._flush()
+                    self._db.backup(copy)
+                copy.execute("PRAGMA journal_mode=DELETE")
+                copy.execute("VACUUM")
+                rows = copy.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            finally:
+                copy.close()
+            partial_path = f"{path}.partial"
+            fd = os.open(partial_path, os.O_CREAT | os.O_WRONLY | os.O_TRUNC | _O_NOFOLLOW, self._FILE_MODE)
+            with open(copy_path, "rb") as src, os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.replace(partial_path, path)
+        return rows
+
+    def import_snapshot(self, path: str | os.PathLike, merge: bool = False) -> int:
+        """Load a snapshot written by export_snapshot. Returns the number of rows taken from it.
+
+        Without merge, the snapshot replaces this cache's contents outright,
+        through the backup API again. With merge, each key is kept from
+        whichever side stored it last, by stored_at, so a warm runner is not
+        set back by an older snapshot. Either way the snapshot is first
+        brought up to this version's schema, and one from a newer version is
+        refused.
+
+        A file that is not a snapshot raises ValueError and leaves the cache
+        as it was.
+        """
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(self._path)) as scratch:
+            copy_path = os.path.join(scratch, "snapshot.db")
+            try:
+                with gzip.open(path, "rb") as src, open(copy_path, "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+                snapshot = sqlite3.connect(copy_path)
+            except (OSError, EOFError) as exc:
+                raise ValueError(f"{path} is not a cache snapshot: {self._brief(exc)}") from exc
+            try:
+                try:
+                    self._migrate(snapshot)
+                    rows = snapshot.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+                except sqlite3.DatabaseError as exc:
+                    raise ValueError(f"{path} is not a usable cache snapshot: {self._brief(exc)}") from exc
+                with self._lock:
+                    self._require_usable("imported")
+                    self._flush()
+                    # Everything held in front of the database is about to be
+                    # out of date.
+                    self._staged.clear()
+                    self._memory.clear()
+                    self._memory_size = 0
+                    self._generation += 1
+                    try:
+                        if merge:
+                            snapshot.close()
+                            rows = self._merge(copy_path)
+                        else:
+                            snapshot.backup(self._db)
+                    except sqlite3.DatabaseError as exc:
+                        # Raises now that the cache has degraded.
+                        self._degrade("importing", exc)
+                        self._require_usable("imported")
+            finally:
+                snapshot.close()
+        return rows
+
+    def _merge(self, snapshot_path: str) -> int:
+        """Upsert the snapshot's rows that were stored after ours. The caller holds _lock."""
+        db = self._db
+        db.execute("ATTACH DATABASE ? AS snapshot", (snapshot_path,))
+        try:
+            cursor = db.execute(
+                "INSERT INTO cache (key, value, codec, stored_at, ttl, accessed_at, projection) "
+                "SELECT key, value, codec, stored_at, ttl, accessed_at, projection FROM snapshot.cache WHERE true "
+                "ON CONFLICT (key) DO UPDATE SET value = excluded.value, codec = excluded.codec, "
+                "stored_at = excluded.stored_at, ttl = excluded.ttl, accessed_at = excluded.accessed_at, "
+                "projection = excluded.projection WHERE excluded.stored_at > cache.stored_at"
+            )
+            db.commit()
+        finally:
+            db.execute("DETACH DATABASE snapshot")
+        return cursor.rowcount
 
     def close(self):
         """Close the database connection. Idempotent.
 
         Takes the same lock as every other operation, so a close racing an
         in-flight read or write waits for it instead of pulling the connection
-        out from under it and raising ProgrammingError mid-statement.
+        out from under it and raising ProgrammingError mid-statement. The
+        async calls already queued run before it, the same way.
 
         Closing twice is a no-op: teardown paths can reach this more than once,
         and making the second call raise would turn correct cleanup into an
@@ -425,21 +2550,69 @@ class Cache:
         first meant a close that raised left the descriptor open and the cache
         marked closed, so nothing would ever try again — the one path where a
         second call is not a no-op but a retry.
+
+        Reads run on their readers outside the lock, so the lock alone does not
+        cover them; close() turns new operations away and waits for the reads
+        already running to finish before closing any connection. The
+        background eviction and refreshes are stopped first, outside the lock
+        they would be waiting on.
         """
+        self._io.stop()
+        self._stop.set()
+        with self._lock:
+            flusher, self._flusher = self._flusher, None
+        if flusher is not None:
+            flusher.cancel()
+        if self._evictor is not None and self._evictor is not threading.current_thread():
+            self._evictor.join()
+        if self._refresher is not None:
+            # Waits out the refresh already running, which may still write;
+            # the queued ones see _stop and drop themselves.
+            self._refresher.shutdown(wait=True)
         with self._lock:
             if self._closed:
                 return
+            self._closing = True
+            self._drained.wait_for(lambda: not self._reading)
+            self._staged.clear()
+            self._memory.clear()
+            self._memory_size = 0
             if self._conn is None:
                 # Construction failed before the connection existed.
+                self._release_shared()
                 self._closed = True
                 return
             try:
+                while self._readers:
+                    self._readers[-1].close()
+                    self._readers.pop()
+                # Closing a sqlite connection discards an open transaction,
+                # which is where grouped changes wait. The uses not yet
+                # recorded join them, so the next run trims in the right order.
+                if not self._degraded:
+                    self._record_accesses()
+                self._flush()
                 self._conn.close()
             except sqlite3.DatabaseError as exc:
+                self._closing = False
                 self._degrade("closing", exc)
                 return
+            self._unflushed.clear()
+            self._release_shared()
             self._closed = True
 
+    def _release_shared(self) -> None:
+        """Close the shared tier and the lease file, if any, and stop using them. The caller holds _lock."""
+        shared, self._shared = self._shared, None
+        if shared is not None:
+            with contextlib.suppress(OSError):
+                shared.close()
+        with self._lease_lock:
+            if self._leases is not None:
+                with contextlib.suppress(sqlite3.Error):
+                    self._leases.close()
+                self._leases = None
+
     def __enter__(self) -> Self:
         return self
 
@@ -462,3 +2635,69 @@ class Cache:
             pass
         finally:
             self.close()
+
+
+class _AsyncIO:
+    """The thread Cache's async methods run on, and the queue it takes them from.
+
+    Each call is the sync method itself, run here, so it answers exactly as
+    that would: a value, None, ABSENT, or CacheClosedError and
+    CacheUnavailableError raised into the awaiting coroutine. What has queued
+    up while the thread was busy runs as one batch(), so a burst of awrites
+    from the event loop commits once, and required ones still commit at once.
+
+    Started by the first call and stopped by Cache.close(), after what was
+    queued before it has run. A call after that starts it again, and gets
+    whatever the closed cache answers. A call cancelled before its turn is
+    skipped; one already running finishes, and its write lands.
+    """
+
+    def __init__(self, cache: Cache):
+        self._cache = cache
+        self._queue: SimpleQueue[tuple[Callable[[], Any], Future] | None] = SimpleQueue()
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    async def run(self, call: Callable[[], Any]) -> Any:
+        future: Future = Future()
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._serve, name=f"cache-{self._cache.name}-io", daemon=True)
+                self._thread.start()
+            self._queue.put((call, future))
+        return await asyncio.wrap_future(future)
+
+    def _serve(self) -> None:
+        while True:
+            calls = [self._queue.get()]
+            with contextlib.suppress(Empty):
+                while True:
+                    calls.append(self._queue.get_nowait())
+            waiting = [call for call in calls if call is not None]
+            try:
+                with self._cache.batch():
+                    while waiting:
+                        call, future = waiting.pop(0)
+                        if not future.set_running_or_notify_cancel():
+                            continue
+                        try:
+                            future.set_result(call())
+                        except Exception as exc:
+                            future.set_exception(exc)
+            except CacheClosedError as exc:
+                # batch() itself refused: the cache is closed, and so is
+                # every call it would have held.
+                for _, future in waiting:
+                    if future.set_running_or_notify_cancel():
+                        future.set_exception(exc)
+            if None in calls:
+                return
+
+    def stop(self) -> None:
+        """Run what is queued, then stop the thread. The next call starts another."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is not None:
+                self._queue.put(None)
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
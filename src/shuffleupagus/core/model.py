@@ -1,13 +1,20 @@
 import datetime
+import functools
+import itertools
 import random
+import statistics
 import string
+import sys
+import threading
 import time
 import unicodedata
-from collections.abc import Sequence
+from collections import OrderedDict
+from collections.abc import Callable, Sequence
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import Any, Self
+from typing import Any, ClassVar, Self, cast
 
-from .cache import CACHE_DEFAULT_CUTOFF, Cache, CacheClosedError
+from .backend import RespBackend
+from .cache import CACHE_ABSENT_CUTOFF, CACHE_DEFAULT_CUTOFF, Cache, CacheClosedError, CatalogTrack, key_class
 from .config import Config
 from .util import format_retry_message, logger, service_tag, spread_artist_playlists
 
@@ -17,6 +24,12 @@ MAX_TRACK_LENGTH_MS = 8 * 60 * 1000  # 8 minutes
 
 
 class ShufObject:
+    # Slotted down the whole hierarchy, service subclasses included: a run
+    # holds tens of thousands of tracks, and a __dict__ apiece is most of
+    # what each one weighs. A subclass adding attributes names them in
+    # __slots__ of its own, and one without declares it empty.
+    __slots__ = ("id", "name")
+
     id: str
     name: str
 
@@ -40,6 +53,8 @@ class ShufObject:
 
 
 class Artist(ShufObject):
+    __slots__ = ()
+
     def __str__(self) -> str:
         return f"Artist({self.id}): {self.name}"
 
@@ -48,10 +63,13 @@ class Artist(ShufObject):
 
 
 class Album(ShufObject):
-    release_date: datetime.date | None = None
+    __slots__ = ("release_date",)
+
+    release_date: datetime.date | None
 
     def __init__(self, id: str, name: str, release_date=None):
         super().__init__(id, name)
+        self.release_date = None
 
         if release_date is not None:
             if isinstance(release_date, str):
@@ -72,12 +90,41 @@ class Album(ShufObject):
         return f"album[id={self.id}, name={self.name}]"
 
 
+class _DedupeStrip(dict[int, int | None]):
+    """str.translate's table for a dedupe name: nonspacing marks and ASCII punctuation dropped, the rest kept.
+
+    Filled in per character on first sight, since the marks are scattered
+    over the whole of Unicode: a run only ever meets a few hundred distinct
+    characters, and each is looked up in unicodedata once.
+    """
+
+    def __missing__(self, codepoint: int) -> int | None:
+        kept = None if unicodedata.category(chr(codepoint)) == "Mn" else codepoint
+        self[codepoint] = kept
+        return kept
+
+
+_DEDUPE_STRIP = _DedupeStrip(str.maketrans("", "", string.punctuation))
+
+# Distinct titles whose cleaned form is remembered. Most titles come back
+# once per market, edition and compilation they appear on.
+_DEDUPE_NAMES = 65_536
+
+
+@functools.lru_cache(maxsize=_DEDUPE_NAMES)
+def _dedupe_name(name: str) -> str:
+    """name as dedupe_hash compares it: decomposed, casefolded, trimmed, marks and punctuation dropped."""
+    return unicodedata.normalize("NFKD", name).casefold().strip().translate(_DEDUPE_STRIP)
+
+
 class Track(ShufObject):
-    duration_ms = 0
-    isrc: str | None = None
-    album: Album | None = None
+    __slots__ = ("_dedupe_hash", "album", "artists", "duration_ms", "isrc")
+
+    duration_ms: int
+    isrc: str | None
+    album: Album | None
     artists: list[Artist]
-    dedupe_hash = None
+    _dedupe_hash: str | None
 
     def __init__(
         self,
@@ -93,14 +140,18 @@ class Track(ShufObject):
         self.isrc = isrc
         self.album = album
         self.artists = list(artists) if artists else []
+        self._dedupe_hash = None
 
-        # create a dedupe hash based on name and duration rounded to nearest second
-        cleaned_name = unicodedata.normalize("NFKD", name).casefold().strip()
-        cleaned_name = "".join(
-            c for c in cleaned_name if unicodedata.category(c) != "Mn" and c not in string.punctuation
-        )
-        rounded_ms = str(int(duration_ms - (duration_ms % 2000)))
-        self.dedupe_hash = f"{cleaned_name}:{rounded_ms}"
+    @property
+    def dedupe_hash(self) -> str:
+        """The cleaned name and the duration rounded down to 2 seconds, for telling copies of a track apart.
+
+        Worked out on first use: most tracks a run builds are filtered out on
+        their duration or album first, and never need it.
+        """
+        if self._dedupe_hash is None:
+            self._dedupe_hash = f"{_dedupe_name(self.name)}:{int(self.duration_ms - (self.duration_ms % 2000))}"
+        return self._dedupe_hash
 
     def __str__(self) -> str:
         return f"Track({self.id}): {self.name}"
@@ -115,13 +166,155 @@ class Track(ShufObject):
 _ARTIST_POOL_WORKERS = 4
 _ALBUM_POOL_WORKERS = 8
 
+# Prefetch rounds per artist. Each round can only name keys the previous one
+# revealed: a handle names a channel, which names an album list, which names
+# the tracklists. Three covers the deepest chain any service has.
+_PREFETCH_ROUNDS = 3
+
+# How an artist's album list is paced by its releases: checked this many
+# times per usual gap between them, going by this many recent gaps, and never
+# less often than every _RELEASE_TTL_MAX_DAYS.
+_RELEASE_CHECKS = 8
+_RELEASE_HISTORY = 5
+_RELEASE_TTL_MAX_DAYS = 90
+
+# Default for cache-busy-seconds. Two overlapping runs share a cache file. A
+# change is tried up to three times, each waiting this long, and every thread
+# of this run waits behind it, so the three waits together only just cover
+# the other run's group commit rather than stalling the run for a minute.
+# cache-lease-seconds has no default: leases cost two writes to the lease
+# file per miss, and only pay for them where runs overlap.
+_BUSY_SECONDS = 2
+
+# Artists and albums a service keeps one object apiece for, per run. Every
+# credit on every tracklist asks for its artist again, so a run of a few
+# hundred artists asks for a few thousand distinct ones many times over.
+_IDENTITY_ENTRIES = 10_000
+
+
+def _config_count(svc_config: dict, key: str) -> int:
+    """A whole-number service setting, 0 when absent. bool is refused, though it is an int."""
+    value = svc_config.get(key, 0)
+    if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+        raise ValueError(f"{key} must be a whole number, got {value!r:.60}")
+    return value
+
+
+def _config_ttl_policy(svc_config: dict) -> dict[str, float]:
+    """cache-ttl-policy as {key pattern: seconds}, from the days it is written in."""
+    policy = svc_config.get("cache-ttl-policy", {})
+    if not isinstance(policy, dict):
+        raise ValueError(  # noqa: TRY004 — a hand-edited setting, like _config_count's
+            f"cache-ttl-policy must map key patterns to days, got {policy!r:.60}"
+        )
+    seconds = {}
+    for pattern, days in policy.items():
+        if isinstance(days, bool) or not isinstance(days, int | float) or days <= 0:
+            raise ValueError(f"cache-ttl-policy days must be positive, got {days!r:.60} for {pattern!r}")
+        seconds[str(pattern)] = days * 24 * 60 * 60
+    return seconds
+
+
+def _candidates(
+    artist_tracks: Sequence[Track],
+    top_tracks: Sequence[Track],
+    excluded_album_ids: list[str],
+    excluded_track_ids: list[str],
+) -> list[Track]:
+    """What collect_tracks picks an artist's tracks from besides its top tracks, in the order given.
+
+    The same selection Cache.catalog makes in sqlite, for when there is no
+    catalog to ask: the excluded and the overlong left out, then the first
+    of each dedupe_hash kept, counting the top tracks as already seen.
+    """
+    top_track_ids = {t.id for t in top_tracks}
+    seen_hashes = {t.dedupe_hash for t in top_tracks}
+    artist_tracks = [
+        t
+        for t in artist_tracks
+        if (
+            t.id not in top_track_ids
+            and not t.is_excluded(excluded_track_ids)
+            and not t.longer_than(MAX_TRACK_LENGTH_MS)
+            and t.album is not None
+            and not t.album.is_excluded(excluded_album_ids)
+        )
+    ]
+
+    deduped: list[Track] = []
+    for track in artist_tracks:
+        h = getattr(track, "dedupe_hash", None)
+        if h and h in seen_hashes:
+            continue
+        if h:
+            seen_hashes.add(h)
+        deduped.append(track)
+    return deduped
+
+
+class _IdentityMap:
+    """The one object per ID a service hands out for each kind, least recently used first.
+
+    Past size entries the least recently used is forgotten, and the next ask
+    for it builds a new object. Safe to share between the worker threads.
+    """
+
+    def __init__(self, size: int):
+        self._size = size
+        self._objects: OrderedDict[tuple[type, str], ShufObject] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._objects)
+
+    def get[T: ShufObject](self, kind: type[T], id: str) -> T | None:
+        with self._lock:
+            obj = self._objects.get((kind, id))
+            if obj is not None:
+                self._objects.move_to_end((kind, id))
+            return cast("T | None", obj)
+
+    def add[T: ShufObject](self, kind: type[T], id: str, obj: T) -> T:
+        """Keep obj for id, or return the one another thread kept for it first.
+
+        Both ID strings are interned: the same IDs come back on every
+        tracklist, and one copy of each is enough.
+        """
+        obj.id = sys.intern(obj.id)
+        with self._lock:
+            kept = self._objects.setdefault((kind, sys.intern(id)), obj)
+            self._objects.move_to_end((kind, id))
+            if len(self._objects) > self._size:
+                self._objects.popitem(last=False)
+        return cast("T", kept)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._objects.clear()
+
 
 class Service:
     name: str
     cache: Cache
     cache_cutoff: float = CACHE_DEFAULT_CUTOFF
+    # Key pattern -> TTL in seconds for the keys whose data changes at a pace
+    # of its own, in place of cache_cutoff. See Cache for the patterns; the
+    # cache-ttl-policy setting adds to and overrides this, in days.
+    cache_ttl_policy: ClassVar[dict[str, float]] = {}
+    # What collect_tracks builds the tracks it picks from a cached catalog as.
+    track_type: ClassVar[type[Track]] = Track
+    album_type: ClassVar[type[Album]] = Album
+    # Classes of the keys _artist_cache_keys names that are not always
+    # written, so a catalog may be kept without them. Any other key that
+    # is missing is a fetch that failed, and keeps the catalog from being
+    # stored. See Cache.store_catalog.
+    catalog_optional: ClassVar[tuple[str, ...]] = ("fingerprint:",)
+    tag: str = ""
     _artist_pool: ThreadPoolExecutor | None = None
     _album_pool: ThreadPoolExecutor | None = None
+    # None for a service built without __init__, which then builds every
+    # object afresh. See _interned.
+    _identities: _IdentityMap | None = None
     _closed: bool = False
 
     @property
@@ -148,13 +341,56 @@ class Service:
             cutoff = ttl_days * 24 * 60 * 60
         else:
             cutoff = self.cache_cutoff
-        self.cache = Cache(self.name, cutoff=cutoff)
+        absent_hours = _config_count(svc_config, "cache-absent-hours")
+        jitter = _config_count(svc_config, "cache-ttl-jitter")
+        if jitter >= 100:
+            raise ValueError(f"cache-ttl-jitter must be below 100, got {jitter}")
+        shared_url = svc_config.get("cache-shared")
+        busy_seconds = (
+            _config_count(svc_config, "cache-busy-seconds") if "cache-busy-seconds" in svc_config else _BUSY_SECONDS
+        )
+        lease_seconds = _config_count(svc_config, "cache-lease-seconds")
+        self.cache = Cache(
+            self.name,
+            cutoff=cutoff,
+            write_behind=_config_count(svc_config, "cache-write-behind"),
+            memory_entries=_config_count(svc_config, "cache-memory-entries"),
+            memory_bytes=_config_count(svc_config, "cache-memory-mb") * 1024 * 1024,
+            evict_interval=_config_count(svc_config, "cache-evict-interval"),
+            max_bytes=_config_count(svc_config, "max-cache-mb") * 1024 * 1024,
+            refresh_budget=_config_count(svc_config, "cache-refresh-budget"),
+            absent_ttl=absent_hours * 60 * 60 if absent_hours else CACHE_ABSENT_CUTOFF,
+            ttl_jitter=jitter / 100,
+            refresh_ahead=_config_count(svc_config, "cache-refresh-ahead"),
+            ttl_policy=self.cache_ttl_policy | _config_ttl_policy(svc_config),
+            shared=RespBackend(str(shared_url), namespace=self.name) if shared_url else None,
+            busy_timeout=busy_seconds,
+            lease_seconds=lease_seconds,
+        )
         self.config = svc_config
         self.tag = service_tag(self.name)
+        self._identities = _IdentityMap(_IDENTITY_ENTRIES)
 
     def sanitize_id(self, id: str) -> str:
         return id
 
+    def _interned[T: ShufObject](self, kind: type[T], id: str, build: Callable[[], T | None]) -> T | None:
+        """The kind this service already built for id, else what build() returns, kept for next time.
+
+        For get_artist and get_album_by_id, so the artist on every credit and
+        the album on every top track is one object per run rather than one per
+        mention, read from the cache once. None from build() is passed on and
+        not kept, so an artist that could not be fetched is asked for again.
+        """
+        if self._identities is None:
+            return build()
+        obj = self._identities.get(kind, id)
+        if obj is None:
+            obj = build()
+            if obj is not None:
+                obj = self._identities.add(kind, id, obj)
+        return obj
+
     def preflight(self) -> None:
         """Pre-check run sequentially before threaded processing starts.
 
@@ -176,7 +412,7 @@ class Service:
         return self._closed
 
     def close(self) -> None:
-        """Shut down the worker pools, evict expired entries, release the connection.
+        """Shut down the worker pools, forget the interned objects, evict expired entries, release the connection.
 
         Pools come down first, and with wait=True: a worker still running would
         otherwise reach for a cache connection that is already closed. This also
@@ -185,11 +421,16 @@ class Service:
         Idempotent, like Cache.close(). _close_service in shuffleupagus.py can
         reach this twice on the error path, and the second call would otherwise
         hit cache.save() on an already-closed cache and raise.
+
+        Ends with the cache's summary for the run, one line per key class, so
+        the effect of a TTL or caching change shows up in the next run's log.
         """
         if self._closed:
             return
         self._closed = True
         self._shutdown_pools(wait=True)
+        if self._identities is not None:
+            self._identities.clear()
         # Same guarantee as Cache.__exit__: eviction failing must not leave the
         # connection open, and _closed is already set so nothing retries this.
         # A cache another holder already closed is not a teardown failure, and
@@ -200,6 +441,8 @@ class Service:
             pass
         finally:
             self.cache.close()
+        for line in self.cache.summary():
+            logger.info(f"{self.tag}* cache {line}")
 
     def __enter__(self) -> Self:
         return self
@@ -238,6 +481,224 @@ class Service:
             return
         raise RuntimeError(format_retry_message(service_label, retry_epoch, remaining))
 
+    def _artist_cache_keys(self, artist_id: str, known: dict) -> list[str]:
+        """The cache keys processing one artist will read, as far as `known` reveals them.
+
+        `known` maps each key prefetched so far to its cached value, so an
+        override can follow an album list to the tracklists it names. Those
+        values are cached API responses, read here without the api_* checks:
+        this is a hint, and a shape it does not recognize just means fewer keys.
+        """
+        return []
+
+    @staticmethod
+    def _cached_ids(items: object, *path: str) -> list[str]:
+        """The strings at `path` inside each object of a cached list, skipping anything else."""
+        if not isinstance(items, list):
+            return []
+        ids = []
+        for item in items:
+            for key in path:
+                item = item.get(key) if isinstance(item, dict) else None
+            if isinstance(item, str):
+                ids.append(item)
+        return ids
+
+    def _artist_keys(self, artist_id: str, load: Callable[[list[str]], dict]) -> set[str]:
+        """Follow _artist_cache_keys for one artist, a round at a time, and return every key it named.
+
+        load(keys) answers {key: cached value} for the keys it found, and is
+        what the next round's keys are worked out from.
+        """
+        known: dict = {}
+        requested: set[str] = set()
+        for _ in range(_PREFETCH_ROUNDS):
+            keys = [key for key in self._artist_cache_keys(artist_id, known) if key not in requested]
+            if not keys:
+                break
+            requested.update(keys)
+            known.update(load(keys))
+        return requested
+
+    def _prefetch(self, artist_id: str) -> dict:
+        """Load the cache rows for one artist in a few statements instead of one per read.
+
+        Returns what it found, for _store_catalog to work out the catalog's
+        sources from without reading them again.
+        """
+        found: dict = {}
+
+        def load(keys: list[str]) -> dict:
+            rows = self.cache.prefetch(keys)
+            found.update(rows)
+            return rows
+
+        self._artist_keys(artist_id, load)
+        return found
+
+    def _has_catalog(self, artist_id: str) -> bool:
+        """Whether the cache keeps a current catalog of artist_id for _cataloged_tracks to answer from."""
+        return self.cache.has_catalog(artist_id)
+
+    def _store_catalog(self, artist_id: str, tracks: Sequence[Track], since: float, prefetched: dict) -> bool:
+        """Keep the tracks get_artist_tracks answered in the cache's catalog of artist_id, for the next run.
+
+        Its sources are the keys _prefetch loaded, less the top tracks and
+        what they lead to: those come due in days, and the catalog does not
+        depend on them. They are worked out again from prefetched, what
+        _prefetch returned, rather than read: a read would count in stats()
+        and stamp the rows as used a second time. A key the walk could not
+        reach then is under one that was missing or has changed, and was
+        written since, which already keeps the catalog from being stored.
+        since is when the build began; see Cache.store_catalog.
+        """
+        sources = self._artist_keys(
+            artist_id,
+            lambda keys: {
+                key: prefetched[key] for key in keys if key in prefetched and key_class(key) != "top-tracks:"
+            },
+        )
+        sources = {key for key in sources if key_class(key) != "top-tracks:"}
+        # A generator, so the dedupe hashes are only worked out for a catalog
+        # the cache keeps.
+        rows = (
+            CatalogTrack(
+                track.id,
+                track.name,
+                track.duration_ms,
+                track.isrc,
+                track.dedupe_hash,
+                track.album.id,
+                track.album.name,
+                track.album.release_date.isoformat() if track.album.release_date else None,
+            )
+            for track in tracks
+            if track.album is not None
+        )
+        optional = {key for key in sources if key.startswith(self.catalog_optional)}
+        return self.cache.store_catalog(artist_id, rows, sources, since, optional)
+
+    def _cataloged_tracks(
+        self,
+        artist_id: str,
+        top_tracks: Sequence[Track],
+        excluded_album_ids: list[str],
+        excluded_track_ids: list[str],
+    ) -> list[Track] | None:
+        """collect_tracks' deduped candidates, from the cache's catalog of artist_id; None without a current one.
+
+        The filtering and the dedupe happen in the query, and only as many
+        tracks as a playlist can take are built, chosen at random, so a warm
+        run builds a handful of Tracks per artist rather than its catalog.
+        They carry no artists, which nothing downstream reads.
+        """
+        rows = self.cache.catalog(
+            artist_id,
+            MAX_TRACK_LENGTH_MS,
+            excluded_ids=[self.track_type.sanitize_id(id) for id in excluded_track_ids] + [t.id for t in top_tracks],
+            excluded_albums=[self.album_type.sanitize_id(id) for id in excluded_album_ids],
+            excluded_hashes=[t.dedupe_hash for t in top_tracks],
+        )
+        if rows is None:
+            return None
+        albums: dict[str, Album] = {}
+        tracks: list[Track] = []
+        for row in random.sample(rows, min(len(rows), MAX_TOP_TRACKS + MAX_ARTIST_TRACKS)):
+            album = albums.get(row.album_id)
+            if album is None:
+                album = albums[row.album_id] = self.album_type(row.album_id, row.album_name, row.album_released)
+            track = self.track_type(row.id, row.name, row.duration_ms, row.isrc, album=album)
+            # The catalog stored it, so it need not be worked out again.
+            track._dedupe_hash = row.dedupe_hash
+            tracks.append(track)
+        return tracks
+
+    def _release_ttl(self, albums: Sequence[Album]) -> float:
+        """How long an artist's album list lasts before it is checked for a new release.
+
+        Paced by the artist: an eighth of the usual gap between its recent
+        releases, or of the time since its latest where that is shorter, kept
+        between a day and three months. One releasing monthly is checked every
+        few days, one silent for years a few times a year. Without a dated
+        album there is nothing to pace by, and the cache's cutoff stands.
+        """
+        dates = sorted({album.release_date for album in albums if album.release_date is not None}, reverse=True)
+        if not dates:
+            return self.cache.cutoff
+        since = (datetime.datetime.now(tz=datetime.UTC).date() - dates[0]).days
+        gaps = [(newer - older).days for newer, older in itertools.pairwise(dates[: _RELEASE_HISTORY + 1])]
+        pace = min(since, statistics.median(gaps)) if gaps else since
+        return min(max(pace / _RELEASE_CHECKS, 1), _RELEASE_TTL_MAX_DAYS) * 24 * 60 * 60
+
+    def _fingerprint_ttl(self, albums: Sequence[Album]) -> float:
+        """How long the fingerprint of an album list lasts: twice the list's own pace.
+
+        It is only read once the list has expired, to vouch for it, so it has
+        to outlive the list rather than be evicted ahead of it.
+        """
+        return 2 * self._release_ttl(albums)
+
+    def expire_ahead(self, vip_ids: Sequence[str]) -> int:
+        """Bring this run's share of the cache due early, VIP artists' entries first. Returns how many.
+
+        Their tracklists are not named here, so a VIP goes first for its
+        artist info, album list and top tracks; the budget left over goes to
+        whatever is nearest to expiring, tracklists included.
+        """
+        first = [key for vip in vip_ids for key in self._artist_cache_keys(vip, {})]
+        advanced = self.cache.expire_ahead(first)
+        if advanced:
+            logger.info(f"{self.tag}* refreshing {advanced} cache entries ahead of their expiry")
+        return advanced
+
+    def invalidate_artist(self, artist_id: str) -> int:
+        """Drop the cache entries processing one artist reads, down to its tracklists. Returns the number removed.
+
+        The same keys _prefetch loads, found the same way, so the album list
+        is read for the tracklists it names before it goes. Entries another
+        artist's tracks led to, like a featured artist, are left alone.
+        """
+        artist_id = self.sanitize_id(artist_id)
+        keys = self._artist_keys(artist_id, lambda keys: {key: self.cache.read_stale(key) for key in keys})
+        with self.cache.batch():
+            return sum(self.cache.delete(key) for key in keys)
+
+    def _cached_roots(self) -> set[str]:
+        """Every artist the cache holds an album list for, which is every artist a run has processed."""
+        return {
+            key.removeprefix("artist:").removesuffix(":albums")
+            for key in self.cache.keys("artist:")
+            if key.endswith(":albums")
+        }
+
+    def sweep_orphans(self, artist_ids: Sequence[str]) -> int:
+        """Delete the cache entries of artists no longer configured, then compact the file. Returns how many.
+
+        artist_ids are the configured artists. Any other artist the cache
+        holds an album list for is walked as _prefetch would, and whatever
+        that names and no configured artist's walk also names is dropped: its
+        info, album list and top tracks, and the tracklists only it led to.
+        Entries nobody's walk names, like a featured artist read off a
+        tracklist, are left to their TTL, since sweeping them would only have
+        the next run fetch them again.
+        """
+
+        def load(keys: list[str]) -> dict:
+            return self.cache.prefetch(keys)
+
+        configured = {self.sanitize_id(artist_id) for artist_id in artist_ids}
+        keep: set[str] = set()
+        for artist_id in configured:
+            keep |= self._artist_keys(artist_id, load)
+        orphans: set[str] = set()
+        for root in self._cached_roots() - configured:
+            orphans |= self._artist_keys(root, load) - keep
+        with self.cache.batch():
+            removed = sum(self.cache.delete(key) for key in orphans)
+        if removed:
+            self.cache.compact()
+        return removed
+
     def get_artist(self, artist: str | Artist) -> Artist | None:
         raise NotImplementedError
 
@@ -276,6 +737,11 @@ class Service:
         def _process(idx: int, artist_id: str) -> tuple[str, list[Track]]:
             tag = self.tag
             logger.info(f"{tag}* [{idx + 1}/{total}] fetching {artist_id}")
+            # A current catalog answers without the tracklists, so there is
+            # nothing worth prefetching beyond the two reads below.
+            started = time.time()
+            cataloged = self._has_catalog(artist_id)
+            prefetched = None if cataloged else self._prefetch(artist_id)
             artist = self.get_artist(artist_id)
             if artist is None:
                 logger.warning(f"{tag}  ! artist {artist_id} not found, skipping")
@@ -293,30 +759,18 @@ class Service:
                     and not t.album.is_excluded(_excluded_album_ids)
                 )
             ]
-            top_track_ids = {t.id for t in top_tracks}
-            seen_hashes = {t.dedupe_hash for t in top_tracks}
-
-            artist_tracks = self.get_artist_tracks(artist)
-            artist_tracks = [
-                t
-                for t in artist_tracks
-                if (
-                    t.id not in top_track_ids
-                    and not t.is_excluded(_excluded_track_ids)
-                    and not t.longer_than(MAX_TRACK_LENGTH_MS)
-                    and t.album is not None
-                    and not t.album.is_excluded(_excluded_album_ids)
-                )
-            ]
-
-            deduped: list[Track] = []
-            for track in artist_tracks:
-                h = getattr(track, "dedupe_hash", None)
-                if h and h in seen_hashes:
-                    continue
-                if h:
-                    seen_hashes.add(h)
-                deduped.append(track)
+            deduped = (
+                self._cataloged_tracks(artist_id, top_tracks, _excluded_album_ids, _excluded_track_ids)
+                if cataloged
+                else None
+            )
+            if deduped is None:
+                artist_tracks = self.get_artist_tracks(artist)
+                # A catalog that went stale since has_catalog was not
+                # prefetched, and there is nothing to work its sources out from.
+                if prefetched is not None:
+                    self._store_catalog(artist_id, artist_tracks, started, prefetched)
+                deduped = _candidates(artist_tracks, top_tracks, _excluded_album_ids, _excluded_track_ids)
 
             random.shuffle(deduped)
             playlist = top_tracks[0:MAX_TOP_TRACKS] + deduped + top_tracks[MAX_TOP_TRACKS:-1]
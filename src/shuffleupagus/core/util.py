@@ -82,6 +82,11 @@ def iter_namespace(ns_pkg):
     return pkgutil.iter_modules(ns_pkg.__path__, ns_pkg.__name__ + ".")
 
 
+def plugin_names() -> list[str]:
+    """The installed service plugins by name, without importing any of them."""
+    return [name.rsplit(".", 1)[-1] for _, name, _ in iter_namespace(shuffleupagus.services)]
+
+
 def load_plugins():
     plugins = []
 
@@ -16,9 +16,14 @@ def sanitize_id(id: str) -> str:
 
 
 class AppleMusicArtist(Artist):
+    __slots__ = ()
+
     def __init__(self, id: str, name: str):
         super().__init__(id, name)
 
+    def matches(self, val) -> bool:
+        return sanitize_id(val) == self.id
+
     @staticmethod
     def sanitize_id(id: str) -> str:
         return sanitize_id(id)
@@ -32,9 +37,14 @@ class AppleMusicArtist(Artist):
 
 
 class AppleMusicAlbum(Album):
+    __slots__ = ()
+
     def __init__(self, id: str, name: str, release_date=None):
         super().__init__(id, name, release_date)
 
+    def matches(self, val) -> bool:
+        return sanitize_id(val) == self.id
+
     @staticmethod
     def sanitize_id(id: str) -> str:
         return sanitize_id(id)
@@ -49,6 +59,8 @@ class AppleMusicAlbum(Album):
 
 
 class AppleMusicTrack(Track):
+    __slots__ = ()
+
     def __init__(
         self,
         id: str,
@@ -60,6 +72,9 @@ class AppleMusicTrack(Track):
     ):
         super().__init__(id=id, name=name, duration_ms=duration_ms, isrc=isrc, album=album, artists=artists)
 
+    def matches(self, val) -> bool:
+        return sanitize_id(val) == self.id
+
     @staticmethod
     def sanitize_id(id: str) -> str:
         return sanitize_id(id)
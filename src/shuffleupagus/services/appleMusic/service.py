@@ -1,10 +1,13 @@
 import time
 from concurrent.futures import as_completed
+from functools import partial
+from typing import ClassVar
 
 import applemusicpy
 import applescript
 
-from ...core.apiresponse import api_int, api_list, api_object, api_str
+from ...core.apiresponse import api_int, api_list, api_object, api_project, api_str
+from ...core.cache import ABSENT, Projection
 from ...core.config import get_filepath
 from ...core.model import Album, Artist, Service, Track
 from ...core.util import logger, parse_retry_after
@@ -20,6 +23,34 @@ _SERVICE_LABEL = "Apple Music"
 # that a rate-limited run surfaces the 429 instead of stalling on every call.
 _MAX_CLIENT_RETRIES = 2
 
+# What each cached response is cut down to before it is written: the fields
+# from_dict and the track builders here read, and nothing else. Bump a version
+# when its fields change. Rows stored whole are cut down as they are read, and
+# rows cut down by another version are fetched again.
+_ALBUM_FIELDS = {"id": None, "attributes": {"name": None, "releaseDate": None}}
+_SONG_FIELDS = {"id": None, "attributes": {"name": None, "durationInMillis": None, "isrc": None}}
+_ARTIST = Projection(
+    1, partial(api_project, fields={"data": [{"id": None, "attributes": {"name": None}}]}, service=_SERVICE_LABEL)
+)
+_ALBUMS = Projection(1, partial(api_project, fields={"data": [_ALBUM_FIELDS]}, service=_SERVICE_LABEL))
+_SONGS = Projection(1, partial(api_project, fields={"data": [_SONG_FIELDS]}, service=_SERVICE_LABEL))
+_TRACK = Projection(
+    1,
+    partial(
+        api_project,
+        fields={
+            "data": [
+                {
+                    **_SONG_FIELDS,
+                    "relationships": {"artists": {"data": [{"id": None}]}, "albums": {"data": [{"id": None}]}},
+                }
+            ]
+        },
+        service=_SERVICE_LABEL,
+    ),
+)
+_TOP_TRACKS = Projection(1, partial(api_project, fields={"data": [{"id": None}]}, service=_SERVICE_LABEL))
+
 
 def _applescript_str(value: str) -> str:
     """Escape a value for embedding in an AppleScript double-quoted string literal.
@@ -80,6 +111,13 @@ def _applescript_count(result: object) -> int:
 
 class AppleMusicService(Service):
     name = "appleMusic"
+    cache_ttl_policy: ClassVar[dict[str, float]] = {
+        "album:": 60 * 60 * 24 * 180.0,  # 180 days — a released album and its tracklist do not change
+        "track:": 60 * 60 * 24 * 180.0,  # 180 days — nor does a song
+        "top-tracks:": 60 * 60 * 24 * 3.0,  # 3 days — top tracks move week to week
+    }
+    track_type: ClassVar[type[Track]] = AppleMusicTrack
+    album_type: ClassVar[type[Album]] = AppleMusicAlbum
 
     client: applemusicpy.AppleMusic
 
@@ -161,69 +199,89 @@ class AppleMusicService(Service):
         # it is bounded and escaped like any other untrusted value in a message.
         raise RuntimeError(f"Apple Music could not fetch {what} for {which!r:.120}{detail}: {e!r:.200}") from e
 
+    def _fetch(self, what: str, which: str, call, *args):
+        """call(*args) for a cache miss, or ABSENT when Apple Music does not have it. See _absent_or_raise.
+
+        ABSENT is cached, so the next run skips the 404 rather than paying it again.
+        """
+        try:
+            return call(*args)
+        except Exception as e:
+            self._absent_or_raise(e, what, which)
+            return ABSENT
+
+    def _artist_cache_keys(self, artist_id: str, known: dict) -> list[str]:
+        albums_key = "artist:" + artist_id + ":albums"
+        top_key = "top-tracks:" + artist_id
+        keys = ["artist:" + artist_id, albums_key, top_key]
+        albums = known.get(albums_key)
+        if isinstance(albums, dict):
+            keys += ["album:" + id + ":tracks" for id in self._cached_ids(albums.get("data"), "id")]
+        top = known.get(top_key)
+        if isinstance(top, dict):
+            keys += ["track:" + id for id in self._cached_ids(top.get("data"), "id")]
+        return keys
+
     # model: https://developer.apple.com/documentation/applemusicapi/artists
     def get_artist(self, artist) -> AppleMusicArtist | None:
-        if isinstance(artist, str):
-            artist_id = self.sanitize_id(artist)
-            artist_obj = None
-        else:
-            artist_id = artist.id
-            artist_obj = artist
+        artist_id = self.sanitize_id(artist) if isinstance(artist, str) else artist.id
 
-        cache_key = "artist:" + artist_id
+        def build() -> AppleMusicArtist | None:
+            cache_key = "artist:" + artist_id
 
-        ret = self.cache.read(cache_key)
-        if not ret:
-            try:
-                artist_obj = self.client.artist(artist_id)
-                if artist_obj is not None:
-                    ret = artist_obj
-                    self.cache.write(cache_key, ret)
-            except Exception as e:
-                self._absent_or_raise(e, "artist", artist_id)
+            ret = self.cache.get_or_fetch(
+                cache_key,
+                partial(self._fetch, "artist", artist_id, self.client.artist, artist_id),
+                revalidate=True,
+                projection=_ARTIST,
+            )
 
-        if ret is not None:
-            data = api_list(ret, ("data",), _SERVICE_LABEL)
-            if data:
-                return AppleMusicArtist.from_dict(api_object(data[0], "data[0]", _SERVICE_LABEL))
+            if ret is not None:
+                data = api_list(ret, ("data",), _SERVICE_LABEL)
+                if data:
+                    return AppleMusicArtist.from_dict(api_object(data[0], "data[0]", _SERVICE_LABEL))
 
-        return None
+            return None
+
+        return self._interned(AppleMusicArtist, artist_id, build)
 
     # model: https://developer.apple.com/documentation/applemusicapi/albums
     def get_album_by_id(self, album_id: str) -> AppleMusicAlbum | None:
         album_id = self.sanitize_id(album_id)
-        cache_key = "album:" + album_id
-
-        ret = self.cache.read(cache_key)
-        if not ret:
-            try:
-                album_obj = self.client.album(album_id)
-                if album_obj is not None:
-                    ret = album_obj
-                    self.cache.write(cache_key, ret)
-            except Exception as e:
-                self._absent_or_raise(e, "album", album_id)
 
-        if ret is not None:
-            data = api_list(ret, ("data",), _SERVICE_LABEL)
-            if data:
-                return AppleMusicAlbum.from_dict(api_object(data[0], "data[0]", _SERVICE_LABEL))
+        def build() -> AppleMusicAlbum | None:
+            cache_key = "album:" + album_id
 
-        return None
+            ret = self.cache.get_or_fetch(
+                cache_key, partial(self._fetch, "album", album_id, self.client.album, album_id), projection=_ALBUMS
+            )
+
+            if ret is not None:
+                data = api_list(ret, ("data",), _SERVICE_LABEL)
+                if data:
+                    return AppleMusicAlbum.from_dict(api_object(data[0], "data[0]", _SERVICE_LABEL))
+
+            return None
+
+        return self._interned(AppleMusicAlbum, album_id, build)
 
     # model: https://developer.apple.com/documentation/applemusicapi/albums
     def get_artist_albums(self, artist: Artist) -> list[Album]:
         cache_key = "artist:" + artist.id + ":albums"
 
-        ret = self.cache.read(cache_key)
-        if not ret:
-            try:
-                albums = self.client.artist_relationship(artist.id, "albums")
-                if albums is not None:
-                    ret = albums
-                    self.cache.write(cache_key, ret)
-            except Exception as e:
-                self._absent_or_raise(e, "artist albums", f"{artist.name} ({artist.id})")
+        ret = self.cache.get_or_fetch(
+            cache_key,
+            partial(
+                self._fetch,
+                "artist albums",
+                f"{artist.name} ({artist.id})",
+                self.client.artist_relationship,
+                artist.id,
+                "albums",
+            ),
+            revalidate=True,
+            projection=_ALBUMS,
+        )
 
         # ret is None only when the fetch above failed and was logged. An
         # empty relationship answers {"data": []}, so "data" itself is always
@@ -243,15 +301,9 @@ class AppleMusicService(Service):
         track_id = self.sanitize_id(track_id)
         cache_key = "track:" + track_id
 
-        ret = self.cache.read(cache_key)
-        if not ret:
-            try:
-                track_obj = self.client.song(track_id)
-                if track_obj is not None:
-                    ret = track_obj
-                    self.cache.write(cache_key, ret)
-            except Exception as e:
-                self._absent_or_raise(e, "track", track_id)
+        ret = self.cache.get_or_fetch(
+            cache_key, partial(self._fetch, "track", track_id, self.client.song, track_id), projection=_TRACK
+        )
 
         if ret is not None:
             data = api_list(ret, ("data",), _SERVICE_LABEL)
@@ -288,15 +340,18 @@ class AppleMusicService(Service):
     def get_album_tracks(self, album: Album, artist: Artist | None = None) -> list[Track]:
         cache_key = "album:" + album.id + ":tracks"
 
-        ret = self.cache.read(cache_key)
-        if not ret:
-            try:
-                album_tracks = self.client.album_relationship(album.id, "tracks")
-                if album_tracks is not None:
-                    ret = album_tracks
-                    self.cache.write(cache_key, ret)
-            except Exception as e:
-                self._absent_or_raise(e, "album tracks", f"{album.name} ({album.id})")
+        ret = self.cache.get_or_fetch(
+            cache_key,
+            partial(
+                self._fetch,
+                "album tracks",
+                f"{album.name} ({album.id})",
+                self.client.album_relationship,
+                album.id,
+                "tracks",
+            ),
+            projection=_SONGS,
+        )
 
         if ret is None:
             return []
@@ -320,49 +375,57 @@ class AppleMusicService(Service):
             return []
 
         tracks: list[Track] = []
-        futures = {self.album_pool.submit(self.get_album_tracks, album, artist): album for album in albums}
-        fatal_error = None
-        for future in as_completed(futures):
-            album = futures[future]
-            try:
-                tracks += future.result()
-            except RuntimeError as exc:
-                # RuntimeError is the convention's "abort this service" signal —
-                # a rate-limit window, an unusable cache, a fetch that failed
-                # rather than found nothing. Logging it here and carrying on
-                # turns it straight back into a silently missing album, which
-                # is the thing raising it was meant to stop.
-                fatal_error = exc
-                break
-            except Exception:
-                logger.exception(
-                    f"{self.tag}  ! error fetching tracks for album '{album.name}' (artist: {artist.name}), skipping"
-                )
+        # The album pool is what fills the cache on a cold run: one commit for
+        # this artist's tracklists rather than one per album.
+        with self.cache.batch():
+            futures = {self.album_pool.submit(self.get_album_tracks, album, artist): album for album in albums}
+            fatal_error = None
+            for future in as_completed(futures):
+                album = futures[future]
+                try:
+                    tracks += future.result()
+                except RuntimeError as exc:
+                    # RuntimeError is the convention's "abort this service" signal —
+                    # a rate-limit window, an unusable cache, a fetch that failed
+                    # rather than found nothing. Logging it here and carrying on
+                    # turns it straight back into a silently missing album, which
+                    # is the thing raising it was meant to stop.
+                    fatal_error = exc
+                    break
+                except Exception:
+                    logger.exception(
+                        f"{self.tag}  ! error fetching tracks for album '{album.name}' "
+                        f"(artist: {artist.name}), skipping"
+                    )
 
-        if fatal_error is not None:
-            # Drop whatever has not started yet. We are aborting because the
-            # service told us to stop — often a rate limit — so letting queued
-            # work carry on calling the same API is both pointless and rude.
-            # Already-running tasks cannot be interrupted; this is the same
-            # guarantee Service._shutdown_pools gives.
-            for pending in futures:
-                pending.cancel()
-            raise fatal_error
+            if fatal_error is not None:
+                # Drop whatever has not started yet. We are aborting because the
+                # service told us to stop — often a rate limit — so letting queued
+                # work carry on calling the same API is both pointless and rude.
+                # Already-running tasks cannot be interrupted; this is the same
+                # guarantee Service._shutdown_pools gives.
+                for pending in futures:
+                    pending.cancel()
+                raise fatal_error
 
         return tracks
 
     def get_artist_top_tracks(self, artist: Artist) -> list[Track]:
         cache_key = "top-tracks:" + artist.id
 
-        ret = self.cache.read(cache_key)
-        if not ret:
-            try:
-                top_tracks = self.client.artist_relationship_view(artist.id, "top-songs")
-                if top_tracks is not None:
-                    ret = top_tracks
-                self.cache.write(cache_key, ret)
-            except Exception as e:
-                self._absent_or_raise(e, "top tracks", f"{artist.name} ({artist.id})")
+        ret = self.cache.get_or_fetch(
+            cache_key,
+            partial(
+                self._fetch,
+                "top tracks",
+                f"{artist.name} ({artist.id})",
+                self.client.artist_relationship_view,
+                artist.id,
+                "top-songs",
+            ),
+            revalidate=True,
+            projection=_TOP_TRACKS,
+        )
 
         if ret is None:
             return []
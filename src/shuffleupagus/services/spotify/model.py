@@ -17,6 +17,8 @@ def sanitize_id(id: str) -> str:
 
 
 class SpotifyArtist(model.Artist):
+    __slots__ = ()
+
     def __init__(self, id: str, name: str):
         super().__init__(sanitize_id(id), name)
 
@@ -36,6 +38,8 @@ class SpotifyArtist(model.Artist):
 
 
 class SpotifyAlbum(model.Album):
+    __slots__ = ()
+
     def __init__(self, id: str, name: str, release_date=None):
         super().__init__(sanitize_id(id), name, release_date)
 
@@ -56,6 +60,8 @@ class SpotifyAlbum(model.Album):
 
 
 class SpotifyTrack(model.Track):
+    __slots__ = ()
+
     def __init__(
         self,
         id: str,
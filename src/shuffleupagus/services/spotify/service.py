@@ -2,27 +2,45 @@ import copy
 import sys
 import threading
 from concurrent.futures import as_completed
-from typing import cast
+from functools import partial
+from typing import ClassVar, cast
 
 import requests.adapters
 import spotipy
 from spotipy.oauth2 import SpotifyOAuth
 from urllib3.util.retry import Retry
 
-from ...core.apiresponse import api_array, api_has, api_int, api_list, api_object, api_str
+from ...core.apiresponse import api_array, api_has, api_int, api_list, api_object, api_project, api_str
+from ...core.cache import UNCHANGED, Projection
 from ...core.model import Album, Artist, Service, Track
 from ...core.util import logger, parse_retry_after
 from .model import SpotifyAlbum, SpotifyArtist, SpotifyTrack, sanitize_id
 
-# Fingerprint TTL: how long before we re-check whether a new album has been released.
-# Short enough to catch new releases, long enough to avoid hammering the API every run.
-_FINGERPRINT_TTL = 60 * 60 * 24  # 24 hours
-
 # Named in every message raised from an unexpected API response.
 _SERVICE_LABEL = "Spotify"
 
 _REQUEST_TIMEOUT = 30
 
+# What each cached response is cut down to before it is written: the fields
+# from_dict and the track builders here read, and nothing else. Bump a version
+# when its fields change. Rows stored whole are cut down as they are read, and
+# rows cut down by another version are fetched again.
+_ALBUM_FIELDS = {"id": None, "name": None, "release_date": None}
+_TRACK_FIELDS = {
+    "id": None,
+    "name": None,
+    "duration_ms": None,
+    "external_ids": {"isrc": None},
+    "artists": [{"id": None}],
+}
+_ARTIST = Projection(1, partial(api_project, fields={"id": None, "name": None}, service=_SERVICE_LABEL))
+_ALBUM = Projection(1, partial(api_project, fields=_ALBUM_FIELDS, service=_SERVICE_LABEL))
+_ARTIST_ALBUMS = Projection(1, partial(api_project, fields=[_ALBUM_FIELDS], service=_SERVICE_LABEL))
+_ALBUM_TRACKS = Projection(1, partial(api_project, fields=[_TRACK_FIELDS], service=_SERVICE_LABEL))
+_TOP_TRACKS = Projection(
+    1, partial(api_project, fields={"tracks": [{**_TRACK_FIELDS, "album": {"id": None}}]}, service=_SERVICE_LABEL)
+)
+
 
 _NO_RETRY_AFTER_MESSAGE = "Spotify rate-limited (no Retry-After header). Try again later."
 
@@ -35,6 +53,12 @@ def _retry_after_seconds(exc: Exception) -> int:
 
 class SpotifyService(Service):
     name = "spotify"
+    cache_ttl_policy: ClassVar[dict[str, float]] = {
+        "album:": 60 * 60 * 24 * 180.0,  # 180 days — a released album and its tracklist do not change
+        "top-tracks:": 60 * 60 * 24 * 3.0,  # 3 days — top tracks move week to week
+    }
+    track_type: ClassVar[type[Track]] = SpotifyTrack
+    album_type: ClassVar[type[Album]] = SpotifyAlbum
 
     spotify: spotipy.Spotify
     _api_lock: threading.Lock
@@ -133,6 +157,16 @@ class SpotifyService(Service):
     def sanitize_id(self, id: str) -> str:
         return sanitize_id(id)
 
+    def _artist_cache_keys(self, artist_id: str, known: dict) -> list[str]:
+        albums_key = "artist:" + artist_id + ":albums"
+        top_key = "top-tracks:" + artist_id
+        keys = ["artist:" + artist_id, albums_key, "fingerprint:artist:" + artist_id, top_key]
+        keys += ["album:" + id + ":tracks" for id in self._cached_ids(known.get(albums_key), "id")]
+        top = known.get(top_key)
+        if isinstance(top, dict):
+            keys += ["album:" + id for id in self._cached_ids(top.get("tracks"), "album", "id")]
+        return keys
+
     def get_artist(self, artist: str | Artist) -> SpotifyArtist:
         if isinstance(artist, str):
             artist_id = self.sanitize_id(artist)
@@ -144,87 +178,104 @@ class SpotifyService(Service):
         if artist_id is None:
             raise ValueError("Artist ID is missing")
 
-        cache_key = "artist:" + artist_id
-        ret = self.cache.read(cache_key)
-        if not ret:
-            if artist_obj:
-                ret = artist_obj
-            else:
-                ret = self._call(self.spotify.artist, artist_id)
-            self.cache.write(cache_key, ret)
+        def build() -> SpotifyArtist:
+            ret = self.cache.get_or_fetch(
+                "artist:" + artist_id,
+                lambda: artist_obj or self._call(self.spotify.artist, artist_id),
+                revalidate=True,
+                projection=_ARTIST,
+            )
+            return SpotifyArtist.from_dict(ret)
 
-        return SpotifyArtist.from_dict(ret)
+        return cast("SpotifyArtist", self._interned(SpotifyArtist, artist_id, build))
 
     def get_album_by_id(self, album_id: str) -> Album:
         album_id = self.sanitize_id(album_id)
 
-        cache_key = "album:" + album_id
-        ret = self.cache.read(cache_key)
-        if not ret:
-            ret = self._call(self.spotify.album, album_id)
-            self.cache.write(cache_key, ret)
+        def build() -> SpotifyAlbum:
+            cache_key = "album:" + album_id
+            ret = self.cache.get_or_fetch(
+                cache_key, partial(self._call, self.spotify.album, album_id), projection=_ALBUM
+            )
+            return SpotifyAlbum.from_dict(ret)
 
-        return SpotifyAlbum.from_dict(ret)
+        return cast("SpotifyAlbum", self._interned(SpotifyAlbum, album_id, build))
 
-    def get_artist_albums(self, artist: Artist) -> list[Album]:
+    def _fetch_artist_albums(self, artist: Artist):
+        """The album list for a cache miss, else UNCHANGED while the fingerprint still matches.
+
+        Run by get_or_fetch, which writes what this returns and touches the
+        stale list on UNCHANGED, so a fingerprint match extends it in place.
+        """
         cache_key = "artist:" + artist.id + ":albums"
         fp_key = "fingerprint:artist:" + artist.id
 
-        ret = self.cache.read(cache_key)
-        if ret is None:
-            # Cache miss — check fingerprint before doing a full catalog fetch.
-            stale = self.cache.read_stale(cache_key)
-            if stale is not None:
-                try:
-                    latest = self._call(self.spotify.artist_albums, artist.id, limit=1)
-                    items = api_list(latest, ("items",), _SERVICE_LABEL) if api_has(latest, "items") else []
-                    if items:
-                        latest_id = api_str(api_object(items[0], "items[0]", _SERVICE_LABEL), ("id",), _SERVICE_LABEL)
-                        cached_fp = self.cache.read_stale(fp_key)
-                        if cached_fp == latest_id:
-                            logger.debug(f"{self.tag}* fingerprint match for {artist.name}, extending cache")
-                            self.cache.touch(cache_key)
-                            self.cache.write(fp_key, latest_id, ttl=_FINGERPRINT_TTL)
-                            ret = stale
-                except RuntimeError:
-                    # _call() raises RuntimeError for rate limiting. Let it
-                    # propagate so collect_tracks() aborts the run, instead of
-                    # burying a 429 in a debug-level "fingerprint check failed".
-                    raise
-                except Exception as e:
-                    logger.debug(f"{self.tag}* fingerprint check failed for {artist.id}: {e}")
-
-        if ret is None:
-            album = self._call(self.spotify.artist_albums, artist.id)
-            # "items" is not optional: /artists/{id}/albums answers a paging
-            # object, which always carries it. Treating an absent one as "no
-            # albums" cached [] for a week and dropped the artist from the
-            # playlist silently on every run after that.
-            ret = api_list(album, ("items",), _SERVICE_LABEL)
-            self.cache.write(cache_key, ret)
-            # Spotify returns albums newest-first; ret[0] is the latest release.
-            if ret:
-                first = api_object(ret[0], "items[0]", _SERVICE_LABEL)
-                self.cache.write(fp_key, api_str(first, ("id",), _SERVICE_LABEL), ttl=_FINGERPRINT_TTL)
-
-        albums = []
+        # Check the fingerprint before doing a full catalog fetch.
+        stale = self.cache.read_stale(cache_key)
+        if stale is not None:
+            try:
+                latest = self._call(self.spotify.artist_albums, artist.id, limit=1)
+                items = api_list(latest, ("items",), _SERVICE_LABEL) if api_has(latest, "items") else []
+                if items:
+                    latest_id = api_str(api_object(items[0], "items[0]", _SERVICE_LABEL), ("id",), _SERVICE_LABEL)
+                    cached_fp = self.cache.read_stale(fp_key)
+                    if cached_fp == latest_id:
+                        logger.debug(f"{self.tag}* fingerprint match for {artist.name}, extending cache")
+                        self.cache.write(fp_key, latest_id, ttl=self._fingerprint_ttl(self._albums(stale)))
+                        return UNCHANGED
+            except RuntimeError:
+                # _call() raises RuntimeError for rate limiting. Let it
+                # propagate so collect_tracks() aborts the run, instead of
+                # burying a 429 in a debug-level "fingerprint check failed".
+                raise
+            except Exception as e:
+                logger.debug(f"{self.tag}* fingerprint check failed for {artist.id}: {e}")
+
+        album = self._call(self.spotify.artist_albums, artist.id)
+        # "items" is not optional: /artists/{id}/albums answers a paging
+        # object, which always carries it. Treating an absent one as "no
+        # albums" cached [] for a week and dropped the artist from the
+        # playlist silently on every run after that.
+        ret = api_list(album, ("items",), _SERVICE_LABEL)
+        # Spotify returns albums newest-first; ret[0] is the latest release.
         if ret:
-            # Checked after the branches merge, not inside the fetch branch: ret
-            # can also come from the cache, which holds the same untrusted JSON.
+            first = api_object(ret[0], "items[0]", _SERVICE_LABEL)
+            ttl = self._fingerprint_ttl(self._albums(ret))
+            self.cache.write(fp_key, api_str(first, ("id",), _SERVICE_LABEL), ttl=ttl)
+        return ret
+
+    @staticmethod
+    def _albums(ret) -> list[Album]:
+        """The albums in an album list, fetched or cached."""
+        albums: list[Album] = []
+        if ret:
+            # Checked here, not where the list is fetched: ret can also come
+            # from the cache, which holds the same untrusted JSON.
             for album in api_array(ret, "artist albums", _SERVICE_LABEL):
                 albums.append(SpotifyAlbum.from_dict(api_object(album, "items[] entry", _SERVICE_LABEL)))
-
         return albums
 
+    def get_artist_albums(self, artist: Artist) -> list[Album]:
+        cache_key = "artist:" + artist.id + ":albums"
+        ret = self.cache.get_or_fetch(
+            cache_key,
+            partial(self._fetch_artist_albums, artist),
+            # Paced by the artist's releases, which the list itself records.
+            ttl=lambda albums: self._release_ttl(self._albums(albums)),
+            revalidate=True,
+            projection=_ARTIST_ALBUMS,
+        )
+        return self._albums(ret)
+
     def get_album_tracks(self, album: Album) -> list[Track]:
         cache_key = "album:" + album.id + ":tracks"
 
-        ret = self.cache.read(cache_key)
-        if not ret:
-            t = self._call(self.spotify.album_tracks, album.id)
-            # Also a paging object; see get_artist_albums.
-            ret = api_list(t, ("items",), _SERVICE_LABEL)
-            self.cache.write(cache_key, ret)
+        # Also a paging object; see _fetch_artist_albums.
+        ret = self.cache.get_or_fetch(
+            cache_key,
+            lambda: api_list(self._call(self.spotify.album_tracks, album.id), ("items",), _SERVICE_LABEL),
+            projection=_ALBUM_TRACKS,
+        )
 
         tracks: list[Track] = []
         if ret:
@@ -261,44 +312,50 @@ class SpotifyService(Service):
             return []
 
         tracks: list[Track] = []
-        futures = {self.album_pool.submit(self.get_album_tracks, album): album for album in albums}
-        fatal_error = None
-        for future in as_completed(futures):
-            album = futures[future]
-            try:
-                tracks += future.result()
-            except RuntimeError as exc:
-                # RuntimeError is the convention's "abort this service" signal —
-                # a rate-limit window, an unusable cache, a fetch that failed
-                # rather than found nothing. Logging it here and carrying on
-                # turns it straight back into a silently missing album, which
-                # is the thing raising it was meant to stop.
-                fatal_error = exc
-                break
-            except Exception:
-                logger.exception(
-                    f"{self.tag}  ! error fetching tracks for album '{album.name}' (artist: {artist.name}), skipping"
-                )
-
-        if fatal_error is not None:
-            # Drop whatever has not started yet. We are aborting because the
-            # service told us to stop — often a rate limit — so letting queued
-            # work carry on calling the same API is both pointless and rude.
-            # Already-running tasks cannot be interrupted; this is the same
-            # guarantee Service._shutdown_pools gives.
-            for pending in futures:
-                pending.cancel()
-            raise fatal_error
+        # The album pool is what fills the cache on a cold run: one commit for
+        # this artist's tracklists rather than one per album.
+        with self.cache.batch():
+            futures = {self.album_pool.submit(self.get_album_tracks, album): album for album in albums}
+            fatal_error = None
+            for future in as_completed(futures):
+                album = futures[future]
+                try:
+                    tracks += future.result()
+                except RuntimeError as exc:
+                    # RuntimeError is the convention's "abort this service" signal —
+                    # a rate-limit window, an unusable cache, a fetch that failed
+                    # rather than found nothing. Logging it here and carrying on
+                    # turns it straight back into a silently missing album, which
+                    # is the thing raising it was meant to stop.
+                    fatal_error = exc
+                    break
+                except Exception:
+                    logger.exception(
+                        f"{self.tag}  ! error fetching tracks for album '{album.name}' "
+                        f"(artist: {artist.name}), skipping"
+                    )
+
+            if fatal_error is not None:
+                # Drop whatever has not started yet. We are aborting because the
+                # service told us to stop — often a rate limit — so letting queued
+                # work carry on calling the same API is both pointless and rude.
+                # Already-running tasks cannot be interrupted; this is the same
+                # guarantee Service._shutdown_pools gives.
+                for pending in futures:
+                    pending.cancel()
+                raise fatal_error
 
         return tracks
 
     def get_artist_top_tracks(self, artist: Artist) -> list[Track]:
         cache_key = "top-tracks:" + artist.id
 
-        ret = self.cache.read(cache_key)
-        if not ret:
-            ret = self._call(self.spotify.artist_top_tracks, artist.id)
-            self.cache.write(cache_key, ret)
+        ret = self.cache.get_or_fetch(
+            cache_key,
+            partial(self._call, self.spotify.artist_top_tracks, artist.id),
+            revalidate=True,
+            projection=_TOP_TRACKS,
+        )
 
         tracks = []
         # artist_top_tracks always carries "tracks"; see get_artist_albums.
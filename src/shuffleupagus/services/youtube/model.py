@@ -24,11 +24,13 @@ def sanitize_id(id: str) -> str:
 
 
 class YoutubeArtist(model.Artist):
-    handle: str | None = None
-    browseIds: dict[str, str | None] = {}
-    params: dict[str, str | None] = {}
+    __slots__ = ("browseIds", "handle", "inlineAlbums", "params")
+
+    handle: str | None
+    browseIds: dict[str, str | None]
+    params: dict[str, str | None]
     # inline results from get_artist (used when browseId/params are absent)
-    inlineAlbums: list = []
+    inlineAlbums: list
 
     def __init__(self, id: str, name: str, handle: str | None = None):
         super().__init__(sanitize_id(id), name)
@@ -70,6 +72,8 @@ class YoutubeArtist(model.Artist):
 
 
 class YoutubeAlbum(model.Album):
+    __slots__ = ()
+
     def __init__(self, id: str, name: str, release_date=None):
         super().__init__(sanitize_id(id), name, release_date)
 
@@ -109,6 +113,8 @@ class YoutubeAlbum(model.Album):
 
 
 class YoutubeTrack(model.Track):
+    __slots__ = ()
+
     def __init__(
         self,
         id: str,
@@ -3,7 +3,9 @@ import os
 import re
 import sys
 from concurrent.futures import as_completed
+from functools import partial
 from pathlib import Path
+from typing import ClassVar, cast
 
 import requests
 import ytmusicapi
@@ -11,18 +13,51 @@ from ytmusicapi import YTMusic
 from ytmusicapi.auth.oauth import OAuthCredentials, RefreshingToken
 from ytmusicapi.exceptions import YTMusicServerError, YTMusicUserError
 
-from ...core.apiresponse import api_array, api_has, api_int, api_list, api_object, api_str
+from ...core.apiresponse import api_array, api_has, api_int, api_list, api_object, api_project, api_str
+from ...core.cache import ABSENT, UNCHANGED, Projection
 from ...core.config import get_filepath
 from ...core.model import Album, Artist, Service, Track
 from ...core.util import logger
 from .model import YoutubeAlbum, YoutubeArtist, YoutubeTrack
 
-# Fingerprint TTL: how often to re-check whether a new album has appeared.
-_FINGERPRINT_TTL = 60 * 60 * 24  # 24 hours
-
 # Named in every message raised from an unexpected API response.
 _SERVICE_LABEL = "YouTube"
 
+# What each cached response is cut down to before it is written: the fields
+# from_dict and the track builders here read, and nothing else. Bump a version
+# when its fields change. Rows stored whole are cut down as they are read, and
+# rows cut down by another version are fetched again.
+# "album:" holds get_album's response for both get_album_by_id and
+# get_album_tracks, so its fields are what either one reads.
+_ALBUM_FIELDS = {"browseId": None, "audioPlaylistId": None, "id": None, "title": None, "year": None, "type": None}
+_SECTION_FIELDS = {"browseId": None, "params": None, "results": [_ALBUM_FIELDS]}
+_ARTIST = Projection(
+    1,
+    partial(
+        api_project,
+        fields={
+            "channelId": None,
+            "name": None,
+            "albums": _SECTION_FIELDS,
+            "singles": _SECTION_FIELDS,
+            "songs": {"browseId": None, "params": None},
+        },
+        service=_SERVICE_LABEL,
+    ),
+)
+_ALBUM = Projection(
+    1,
+    partial(
+        api_project,
+        fields={
+            **_ALBUM_FIELDS,
+            "tracks": [{"videoId": None, "title": None, "duration_seconds": None, "artists": [{"id": None}]}],
+        },
+        service=_SERVICE_LABEL,
+    ),
+)
+_ARTIST_ALBUMS = Projection(1, partial(api_project, fields=[_ALBUM_FIELDS], service=_SERVICE_LABEL))
+
 channelUrl = re.compile(
     r'^.*<link rel="canonical" href="https://www\.youtube\.com/channel/([^\"]+)".*$',
     re.MULTILINE | re.DOTALL,
@@ -34,6 +69,14 @@ channelHandle = re.compile(r'"canonicalBaseUrl":"(/@[^"]+)"')
 class YoutubeService(Service):
     name = "youtube"
     cache_cutoff = 60 * 60 * 24 * 90  # 90 days — artist/album data is stable; keeps cache warm across OAuth refreshes
+    cache_ttl_policy: ClassVar[dict[str, float]] = {
+        "album:": 60 * 60 * 24 * 180.0,  # 180 days — a released album's tracklist does not change
+        "channel:": 60 * 60 * 24 * 365 * 10.0,  # ~10 years — a handle's channel ID is permanent
+    }
+    track_type: ClassVar[type[Track]] = YoutubeTrack
+    album_type: ClassVar[type[Album]] = YoutubeAlbum
+    # A channel's handle is only written when it has one.
+    catalog_optional: ClassVar[tuple[str, ...]] = ("fingerprint:", "channel:handle:")
 
     client: YTMusic  # browser-auth client for browsing artists/albums
     _oauth_client: YTMusic | None = None  # OAuth client for Data API (playlist sync)
@@ -349,14 +392,39 @@ class YoutubeService(Service):
             if m:
                 handle = m.group(1)  # e.g. "/@artistname"
 
-        permanent = 60 * 60 * 24 * 365 * 10.0  # ~10 years
-        self.cache.write("channel:" + artist, channel_id, ttl=permanent)
+        self.cache.write("channel:" + artist, channel_id)
         if handle:
-            self.cache.write("channel:handle:" + channel_id, handle, ttl=permanent)
+            self.cache.write("channel:handle:" + channel_id, handle)
 
         logger.debug(f"{self.tag}* resolved {artist} to channel ID: {channel_id} (handle: {handle})")
         return channel_id, handle
 
+    def _artist_cache_keys(self, artist_id: str, known: dict) -> list[str]:
+        # The same resolution __get_channel_id makes: a bare channel ID is its
+        # own key, and a handle or URL has to be looked up first.
+        artist_id = self.sanitize_id(artist_id)
+        if not artist_id.startswith(("@", "http")):
+            channel_id = artist_id
+            keys = []
+        else:
+            resolved = known.get("channel:" + artist_id)
+            channel_id = resolved if isinstance(resolved, str) else None
+            keys = ["channel:" + artist_id]
+        if channel_id is None:
+            return keys
+        albums_key = "artist:" + channel_id + ":albums"
+        keys += ["channel:handle:" + channel_id, "artist:" + channel_id, albums_key, "fingerprint:artist:" + channel_id]
+        keys += ["album:" + id for id in self._cached_ids(known.get(albums_key), "browseId")]
+        return keys
+
+    def _cached_roots(self) -> set[str]:
+        # A handle's channel lookup is a root of its own, so a handle taken out
+        # of the configuration takes its lookup with it.
+        handles = {
+            key.removeprefix("channel:") for key in self.cache.keys("channel:") if not key.startswith("channel:handle:")
+        }
+        return super()._cached_roots() | handles
+
     def get_artist(self, artist: str | Artist) -> YoutubeArtist | None:
         if isinstance(artist, str):
             original = artist
@@ -375,126 +443,163 @@ class YoutubeService(Service):
         if artist_id is None:
             raise ValueError("Artist ID is missing")
 
-        cache_key = "artist:" + artist_id
-        logger.debug(f"{self.tag}* fetching artist info for ID: {artist_id} (cache key: {cache_key})")
-        ret = self.cache.read(cache_key)
-        if not ret:
-            if artist_obj:
-                ret = artist_obj
-            else:
-                try:
-                    ret = self.client.get_artist(artist_id)
-                except (KeyError, YTMusicServerError) as e:
-                    if "400" in str(e):
-                        logger.warning(
-                            f"{self.tag}* {original} (channel: {artist_id}): YouTube Music API returned "
-                            f"HTTP 400 — this artist may not have a YouTube Music page, or your "
-                            f"browser cookies may lack access to browse artist pages.",
-                        )
-                    else:
-                        logger.warning(
-                            f"{self.tag}* {original} has no YouTube Music page ({e}), skipping (channel: {artist_id})",
-                        )
-                    return None
-                self.cache.write(cache_key, ret)
-
-        ya = YoutubeArtist.from_dict(ret)
-        ya.handle = handle
+        def build() -> YoutubeArtist | None:
+            cache_key = "artist:" + artist_id
+            logger.debug(f"{self.tag}* fetching artist info for ID: {artist_id} (cache key: {cache_key})")
+            ret = self.cache.get_or_fetch(
+                cache_key,
+                lambda: artist_obj or self._fetch_artist(artist_id, original),
+                revalidate=True,
+                projection=_ARTIST,
+            )
+            return None if ret is None else YoutubeArtist.from_dict(ret)
+
+        ya = self._interned(YoutubeArtist, artist_id, build)
+        # The handle is what the configuration named the artist by, and only
+        # an ask by handle knows it. A credit asks by channel ID, and must not
+        # take away the handle an earlier ask gave the shared object.
+        if ya is not None and handle is not None:
+            ya.handle = handle
         return ya
 
+    def _fetch_artist(self, artist_id: str, original: str):
+        """get_artist's response for a cache miss, or None when the artist has no page to fetch.
+
+        ABSENT when the channel answered without a Music page, which is the
+        catalogue's answer and is cached. A 400 is not: it is just as often
+        OAuth being refused the browse endpoints, and caching that would keep
+        the artist out after switching to cookies.
+        """
+        try:
+            return self.client.get_artist(artist_id)
+        except (KeyError, YTMusicServerError) as e:
+            if "400" in str(e):
+                logger.warning(
+                    f"{self.tag}* {original} (channel: {artist_id}): YouTube Music API returned "
+                    f"HTTP 400 — this artist may not have a YouTube Music page, or your "
+                    f"browser cookies may lack access to browse artist pages.",
+                )
+                return None
+            logger.warning(
+                f"{self.tag}* {original} has no YouTube Music page ({e}), skipping (channel: {artist_id})",
+            )
+            return ABSENT if isinstance(e, KeyError) else None
+
+    def _fetch_album(self, album_id: str):
+        """get_album's response for a cache miss, with a 400 reported as the album it was for."""
+        try:
+            return self.client.get_album(album_id)
+        except (KeyError, YTMusicServerError) as e:
+            if "400" in str(e):
+                raise ValueError(
+                    f"YouTube Music API returned HTTP 400 for album {album_id}",
+                ) from e
+            raise
+
     def get_album_by_id(self, album_id: str) -> Album:
         album_id = self.sanitize_id(album_id)
 
-        cache_key = "album:" + album_id
-        ret = self.cache.read(cache_key)
-        if not ret:
-            try:
-                ret = self.client.get_album(album_id)
-            except (KeyError, YTMusicServerError) as e:
-                if "400" in str(e):
-                    raise ValueError(
-                        f"YouTube Music API returned HTTP 400 for album {album_id}",
-                    ) from e
-                raise
-            self.cache.write(cache_key, ret)
+        def build() -> YoutubeAlbum:
+            cache_key = "album:" + album_id
+            ret = self.cache.get_or_fetch(cache_key, partial(self._fetch_album, album_id), projection=_ALBUM)
+            # The key get_album_tracks caches an album it was told is not there under.
+            if ret is None:
+                raise ValueError(f"YouTube Music does not have album {album_id}")
+            return YoutubeAlbum.from_dict(ret)
 
-        return YoutubeAlbum.from_dict(ret)
+        return cast("YoutubeAlbum", self._interned(YoutubeAlbum, album_id, build))
 
-    def get_artist_albums(self, artist: Artist) -> list[Album]:
+    def _fetch_artist_albums(self, artist: YoutubeArtist):
+        """The album list for a cache miss, or None when there is none to cache.
+
+        UNCHANGED while the fingerprint still matches. Run by get_or_fetch,
+        which writes what this returns and touches the stale list on
+        UNCHANGED, so a match extends it in place.
+        """
         cache_key = "artist:" + artist.id + ":albums"
         fp_key = "fingerprint:artist:" + artist.id
 
-        assert isinstance(artist, YoutubeArtist)
+        # Derive the current "latest album" fingerprint from the get_artist response,
+        # which is already in memory — no extra API call required.
+        inline = artist.inlineAlbums
+        current_fp = api_object(inline[0], "inline albums[0]", _SERVICE_LABEL).get("browseId") if inline else None
+
+        stale = self.cache.read_stale(cache_key)
+        if stale is not None and current_fp is not None:
+            cached_fp = self.cache.read_stale(fp_key)
+            if cached_fp == current_fp:
+                logger.debug(f"{self.tag}* fingerprint match for {artist.name}, extending cache")
+                self.cache.write(fp_key, current_fp, ttl=self._fingerprint_ttl(self._albums(stale)))
+                return UNCHANGED
+
         albums_browse_id = artist.browseIds.get("albums")
         albums_params = artist.params.get("albums")
+        if albums_browse_id is not None and albums_params is not None:
+            try:
+                ret = self.client.get_artist_albums(albums_browse_id, albums_params, limit=100)
+            except (KeyError, YTMusicServerError) as e:
+                logger.warning(
+                    f"{self.tag}* HTTP error fetching album list for {artist.name}: {e}",
+                )
+                return None
+        elif inline:
+            # all albums are already embedded in the get_artist response
+            ret = inline
+        else:
+            logger.debug(f"{self.tag}* artist {artist.name} has no albums, skipping")
+            return None
+        if inline:
+            first = api_object(inline[0], "inline albums[0]", _SERVICE_LABEL)
+            ttl = self._fingerprint_ttl(self._albums(ret))
+            self.cache.write(fp_key, api_str(first, ("browseId",), _SERVICE_LABEL), ttl=ttl)
+        return ret
+
+    @staticmethod
+    def _albums(ret) -> list[Album]:
+        """The albums in an album list: a cache hit, a get_artist_albums response, or the inline albums."""
+        return (
+            [YoutubeAlbum.from_dict(album) for album in api_array(ret, "artist albums", _SERVICE_LABEL)] if ret else []
+        )
+
+    def get_artist_albums(self, artist: Artist) -> list[Album]:
+        cache_key = "artist:" + artist.id + ":albums"
+
+        assert isinstance(artist, YoutubeArtist)
 
         logger.debug(f"{self.tag}* fetching albums for artist ID: {artist.id} (cache key: {cache_key})")
-        albums = []
-
-        ret = self.cache.read(cache_key)
-        if ret is None:
-            # Derive the current "latest album" fingerprint from the get_artist response,
-            # which is already in memory — no extra API call required.
-            inline = artist.inlineAlbums
-            current_fp = api_object(inline[0], "inline albums[0]", _SERVICE_LABEL).get("browseId") if inline else None
-
-            stale = self.cache.read_stale(cache_key)
-            if stale is not None and current_fp is not None:
-                cached_fp = self.cache.read_stale(fp_key)
-                if cached_fp == current_fp:
-                    logger.debug(f"{self.tag}* fingerprint match for {artist.name}, extending cache")
-                    self.cache.touch(cache_key)
-                    self.cache.write(fp_key, current_fp, ttl=_FINGERPRINT_TTL)
-                    ret = stale
-
-        if ret is None:
-            if albums_browse_id is not None and albums_params is not None:
-                try:
-                    ret = self.client.get_artist_albums(albums_browse_id, albums_params, limit=100)
-                except (KeyError, YTMusicServerError) as e:
-                    logger.warning(
-                        f"{self.tag}* HTTP error fetching album list for {artist.name}: {e}",
-                    )
-                    return []
-            elif artist.inlineAlbums:
-                # all albums are already embedded in the get_artist response
-                ret = artist.inlineAlbums
-            else:
-                logger.debug(f"{self.tag}* artist {artist.name} has no albums, skipping")
-                return []
-            self.cache.write(cache_key, ret)
-            inline = artist.inlineAlbums
-            if inline:
-                first = api_object(inline[0], "inline albums[0]", _SERVICE_LABEL)
-                self.cache.write(fp_key, api_str(first, ("browseId",), _SERVICE_LABEL), ttl=_FINGERPRINT_TTL)
-
-        if ret:
-            # Checked after the branches merge: ret is either a cache hit, a
-            # get_artist_albums response, or the inline albums off the artist.
-            for album in api_array(ret, "artist albums", _SERVICE_LABEL):
-                albums.append(YoutubeAlbum.from_dict(album))
-
-        return albums
+        ret = self.cache.get_or_fetch(
+            cache_key,
+            partial(self._fetch_artist_albums, artist),
+            # Paced by the artist's releases, which the list itself records.
+            ttl=lambda albums: self._release_ttl(self._albums(albums)),
+            revalidate=True,
+            projection=_ARTIST_ALBUMS,
+        )
+        return self._albums(ret)
+
+    def _fetch_album_tracks(self, album: Album):
+        """get_album's response for an album's tracklist, or None when it could not be fetched.
+
+        ABSENT, which is cached, for an album YouTube Music does not have.
+        """
+        try:
+            return self.client.get_album(album.id)
+        except (KeyError, YTMusicServerError) as e:
+            # Report what actually failed. A blanket "HTTP 400" here hid
+            # quota and auth errors behind a routine "album not found".
+            if "400" in str(e):
+                logger.warning(
+                    f"{self.tag}* album '{album.name}' ({album.id}) is not on YouTube Music, skipping",
+                )
+                return ABSENT
+            logger.warning(
+                f"{self.tag}* error fetching album '{album.name}' ({album.id}): {e}, skipping",
+            )
+            return None
 
     def get_album_tracks(self, album: Album) -> list[Track]:
         cache_key = "album:" + album.id
-        ret = self.cache.read(cache_key)
-        if not ret:
-            try:
-                ret = self.client.get_album(album.id)
-            except (KeyError, YTMusicServerError) as e:
-                # Report what actually failed. A blanket "HTTP 400" here hid
-                # quota and auth errors behind a routine "album not found".
-                if "400" in str(e):
-                    logger.warning(
-                        f"{self.tag}* album '{album.name}' ({album.id}) is not on YouTube Music, skipping",
-                    )
-                else:
-                    logger.warning(
-                        f"{self.tag}* error fetching album '{album.name}' ({album.id}): {e}, skipping",
-                    )
-                return []
-            self.cache.write(cache_key, ret)
+        ret = self.cache.get_or_fetch(cache_key, partial(self._fetch_album_tracks, album), projection=_ALBUM)
 
         tracks: list[Track] = []
         # get_album always carries "tracks"; an absent one is a malformed
@@ -526,34 +631,38 @@ class YoutubeService(Service):
             return []
 
         tracks: list[Track] = []
-        futures = {self.album_pool.submit(self.get_album_tracks, album): album for album in albums}
-        fatal_error = None
-        for future in as_completed(futures):
-            album = futures[future]
-            try:
-                tracks += future.result()
-            except RuntimeError as exc:
-                # RuntimeError is the convention's "abort this service" signal —
-                # a rate-limit window, an unusable cache, a fetch that failed
-                # rather than found nothing. Logging it here and carrying on
-                # turns it straight back into a silently missing album, which
-                # is the thing raising it was meant to stop.
-                fatal_error = exc
-                break
-            except Exception:
-                logger.exception(
-                    f"{self.tag}  ! error fetching tracks for album '{album.name}' (artist: {artist.name}), skipping"
-                )
+        # The album pool is what fills the cache on a cold run: one commit for
+        # this artist's tracklists rather than one per album.
+        with self.cache.batch():
+            futures = {self.album_pool.submit(self.get_album_tracks, album): album for album in albums}
+            fatal_error = None
+            for future in as_completed(futures):
+                album = futures[future]
+                try:
+                    tracks += future.result()
+                except RuntimeError as exc:
+                    # RuntimeError is the convention's "abort this service" signal —
+                    # a rate-limit window, an unusable cache, a fetch that failed
+                    # rather than found nothing. Logging it here and carrying on
+                    # turns it straight back into a silently missing album, which
+                    # is the thing raising it was meant to stop.
+                    fatal_error = exc
+                    break
+                except Exception:
+                    logger.exception(
+                        f"{self.tag}  ! error fetching tracks for album '{album.name}' "
+                        f"(artist: {artist.name}), skipping"
+                    )
 
-        if fatal_error is not None:
-            # Drop whatever has not started yet. We are aborting because the
-            # service told us to stop — often a rate limit — so letting queued
-            # work carry on calling the same API is both pointless and rude.
-            # Already-running tasks cannot be interrupted; this is the same
-            # guarantee Service._shutdown_pools gives.
-            for pending in futures:
-                pending.cancel()
-            raise fatal_error
+            if fatal_error is not None:
+                # Drop whatever has not started yet. We are aborting because the
+                # service told us to stop — often a rate limit — so letting queued
+                # work carry on calling the same API is both pointless and rude.
+                # Already-running tasks cannot be interrupted; this is the same
+                # guarantee Service._shutdown_pools gives.
+                for pending in futures:
+                    pending.cancel()
+                raise fatal_error
 
         return tracks
 
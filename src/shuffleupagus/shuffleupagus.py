@@ -1,11 +1,14 @@
 import argparse
+import importlib
 import os
 import signal
 import threading
+from collections.abc import Callable
 
+from . import services
 from .core.config import Config
 from .core.model import Service, Track
-from .core.util import init_logging, load_plugins, logger
+from .core.util import init_logging, load_plugins, logger, plugin_names
 
 
 def _collect_service(
@@ -16,8 +19,15 @@ def _collect_service(
     artists = [service.sanitize_id(a) for a in config.service_artists(service.name)]
     excluded_albums = [service.sanitize_id(a) for a in config.excluded_albums(service.name)]
     excluded_tracks = [service.sanitize_id(a) for a in config.excluded_tracks(service.name)]
+    service.expire_ahead([service.sanitize_id(a) for a in config.vip_artists(service.name)])
 
-    return service.collect_tracks(artists, excluded_albums, excluded_tracks)
+    tracks = service.collect_tracks(artists, excluded_albums, excluded_tracks)
+    # Only once every artist has been collected, so each configured artist's
+    # entries are in the cache for the sweep to find and keep.
+    if service.config.get("cache-sweep-orphans"):
+        swept = service.sweep_orphans(artists)
+        logger.info(f"{service.tag}* swept {swept} cache entries no configured artist reaches")
+    return tracks
 
 
 def _finalize_service(
@@ -88,7 +98,95 @@ def _close_service(service: Service) -> None:
         logger.exception(f"{service.tag}! error closing service")
 
 
-def main():
+def _with_service(service_name: str, action: Callable[[Service, Config], int]) -> int:
+    """Run action on a service that knows its cache's keys, and close it.
+
+    The service is created, for its key layout and its sanitize_id, but never
+    logs in: nothing here reaches the network. Only its own plugin is
+    imported, so another service's platform dependencies need not be there.
+    """
+    config = Config()
+    plugin = importlib.import_module(f"{services.__name__}.{service_name}")
+    service = plugin.create(config)
+    try:
+        return action(service, config)
+    finally:
+        _close_service(service)
+
+
+def _cache_command(args) -> None:
+    """Export, import, invalidate or sweep one service's cache.
+
+    No service logs in: a snapshot is the cache file alone, which is what
+    lets a new runner start warm before it has any credentials set up. The
+    cache is still the service's, opened as its configuration says, so a
+    delete reaches the shared tier too.
+    """
+    try:
+        if args.cache_command == "sweep":
+            rows = _with_service(
+                args.service, lambda service, config: service.sweep_orphans(config.service_artists(service.name))
+            )
+            logger.info(f"* swept {rows} {args.service} cache entries no configured artist reaches")
+            return
+        if args.cache_command == "invalidate":
+            if args.artist is not None:
+                rows = _with_service(args.service, lambda service, _: service.invalidate_artist(args.artist))
+            else:
+                rows = _with_service(args.service, lambda service, _: service.cache.invalidate_prefix(args.prefix))
+            logger.info(f"* invalidated {rows} {args.service} cache entries")
+            return
+        if args.cache_command == "export":
+            rows = _with_service(args.service, lambda service, _: service.cache.export_snapshot(args.path))
+            logger.info(f"* exported {rows} {args.service} cache entries to {args.path}")
+        else:
+            rows = _with_service(
+                args.service, lambda service, _: service.cache.import_snapshot(args.path, merge=args.merge)
+            )
+            how = "merged" if args.merge else "imported"
+            logger.info(f"* {how} {rows} {args.service} cache entries from {args.path}")
+    except (RuntimeError, ValueError, OSError) as exc:
+        logger.error(f"! {exc}")
+        raise SystemExit(1) from exc
+
+
+def _add_cache_commands(commands) -> None:
+    cache_parser = commands.add_parser("cache", help="manage a service's cache")
+    cache_commands = cache_parser.add_subparsers(dest="cache_command", required=True)
+    export_parser = cache_commands.add_parser(
+        "export",
+        help="write a compressed snapshot of a service's cache",
+    )
+    export_parser.add_argument("service", choices=plugin_names())
+    export_parser.add_argument("path", help="where to write the snapshot")
+    import_parser = cache_commands.add_parser(
+        "import",
+        help="load a snapshot into a service's cache, replacing what is there",
+    )
+    import_parser.add_argument("service", choices=plugin_names())
+    import_parser.add_argument("path", help="a snapshot written by `cache export`")
+    import_parser.add_argument(
+        "--merge",
+        default=False,
+        action="store_true",
+        help="keep whichever copy of each entry was stored last instead of replacing the cache",
+    )
+    invalidate_parser = cache_commands.add_parser(
+        "invalidate",
+        help="drop cache entries so the next run fetches them again",
+    )
+    invalidate_parser.add_argument("service", choices=plugin_names())
+    target = invalidate_parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--prefix", help='every entry whose key starts with this, e.g. "album:" ("" for all)')
+    target.add_argument("--artist", help="one artist's entries, down to its album tracklists")
+    sweep_parser = cache_commands.add_parser(
+        "sweep",
+        help="drop the entries of artists no longer in the configuration and shrink the file",
+    )
+    sweep_parser.add_argument("service", choices=plugin_names())
+
+
+def _parser() -> argparse.ArgumentParser:
 
     parser = argparse.ArgumentParser(
         prog="Shuffleupagus",
@@ -117,11 +215,20 @@ def main():
         default=None,
         help="comma-separated list of services to run (e.g. spotify,youtube)",
     )
+    _add_cache_commands(parser.add_subparsers(dest="command"))
+    return parser
+
 
+def main():
+    parser = _parser()
     args = parser.parse_args()
 
     init_logging(args.log_level)
 
+    if args.command == "cache":
+        _cache_command(args)
+        return
+
     only = None
     if args.only_services:
         only = [s.strip() for s in args.only_services.split(",")]
@@ -10,6 +10,7 @@ from shuffleupagus.core.apiresponse import (
     api_int,
     api_list,
     api_object,
+    api_project,
     api_str,
 )
 
@@ -204,3 +205,44 @@ def test_api_array_names_what_and_the_service():
     assert "artist albums" in str(excinfo.value)
     assert SERVICE in str(excinfo.value)
     assert "int" in str(excinfo.value)
+
+
+# --- api_project ---
+
+
+def test_api_project_keeps_only_the_named_fields():
+    payload = {"id": "1", "name": "A", "images": [{"url": "x"}], "popularity": 50}
+    assert api_project(payload, {"id": None, "name": None}, SERVICE) == {"id": "1", "name": "A"}
+
+
+def test_api_project_walks_into_objects_and_lists():
+    payload = {"data": [{"id": "1", "attributes": {"name": "A", "artwork": {}}, "href": "/v1"}], "next": None}
+    fields = {"data": [{"id": None, "attributes": {"name": None}}]}
+    assert api_project(payload, fields, SERVICE) == {"data": [{"id": "1", "attributes": {"name": "A"}}]}
+
+
+def test_api_project_leaves_out_what_is_missing():
+    assert api_project({"id": "1"}, {"id": None, "isrc": None}, SERVICE) == {"id": "1"}
+
+
+def test_api_project_keeps_a_field_holding_none():
+    assert api_project({"year": None, "title": "A"}, {"year": None}, SERVICE) == {"year": None}
+
+
+def test_api_project_changes_nothing_the_second_time():
+    fields = {"tracks": [{"id": None, "album": {"id": None}}]}
+    once = api_project({"tracks": [{"id": "1", "album": {"id": "a", "name": "A"}, "x": 1}]}, fields, SERVICE)
+    assert api_project(once, fields, SERVICE) == once
+
+
+@pytest.mark.parametrize(
+    ("payload", "fields", "message"),
+    [
+        ([], {"id": None}, "response is not an object"),
+        ({"data": {}}, {"data": [{"id": None}]}, "response.data is not a list"),
+        ({"data": [1]}, {"data": [{"id": None}]}, r"response.data\[\] entry is not an object"),
+    ],
+)
+def test_api_project_names_a_container_of_the_wrong_type(payload, fields, message):
+    with pytest.raises(ApiResponseError, match=message):
+        api_project(payload, fields, SERVICE)
@@ -18,6 +18,7 @@ from shuffleupagus.core.apiresponse import (
     api_int,
     api_list,
     api_object,
+    api_project,
     api_str,
 )
 
@@ -87,6 +88,25 @@ def test_api_object_returns_a_dict_or_raises(value):
         pytest.fail(f"api_object leaked {type(exc).__name__}: {exc}")
 
 
+# The nesting the services' projections use: objects, lists of objects, leaves.
+_fields = st.recursive(
+    st.none(),
+    lambda children: st.dictionaries(st.text(max_size=8), children, max_size=4) | children.map(lambda c: [c]),
+    max_leaves=8,
+)
+
+
+@given(payload=_json, fields=_fields)
+def test_api_project_raises_only_api_response_error_and_is_idempotent(payload, fields):
+    try:
+        once = api_project(payload, fields, SERVICE)
+    except ApiResponseError:
+        return
+    except _RAW as exc:
+        pytest.fail(f"api_project leaked {type(exc).__name__}: {exc}")
+    assert api_project(once, fields, SERVICE) == once
+
+
 @given(payload=_json, key=st.text(max_size=8))
 def test_api_has_always_answers_a_bool(payload, key):
     """api_has is total: it answers for every input and never raises."""
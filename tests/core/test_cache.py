@@ -1,17 +1,31 @@
+import asyncio
+import contextlib
+import json
 import os
 import re
+import socket
 import sqlite3
 import stat
 import threading
 import time
+from typing import Any
 
 import pytest
 
+from shuffleupagus.core.backend import MemoryBackend, RespBackend, StoredRow
 from shuffleupagus.core.cache import (
+    ABSENT,
+    CACHE_ABSENT_CUTOFF,
     CACHE_DEFAULT_CUTOFF,
+    UNCHANGED,
     Cache,
     CacheClosedError,
     CacheUnavailableError,
+    CatalogTrack,
+    Projection,
+    _human,
+    _prefix_end,
+    key_class,
 )
 
 
@@ -252,6 +266,7 @@ def test_close_takes_the_lock(cache):
         lambda c: c.delete("k"),
         lambda c: c.save(),
         lambda c: c._clean(),
+        lambda c: c.invalidate_prefix("k"),
     ],
 )
 def test_every_entry_point_names_the_cache_when_closed(cache, call):
@@ -353,6 +368,20 @@ class _BrokenConn:
         self.closed = True
 
 
+def _swap_conn(cache: Any, conn) -> None:
+    """Put conn behind the writer and behind every reader the cache opens from now on.
+
+    Idle readers are closed rather than dropped, for the reason _break_conn
+    gives. Tests are single-threaded, so one object standing in for both is
+    fine here.
+    """
+    for reader in cache._readers:
+        reader.close()
+    cache._readers.clear()
+    cache._conn = conn
+    cache._open_reader = lambda: conn
+
+
 def _break_conn(cache, error=None):
     """Swap in a failing connection, closing the real one first.
 
@@ -361,7 +390,7 @@ def _break_conn(cache, error=None):
     unraisable exception in whichever test happened to trigger the collection.
     """
     cache._conn.close()
-    cache._conn = _BrokenConn(error)
+    _swap_conn(cache, _BrokenConn(error))
     return cache
 
 
@@ -510,7 +539,8 @@ def test_required_read_raises_on_an_undecodable_value(cache):
 
 def test_a_programming_error_is_not_degraded(cache):
     broken = _BrokenConn(sqlite3.ProgrammingError("Incorrect number of bindings supplied"))
-    real, cache._conn = cache._conn, broken
+    real = cache._conn
+    _swap_conn(cache, broken)
     try:
         with pytest.raises(sqlite3.ProgrammingError):
             cache.read("key1")
@@ -518,7 +548,7 @@ def test_a_programming_error_is_not_degraded(cache):
     finally:
         # Put the working connection back, or the fixture's own teardown hits
         # the same error and reports it as a fixture failure.
-        cache._conn = real
+        _swap_conn(cache, real)
 
 
 # --- the cache goes cold, not flaky ---
@@ -527,12 +557,13 @@ def test_a_programming_error_is_not_degraded(cache):
 def test_no_statement_is_issued_once_degraded(cache):
     _break_conn(cache)
     cache.read("key1")
-    cache._conn = _CountingConn()
+    _swap_conn(cache, _CountingConn())
     assert cache.read("key1") is None
     assert cache.write("key1", {"a": 1}) == {"a": 1}
     assert cache.touch("key1") is False
     assert cache.delete("key1") is False
     assert cache._clean() == 0
+    assert cache.invalidate_prefix("") == 0
     assert cache._conn.calls == 0
 
 
@@ -559,7 +590,7 @@ class _CountingConn:
 def test_a_second_different_failure_is_still_reported(cache, capsys):
     _break_conn(cache, sqlite3.OperationalError("database is locked"))
     cache.read("a")
-    cache._conn = _BrokenConn(sqlite3.DatabaseError("database disk image is malformed"))
+    _swap_conn(cache, _BrokenConn(sqlite3.DatabaseError("database disk image is malformed")))
     cache._degraded = False
     cache.read("b")
     out = capsys.readouterr().out
@@ -951,3 +982,2248 @@ def test_a_subdirectory_name_stays_inside_the_root(cache_root):
     arbitrary one, which is the distinction #76 turns on.
     """
     assert _named("sub/inner")._db_path() == str(cache_root / "sub" / "inner.db")
+
+
+# --- batched reads and prefetch -----------------------------------------------
+
+
+class _StatementCounter:
+    """Passes every call through to a real connection, counting statements."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.statements = 0
+        self.seen: list[str] = []
+
+    def execute(self, *args, **kwargs):
+        self.statements += 1
+        self.seen.append(args[0])
+        return self.conn.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        self.statements += 1
+        return self.conn.executemany(*args, **kwargs)
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+def _count_statements(cache) -> _StatementCounter:
+    counter = _StatementCounter(cache._conn)
+    _swap_conn(cache, counter)
+    return counter
+
+
+def test_read_many_answers_fresh_keys_only(cache):
+    cache.write("a", 1)
+    cache.write("b", {"two": 2})
+    _inject_stale(cache, "old", "stale", ttl=60.0, age=3600)
+    assert cache.read_many(["a", "b", "old", "ghost"]) == {"a": 1, "b": {"two": 2}}
+
+
+def test_read_many_is_one_statement(cache):
+    for i in range(10):
+        cache.write(f"k{i}", i)
+    counter = _count_statements(cache)
+    assert len(cache.read_many([f"k{i}" for i in range(10)])) == 10
+    assert counter.statements == 1
+
+
+def test_read_many_splits_a_key_list_sqlite_would_refuse(cache):
+    import shuffleupagus.core.cache as cache_mod
+
+    keys = [f"k{i}" for i in range(cache_mod._IN_CHUNK * 2 + 1)]
+    for key in keys:
+        cache.write(key, key)
+    counter = _count_statements(cache)
+    assert cache.read_many(keys) == {key: key for key in keys}
+    assert counter.statements == 3
+
+
+def test_read_many_of_nothing_issues_no_statement(cache):
+    counter = _count_statements(cache)
+    assert cache.read_many([]) == {}
+    assert counter.statements == 0
+
+
+def test_read_many_survives_a_database_error(broken_cache):
+    assert broken_cache.read_many(["a", "b"]) == {}
+
+
+def test_required_read_many_raises_instead_of_missing(broken_cache):
+    with pytest.raises(CacheUnavailableError):
+        broken_cache.read_many(["a"], required=True)
+
+
+def test_read_many_survives_a_corrupt_json_value(cache):
+    cache.write("good", 1)
+    cache._conn.execute(
+        "INSERT INTO cache (key, value, stored_at, ttl) VALUES ('bad', '{nope', ?, 3600)", (time.time(),)
+    )
+    cache._conn.commit()
+    assert cache.read_many(["good", "bad"]) == {}
+    assert cache._degraded
+
+
+def test_prefetched_reads_issue_no_statement(cache):
+    cache.write("a", 1)
+    cache.write("b", 2)
+    assert cache.prefetch(["a", "b", "ghost"]) == {"a": 1, "b": 2}
+    counter = _count_statements(cache)
+    assert cache.read("a") == 1
+    assert cache.read_stale("b") == 2
+    assert counter.statements == 0
+
+
+def test_a_prefetched_row_is_handed_out_once(cache):
+    cache.write("a", 1)
+    cache.prefetch(["a"])
+    cache.read("a")
+    counter = _count_statements(cache)
+    assert cache.read("a") == 1
+    assert counter.statements == 1
+
+
+def test_prefetch_returns_expired_rows_for_the_stale_read_that_follows(cache):
+    _inject_stale(cache, "old", "stale", ttl=60.0, age=3600)
+    assert cache.prefetch(["old"]) == {"old": "stale"}
+    counter = _count_statements(cache)
+    assert cache.read("old") is None
+    assert cache.read_stale("old") == "stale"
+    assert counter.statements == 0
+
+
+def test_a_write_after_prefetch_wins(cache):
+    cache.write("a", "old")
+    cache.prefetch(["a"])
+    cache.write("a", "new")
+    assert cache.read("a") == "new"
+
+
+def test_a_delete_after_prefetch_wins(cache):
+    cache.write("a", "old")
+    cache.prefetch(["a"])
+    cache.delete("a")
+    assert cache.read_stale("a") is None
+
+
+def test_touch_after_prefetch_is_seen_by_read(cache):
+    _inject_stale(cache, "old", "val", ttl=60.0, age=3600)
+    cache.prefetch(["old"])
+    cache.touch("old")
+    assert cache.read("old") == "val"
+
+
+def test_prefetch_holds_a_bounded_number_of_rows(cache, monkeypatch):
+    import shuffleupagus.core.cache as cache_mod
+
+    monkeypatch.setattr(cache_mod, "_STAGE_LIMIT", 3)
+    for i in range(5):
+        cache.write(f"k{i}", i)
+    cache.prefetch([f"k{i}" for i in range(5)])
+    assert list(cache._staged) == ["k2", "k3", "k4"]
+
+
+def test_prefetch_survives_a_database_error(broken_cache):
+    assert broken_cache.prefetch(["a"]) == {}
+
+
+def test_prefetch_after_close_raises(cache):
+    cache.close()
+    with pytest.raises(CacheClosedError):
+        cache.prefetch(["a"])
+
+
+# --- grouped commits: batch() and write-behind ----------------------------------
+
+
+def _on_disk(cache, key):
+    """What another connection sees, which is only what has been committed."""
+    other = sqlite3.connect(cache._db_path())
+    try:
+        row = other.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+    finally:
+        other.close()
+    return None if row is None else row[0]
+
+
+def test_batch_commits_once_at_the_end(cache):
+    with cache.batch():
+        cache.write("a", 1)
+        cache.write("b", 2)
+        assert _on_disk(cache, "a") is None
+        assert cache.read("a") == 1
+    assert _on_disk(cache, "a") == "1"
+    assert _on_disk(cache, "b") == "2"
+
+
+def test_nested_batches_commit_when_the_outer_one_exits(cache):
+    with cache.batch():
+        with cache.batch():
+            cache.write("a", 1)
+        assert _on_disk(cache, "a") is None
+    assert _on_disk(cache, "a") == "1"
+
+
+def _write_then_fail(cache):
+    with cache.batch():
+        cache.write("a", 1)
+        raise ValueError("boom")
+
+
+def test_batch_commits_when_its_body_raises(cache):
+    with pytest.raises(ValueError, match="boom"):
+        _write_then_fail(cache)
+    assert _on_disk(cache, "a") == "1"
+
+
+def test_a_required_write_inside_a_batch_commits_immediately(cache):
+    with cache.batch():
+        cache.write("pending", 1)
+        cache.write("rate_limit_until", 123.0, required=True)
+        assert _on_disk(cache, "rate_limit_until") == "123.0"
+        # Committing early takes what was pending along with it.
+        assert _on_disk(cache, "pending") == "1"
+
+
+def test_batch_groups_touch_and_delete(cache):
+    cache.write("a", 1)
+    cache.write("b", 2)
+    with cache.batch():
+        cache.delete("a")
+        cache.touch("b")
+        assert _on_disk(cache, "a") == "1"
+    assert _on_disk(cache, "a") is None
+
+
+def test_a_long_batch_still_commits_in_bounded_groups(cache, monkeypatch):
+    import shuffleupagus.core.cache as cache_mod
+
+    monkeypatch.setattr(cache_mod, "_GROUP_LIMIT", 3)
+    with cache.batch():
+        for i in range(3):
+            cache.write(f"k{i}", i)
+        assert _on_disk(cache, "k0") == "0"
+        cache.write("k3", 3)
+        assert _on_disk(cache, "k3") is None
+
+
+def test_a_batch_on_a_closed_cache_raises(cache):
+    cache.close()
+    with pytest.raises(CacheClosedError), cache.batch():
+        pass
+
+
+def test_closing_inside_a_batch_keeps_what_was_written(cache):
+    with cache.batch():
+        cache.write("a", 1)
+        cache.close()
+    assert _on_disk(cache, "a") == "1"
+
+
+@pytest.fixture
+def behind_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(Cache, "_db_path", lambda self: str(tmp_path / f"{self.name}.db"))
+    with Cache("behind", write_behind=3) as c:
+        yield c
+
+
+def test_write_behind_commits_in_groups(behind_cache):
+    behind_cache.write("a", 1)
+    behind_cache.write("b", 2)
+    assert _on_disk(behind_cache, "a") is None
+    assert behind_cache.read("a") == 1
+    behind_cache.write("c", 3)
+    assert _on_disk(behind_cache, "a") == "1"
+
+
+def test_write_behind_commits_an_old_group_early(behind_cache, monkeypatch):
+    import shuffleupagus.core.cache as cache_mod
+
+    behind_cache.write("a", 1)
+    monkeypatch.setattr(cache_mod, "_GROUP_SECONDS", 0.0)
+    behind_cache.write("b", 2)
+    assert _on_disk(behind_cache, "a") == "1"
+
+
+@pytest.mark.parametrize("in_batch", [False, True])
+def test_a_group_commits_on_its_age_with_no_change_after_it(behind_cache, monkeypatch, in_batch):
+    import shuffleupagus.core.cache as cache_mod
+
+    monkeypatch.setattr(cache_mod, "_GROUP_SECONDS", 0.05)
+    with contextlib.ExitStack() as stack:
+        if in_batch:
+            stack.enter_context(behind_cache.batch())
+        behind_cache.write("a", 1)
+        deadline = time.monotonic() + 5
+        while _on_disk(behind_cache, "a") is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert _on_disk(behind_cache, "a") == "1"
+        assert behind_cache._pending == 0
+
+
+def test_write_behind_still_commits_required_writes_immediately(behind_cache):
+    behind_cache.write("rate_limit_until", 1.0, required=True)
+    assert _on_disk(behind_cache, "rate_limit_until") == "1.0"
+
+
+def test_save_commits_what_write_behind_is_holding(behind_cache):
+    behind_cache.write("a", 1)
+    behind_cache.save()
+    assert _on_disk(behind_cache, "a") == "1"
+
+
+def test_close_commits_what_write_behind_is_holding(tmp_path, monkeypatch):
+    monkeypatch.setattr(Cache, "_db_path", lambda self: str(tmp_path / f"{self.name}.db"))
+    c = Cache("behind", write_behind=100)
+    c.write("a", 1)
+    c.close()
+    with Cache("behind") as reopened:
+        assert reopened.read("a") == 1
+
+
+def test_a_failed_group_commit_degrades(behind_cache):
+    behind_cache.write("a", 1)
+    _break_conn(behind_cache)
+    with behind_cache.batch():
+        pass
+    assert behind_cache._degraded
+
+
+# --- the in-memory tier -----------------------------------------------------------
+
+
+@pytest.fixture
+def memory_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(Cache, "_db_path", lambda self: str(tmp_path / f"{self.name}.db"))
+    with Cache("memory", memory_entries=3) as c:
+        yield c
+
+
+def test_a_remembered_read_issues_no_statement(memory_cache):
+    memory_cache.write("a", {"x": 1})
+    first = memory_cache.read("a")
+    counter = _count_statements(memory_cache)
+    assert memory_cache.read("a") is first
+    assert memory_cache.read_stale("a") is first
+    assert counter.statements == 0
+
+
+def test_the_tier_is_off_by_default(cache):
+    cache.write("a", 1)
+    cache.read("a")
+    assert not cache._memory
+
+
+def test_a_remembered_entry_still_expires(memory_cache, monkeypatch):
+    memory_cache.write("a", "v", ttl=60.0)
+    memory_cache.read("a")
+    later = time.time() + 120
+    monkeypatch.setattr(time, "time", lambda: later)
+    assert memory_cache.read("a") is None
+    assert memory_cache.read_stale("a") == "v"
+
+
+def test_read_stale_remembers_an_expired_row_without_reviving_it(memory_cache):
+    _inject_stale(memory_cache, "old", "v", ttl=60.0, age=3600)
+    assert memory_cache.read_stale("old") == "v"
+    assert "old" in memory_cache._memory
+    assert memory_cache.read("old") is None
+
+
+def test_a_write_replaces_the_remembered_value(memory_cache):
+    memory_cache.write("a", 1)
+    memory_cache.read("a")
+    memory_cache.write("a", 2)
+    assert memory_cache.read("a") == 2
+
+
+def test_a_delete_forgets_the_remembered_value(memory_cache):
+    memory_cache.write("a", 1)
+    memory_cache.read("a")
+    memory_cache.delete("a")
+    assert memory_cache.read("a") is None
+    assert memory_cache.read_stale("a") is None
+
+
+def test_a_touch_is_seen_through_the_remembered_value(memory_cache):
+    _inject_stale(memory_cache, "old", "v", ttl=60.0, age=3600)
+    memory_cache.read_stale("old")
+    memory_cache.touch("old")
+    assert memory_cache.read("old") == "v"
+
+
+def test_the_least_recently_used_entry_goes_first(memory_cache):
+    for key in ("a", "b", "c"):
+        memory_cache.write(key, key)
+        memory_cache.read(key)
+    memory_cache.read("a")
+    memory_cache.write("d", "d")
+    memory_cache.read("d")
+    assert list(memory_cache._memory) == ["c", "a", "d"]
+
+
+def test_a_byte_budget_bounds_the_tier(tmp_path, monkeypatch):
+    monkeypatch.setattr(Cache, "_db_path", lambda self: str(tmp_path / f"{self.name}.db"))
+    with Cache("bytes", memory_bytes=10) as c:
+        c.write("small", "abc")  # stored as '"abc"', five bytes
+        c.write("other", "xyz")
+        c.write("huge", "x" * 50)
+        for key in ("small", "other", "huge"):
+            c.read(key)
+        assert list(c._memory) == ["small", "other"]
+        assert c._memory_size == 10
+
+
+def test_a_value_changed_while_decoding_is_not_remembered(memory_cache):
+    memory_cache.write("a", 1)
+    generation = memory_cache._generation
+    memory_cache.write("a", 2)
+    memory_cache._remember("a", 1, time.time() + 60.0, "1", generation)
+    assert "a" not in memory_cache._memory
+
+
+def test_a_corrupt_timestamp_is_not_remembered(memory_cache):
+    memory_cache._remember("a", 1, "not a time", "1", memory_cache._generation)
+    assert "a" not in memory_cache._memory
+
+
+def test_read_many_answers_from_memory_first(memory_cache):
+    memory_cache.write("a", 1)
+    memory_cache.write("b", 2)
+    memory_cache.read("a")
+    counter = _count_statements(memory_cache)
+    assert memory_cache.read_many(["a", "b"]) == {"a": 1, "b": 2}
+    assert counter.statements == 1
+    assert set(memory_cache._memory) == {"a", "b"}
+
+
+def test_prefetch_skips_what_memory_already_holds(memory_cache):
+    memory_cache.write("a", 1)
+    memory_cache.read("a")
+    assert memory_cache.prefetch(["a"]) == {"a": 1}
+    assert memory_cache._staged == {}
+
+
+def test_eviction_forgets_what_it_removed(memory_cache):
+    _inject_stale(memory_cache, "old", "v", ttl=60.0, age=3600)
+    memory_cache.read_stale("old")
+    memory_cache._clean()
+    assert memory_cache.read_stale("old") is None
+
+
+def test_a_degraded_cache_does_not_answer_from_memory(memory_cache):
+    memory_cache.write("a", 1)
+    memory_cache.read("a")
+    _break_conn(memory_cache)
+    memory_cache.write("b", 2)
+    assert memory_cache.read("a") is None
+
+
+# --- compressed values --------------------------------------------------------------
+
+
+def _stored(cache, key):
+    return cache._conn.execute("SELECT value, codec FROM cache WHERE key = ?", (key,)).fetchone()
+
+
+_LARGE = {"tracks": [{"title": f"Track {i}", "album": "Same Album"} for i in range(200)]}
+
+
+def test_a_large_value_is_stored_compressed(cache):
+    cache.write("big", _LARGE)
+    value, codec = _stored(cache, "big")
+    assert codec == 1
+    assert isinstance(value, bytes)
+    assert len(value) < len(json.dumps(_LARGE)) / 4
+    assert cache.read("big") == _LARGE
+    assert cache.read_stale("big") == _LARGE
+    assert cache.read_many(["big"]) == {"big": _LARGE}
+
+
+def test_a_short_value_is_stored_plain(cache):
+    cache.write("small", {"id": "abc"})
+    assert _stored(cache, "small") == ('{"id": "abc"}', 0)
+
+
+def test_prefetch_holds_compressed_rows_as_stored(cache):
+    cache.write("big", _LARGE)
+    assert cache.prefetch(["big"]) == {"big": _LARGE}
+    assert cache._staged["big"][1] == 1
+    assert cache.read("big") == _LARGE
+
+
+def test_a_database_from_before_compression_is_migrated_in_place(tmp_path, monkeypatch):
+    monkeypatch.setattr(Cache, "_db_path", lambda self: str(tmp_path / f"{self.name}.db"))
+    conn = sqlite3.connect(tmp_path / "old.db")
+    conn.execute(
+        "CREATE TABLE cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL, ttl REAL NOT NULL)"
+    )
+    conn.execute("INSERT INTO cache VALUES ('k', ?, ?, 3600)", (json.dumps(_LARGE), time.time()))
+    conn.commit()
+    conn.close()
+    with Cache("old") as c:
+        assert c.read("k") == _LARGE
+        c.write("k", _LARGE)
+        assert _stored(c, "k")[1] == 1
+    # And a second open finds the work done.
+    with Cache("old") as c:
+        assert c.read("k") == _LARGE
+
+
+def test_a_corrupt_compressed_value_degrades_to_a_miss(cache, capsys):
+    cache.write("big", _LARGE)
+    cache._conn.execute("UPDATE cache SET value = ? WHERE key = 'big'", (b"not zlib",))
+    cache._conn.commit()
+    capsys.readouterr()
+    assert cache.read("big") is None
+    assert "unusable" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("codec", [7, "zlib"])
+def test_an_unknown_codec_degrades_to_a_miss(cache, codec):
+    """What a database written by some later version would hand back."""
+    assert cache._expand("1", codec) is None
+    assert cache._degraded
+
+
+def test_an_unreadable_compressed_value_raises_when_required(cache):
+    with pytest.raises(CacheUnavailableError):
+        cache._expand(b"not zlib", 1, required=True)
+
+
+def test_the_memory_tier_counts_uncompressed_size(memory_cache):
+    memory_cache.write("big", _LARGE)
+    memory_cache.read("big")
+    assert memory_cache._memory_size == len(json.dumps(_LARGE))
+
+
+# --- reads on pooled reader connections -------------------------------------------
+
+
+class _GatedReader:
+    """A reader whose statements wait at a gate, so a test can hold a read in flight."""
+
+    def __init__(self, conn, gate):
+        self.conn = conn
+        self.gate = gate
+        self.closed = False
+
+    def execute(self, *args, **kwargs):
+        self.gate()
+        return self.conn.execute(*args, **kwargs)
+
+    def close(self):
+        self.closed = True
+        self.conn.close()
+
+
+def _gate_readers(cache: Any, gate) -> list[_GatedReader]:
+    opened: list[_GatedReader] = []
+    real_open = cache._open_reader
+
+    def open_gated():
+        opened.append(_GatedReader(real_open(), gate))
+        return opened[-1]
+
+    cache._open_reader = open_gated
+    return opened
+
+
+def test_a_read_runs_on_a_reader_rather_than_the_writer(cache):
+    cache.write("k", "v")
+    assert cache.read("k") == "v"
+    assert len(cache._readers) == 1
+    assert cache._readers[0] is not cache._conn
+
+
+def test_readers_are_reused(cache):
+    cache.write("k", "v")
+    for _ in range(5):
+        cache.read("k")
+        cache.read_stale("k")
+        cache.read_many(["k"])
+    assert len(cache._readers) == 1
+
+
+def test_reads_run_in_parallel(cache):
+    """Two reads meet inside their SELECTs, which one connection under one lock cannot do."""
+    cache.write("k", "v")
+    barrier = threading.Barrier(2, timeout=5)
+    _gate_readers(cache, barrier.wait)
+    results: list = []
+    threads = [threading.Thread(target=lambda: results.append(cache.read("k"))) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=10)
+    assert results == ["v", "v"]
+    assert len(cache._readers) == 2
+
+
+def test_a_reader_cannot_write(cache):
+    reader = cache._open_reader()
+    try:
+        with pytest.raises(sqlite3.OperationalError):
+            reader.execute("DELETE FROM cache")
+    finally:
+        reader.close()
+
+
+def test_a_reader_that_will_not_open_degrades_to_a_miss(cache):
+    def refuse():
+        raise sqlite3.OperationalError("unable to open database file")
+
+    cache.write("k", "v")
+    cache._open_reader = refuse
+    assert cache.read("k") is None
+    assert cache._degraded
+    assert cache._reading == 0
+
+
+def test_reads_see_what_a_batch_has_not_committed(cache):
+    cache.write("gone", 1)
+    cache.write("aged", 2, ttl=60.0)
+    cache._conn.execute("UPDATE cache SET stored_at = ? WHERE key = 'aged'", (time.time() - 3600,))
+    cache._conn.commit()
+    with cache.batch():
+        cache.write("new", 3)
+        cache.delete("gone")
+        cache.touch("aged")
+        assert _on_disk(cache, "new") is None
+        assert cache.read("new") == 3
+        assert cache.read_many(["new", "gone", "aged"]) == {"new": 3, "aged": 2}
+        assert cache.read("gone") is None
+        assert cache.read_stale("gone") is None
+        assert cache.read("aged") == 2
+    assert cache._unflushed == {}
+
+
+def test_close_waits_for_a_read_in_flight(cache):
+    cache.write("k", "v")
+    entered = threading.Event()
+    release = threading.Event()
+
+    def hold():
+        entered.set()
+        release.wait(5)
+
+    opened = _gate_readers(cache, hold)
+    results: list = []
+    reader = threading.Thread(target=lambda: results.append(cache.read("k")))
+    reader.start()
+    assert entered.wait(5)
+    closer = threading.Thread(target=cache.close)
+    closer.start()
+    closer.join(timeout=0.2)
+    assert closer.is_alive(), "close() did not wait for the read"
+    # Closing has begun, so nothing new starts.
+    with pytest.raises(CacheClosedError):
+        cache.read("k")
+    release.set()
+    reader.join(timeout=5)
+    closer.join(timeout=5)
+    assert results == ["v"]
+    assert cache.closed
+    assert opened[0].closed
+
+
+def test_a_failed_reader_close_leaves_the_cache_open_for_a_retry(cache):
+    cache.write("k", "v")
+    cache.read("k")
+    real = cache._readers[0]
+    attempts = []
+
+    class _RaisingClose:
+        def close(self):
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise sqlite3.OperationalError("disk I/O error")
+            real.close()
+
+    cache._readers[0] = _RaisingClose()
+    cache.close()
+    assert not cache.closed
+    assert not cache._closing
+    cache.close()
+    assert cache.closed
+    assert len(attempts) == 2
+
+
+# --- schema v2: expires_at, WITHOUT ROWID, chunked eviction ----------------------------
+
+
+def _schema(cache):
+    return cache._conn.execute("SELECT sql FROM sqlite_master WHERE name = 'cache'").fetchone()[0]
+
+
+def test_a_new_database_is_created_at_the_current_version(cache):
+    assert cache._conn.execute("PRAGMA user_version").fetchone()[0] == 5
+    assert "WITHOUT ROWID" in _schema(cache)
+
+
+def test_a_versioned_database_from_before_compression_is_copied_across(tmp_path, monkeypatch):
+    monkeypatch.setattr(Cache, "_db_path", lambda self: str(tmp_path / f"{self.name}.db"))
+    conn = sqlite3.connect(tmp_path / "old.db")
+    conn.execute(
+        "CREATE TABLE cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL, ttl REAL NOT NULL, "
+        "codec INTEGER NOT NULL DEFAULT 0)"
+    )
+    conn.execute("INSERT INTO cache VALUES ('fresh', '1', ?, 3600, 0)", (time.time(),))
+    conn.execute("INSERT INTO cache VALUES ('old', '2', ?, 60, 0)", (time.time() - 3600,))
+    conn.commit()
+    conn.close()
+    with Cache("old") as c:
+        assert "WITHOUT ROWID" in _schema(c)
+        assert c.read("fresh") == 1
+        assert c.read("old") is None
+        assert c.read_stale("old") == 2
+
+
+def test_expires_at_follows_stored_at(cache):
+    """Backdating stored_at, as every staleness test here does, is enough to expire a row."""
+    cache.write("k", "v", ttl=60.0)
+    cache._conn.execute("UPDATE cache SET stored_at = stored_at - 3600 WHERE key = 'k'")
+    cache._conn.commit()
+    assert cache.read("k") is None
+    cache.touch("k")
+    assert cache.read("k") == "v"
+
+
+def test_a_database_from_a_newer_version_degrades(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(Cache, "_db_path", lambda self: str(tmp_path / f"{self.name}.db"))
+    conn = sqlite3.connect(tmp_path / "future.db")
+    conn.execute("PRAGMA user_version = 99")
+    conn.close()
+    with Cache("future") as c:
+        assert c._degraded
+        assert c.read("k") is None
+    assert "newer" in capsys.readouterr().out
+
+
+def test_a_failed_migration_leaves_the_old_table_whole(tmp_path, monkeypatch):
+    import shuffleupagus.core.cache as cache_mod
+
+    monkeypatch.setattr(Cache, "_db_path", lambda self: str(tmp_path / f"{self.name}.db"))
+    conn = sqlite3.connect(tmp_path / "old.db")
+    conn.execute("CREATE TABLE cache (key TEXT PRIMARY KEY, value TEXT, stored_at REAL, ttl REAL)")
+    conn.execute("INSERT INTO cache VALUES ('k', '1', ?, 3600)", (time.time(),))
+    conn.commit()
+    monkeypatch.setattr(cache_mod, "_SCHEMA", cache_mod._SCHEMA + " NOT VALID SQL")
+    with Cache("old") as c:
+        assert c._degraded
+    assert conn.execute("SELECT value FROM cache").fetchall() == [("1",)]
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == 0
+    conn.close()
+
+
+def test_eviction_is_a_range_on_the_expires_at_index(cache):
+    plan = cache._conn.execute(
+        "EXPLAIN QUERY PLAN SELECT key FROM cache WHERE expires_at < ? LIMIT ?", (time.time(), 10)
+    ).fetchall()
+    assert any("cache_expires_at" in row[-1] for row in plan)
+
+
+def test_eviction_runs_in_chunks(cache, monkeypatch):
+    import shuffleupagus.core.cache as cache_mod
+
+    monkeypatch.setattr(cache_mod, "_EVICT_CHUNK", 2)
+    for i in range(5):
+        _inject_stale(cache, f"old{i}", i, ttl=60.0, age=3600)
+    cache.write("fresh", 1)
+    counter = _count_statements(cache)
+    assert cache._clean() == 5
+    assert counter.statements == 3
+    assert cache.read("fresh") == 1
+
+
+def test_a_limited_eviction_stops_early(cache):
+    for i in range(5):
+        _inject_stale(cache, f"old{i}", i, ttl=60.0, age=3600)
+    assert cache._clean(limit=3) == 3
+    assert cache._clean() == 2
+
+
+def test_eviction_drops_held_rows_only_when_expired(cache):
+    cache.write("fresh", 1)
+    _inject_stale(cache, "old", 2, ttl=60.0, age=3600)
+    cache.prefetch(["fresh", "old"])
+    cache._clean()
+    assert set(cache._staged) == {"fresh"}
+
+
+def test_background_eviction_empties_expired_rows_while_the_run_goes_on(tmp_path, monkeypatch):
+    monkeypatch.setattr(Cache, "_db_path", lambda self: str(tmp_path / f"{self.name}.db"))
+    with Cache("trickle") as c:
+        _inject_stale(c, "old", 1, ttl=60.0, age=3600)
+    c = Cache("trickle", evict_interval=0.01)
+    try:
+        deadline = time.monotonic() + 5
+        while c.read_stale("old") is not None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert c.read_stale("old") is None
+    finally:
+        c.close()
+    assert c._evictor is not None
+    assert not c._evictor.is_alive()
+
+
+def test_background_eviction_stops_quietly_when_the_cache_closes(cache):
+    cache.close()
+    cache._stop.clear()
+    cache._evict_in_background(0.001)  # returns on CacheClosedError rather than raising
+
+
+# --- statistics ---
+
+
+@pytest.mark.parametrize(
+    ("key", "expected"),
+    [("artist:X", "artist:"), ("artist:X:albums", "artist:"), ("album:Y:tracks", "album:"), ("ratelimit", "ratelimit")],
+)
+def test_key_class_is_everything_up_to_the_first_colon(key, expected):
+    assert key_class(key) == expected
+
+
+def test_reads_are_counted_as_hits_misses_or_expired(cache):
+    cache.write("artist:a", 1)
+    _inject_stale(cache, "artist:b", 2, ttl=60.0, age=3600)
+    assert cache.read("artist:a") == 1
+    assert cache.read("artist:b") is None
+    assert cache.read("album:c") is None
+    stats = cache.stats()
+    assert stats["artist:"]["hits"] == 1
+    assert stats["artist:"]["expired"] == 1
+    assert stats["album:"] == {"misses": 1}
+
+
+def test_a_disk_read_counts_the_bytes_it_read(cache):
+    cache.write("artist:a", {"x": 1})
+    stored = _stored(cache, "artist:a")[0]
+    cache.read("artist:a")
+    assert cache.stats()["artist:"]["bytes_read"] == len(stored)
+    assert cache.stats()["artist:"]["bytes_written"] == len(stored)
+
+
+def test_a_remembered_read_counts_a_hit_but_no_bytes(memory_cache):
+    memory_cache.write("artist:a", {"x": 1})
+    memory_cache.read("artist:a")
+    memory_cache.read("artist:a")
+    counts = memory_cache.stats()["artist:"]
+    assert counts["hits"] == 2
+    assert counts["bytes_read"] == len(_stored(memory_cache, "artist:a")[0])
+
+
+def test_prefetch_counts_the_bytes_and_the_reads_after_it_count_the_hits(cache):
+    cache.write("album:a", [1, 2])
+    cache.prefetch(["album:a"])
+    assert cache.stats()["album:"].get("hits") is None
+    cache.read("album:a")
+    counts = cache.stats()["album:"]
+    assert counts["hits"] == 1
+    assert counts["bytes_read"] == len(_stored(cache, "album:a")[0])
+
+
+def test_read_many_counts_each_key_like_a_read(cache):
+    cache.write("artist:a", 1)
+    _inject_stale(cache, "artist:b", 2, ttl=60.0, age=3600)
+    cache.read_many(["artist:a", "artist:b", "artist:c"])
+    counts = cache.stats()["artist:"]
+    assert (counts["hits"], counts["expired"], counts["misses"]) == (1, 1, 1)
+    assert counts["bytes_read"] == 2
+
+
+def test_stale_reads_and_touches_are_counted(cache):
+    _inject_stale(cache, "artist:a", 1, ttl=60.0, age=3600)
+    assert cache.read_stale("artist:a") == 1
+    assert cache.touch("artist:a") is True
+    assert cache.touch("artist:missing") is False
+    counts = cache.stats()["artist:"]
+    assert counts["stale"] == 1
+    assert counts["touches"] == 1
+
+
+def test_summary_prints_one_line_per_key_class(cache):
+    cache.write("artist:a", 1)
+    cache.read("artist:a")
+    cache.read("artist:b")
+    cache.read("album:c")
+    assert cache.summary() == [
+        "album: 0 hits, 1 misses, 0 expired (0% fresh); 0 served stale, 0 extended, 0 written; 0 B read, 0 B written",
+        "artist: 1 hits, 1 misses, 0 expired (50% fresh); 0 served stale, 0 extended, 1 written; 1 B read, 1 B written",
+    ]
+
+
+def test_stats_outlive_the_cache(cache):
+    cache.write("artist:a", 1)
+    cache.close()
+    assert cache.stats()["artist:"]["writes"] == 1
+
+
+@pytest.mark.parametrize(("size", "text"), [(999, "999 B"), (1500, "1.5 kB"), (2_500_000, "2.5 MB")])
+def test_human_sizes(size, text):
+    assert _human(size) == text
+
+
+# --- size cap: least recently used out, space given back ----------------------------
+
+
+_ROW = "x" * 400  # stored as 402 characters of JSON, below the compression threshold
+
+
+@pytest.fixture
+def capped_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(Cache, "_db_path", lambda self: str(tmp_path / f"{self.name}.db"))
+    with Cache("capped", max_bytes=1000) as c:
+        yield c
+
+
+def _last_used(cache, key, at):
+    cache._conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (at, key))
+    cache._conn.commit()
+
+
+def _keys(cache):
+    return {row[0] for row in cache._conn.execute("SELECT key FROM cache")}
+
+
+def test_a_row_is_sized_as_key_plus_stored_value(capped_cache):
+    capped_cache.write("k", _ROW)
+    assert capped_cache._conn.execute("SELECT size FROM cache").fetchone()[0] == 1 + 402
+
+
+def test_save_drops_the_least_recently_used_rows_until_the_rest_fit(capped_cache):
+    for at, key in enumerate(["a", "b", "c", "d"]):
+        capped_cache.write(key, _ROW)
+        _last_used(capped_cache, key, at)
+    assert capped_cache._trim() == 2
+    assert _keys(capped_cache) == {"c", "d"}
+
+
+def test_a_read_counts_as_a_use(capped_cache):
+    for at, key in enumerate(["a", "b", "c"]):
+        capped_cache.write(key, _ROW)
+        _last_used(capped_cache, key, at)
+    assert capped_cache.read("a") == _ROW
+    capped_cache._trim()
+    assert _keys(capped_cache) == {"a", "c"}
+
+
+def test_read_many_and_read_stale_count_as_uses(capped_cache):
+    for at, key in enumerate(["a", "b", "c", "d"]):
+        capped_cache.write(key, _ROW)
+        _last_used(capped_cache, key, at)
+    capped_cache.read_many(["a"])
+    capped_cache.read_stale("b")
+    capped_cache._trim()
+    assert _keys(capped_cache) == {"a", "b"}
+
+
+def test_uses_are_written_together_ahead_of_the_trim(capped_cache):
+    capped_cache.write("a", 1)
+    _last_used(capped_cache, "a", 0)
+    capped_cache.read("a")
+    capped_cache.read("a")
+    assert capped_cache._conn.execute("SELECT accessed_at FROM cache").fetchone()[0] == 0
+    counter = _count_statements(capped_cache)
+    capped_cache._trim()
+    assert counter.statements == 2  # the recorded uses, then the SUM
+    assert capped_cache._conn.execute("SELECT accessed_at FROM cache").fetchone()[0] > 0
+
+
+def test_uses_reach_the_database_at_close(tmp_path, monkeypatch):
+    monkeypatch.setattr(Cache, "_db_path", lambda self: str(tmp_path / f"{self.name}.db"))
+    c = Cache("uses", max_bytes=1_000_000)
+    c.write("a", 1)
+    _last_used(c, "a", 0)
+    c.read("a")
+    c.close()
+    conn = sqlite3.connect(tmp_path / "uses.db")
+    assert conn.execute("SELECT accessed_at FROM cache").fetchone()[0] > 0
+    conn.close()
+
+
+def test_without_a_cap_reads_note_nothing(cache):
+    cache.write("a", 1)
+    cache.read("a")
+    assert cache._accessed == {}
+    assert cache._trim() == 0
+
+
+def test_a_row_used_after_it_was_picked_survives(capped_cache, monkeypatch):
+    for at, key in enumerate(["a", "b", "c"]):
+        capped_cache.write(key, _ROW)
+        _last_used(capped_cache, key, at)
+    pick = capped_cache._least_recent
+
+    def picked_then_used(excess):
+        picked = pick(excess)
+        capped_cache._conn.execute("UPDATE cache SET accessed_at = ? WHERE key = 'a'", (time.time(),))
+        return picked
+
+    monkeypatch.setattr(capped_cache, "_least_recent", picked_then_used)
+    assert capped_cache._trim() == 0
+    monkeypatch.undo()
+    assert capped_cache._trim() == 1  # the next pass picks again
+    assert _keys(capped_cache) == {"a", "c"}
+
+
+def test_the_trim_walks_the_accessed_at_index(capped_cache):
+    plan = capped_cache._conn.execute(
+        "EXPLAIN QUERY PLAN SELECT key, size, accessed_at FROM cache ORDER BY accessed_at"
+    ).fetchall()
+    assert any("cache_accessed_at" in row[-1] for row in plan)
+
+
+def test_a_capped_cache_gives_freed_pages_back(tmp_path, monkeypatch):
+    monkeypatch.setattr(Cache, "_db_path", lambda self: str(tmp_path / f"{self.name}.db"))
+    with Cache("shrink", max_bytes=50_000) as c:
+        assert c._db.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+        for i in range(100):
+            c.write(f"k{i}", os.urandom(2000).hex())
+        before = c._db.execute("PRAGMA page_count").fetchone()[0]
+        c._trim()
+        assert c._db.execute("PRAGMA freelist_count").fetchone()[0] == 0
+        assert c._db.execute("PRAGMA page_count").fetchone()[0] < before
+
+
+def test_save_vacuums_a_file_from_before_the_cap_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(Cache, "_db_path", lambda self: str(tmp_path / f"{self.name}.db"))
+    with Cache("grown") as c:
+        for i in range(100):
+            c.write(f"k{i}", os.urandom(2000).hex())
+    c = Cache("grown", max_bytes=50_000)
+    try:
+        assert c._db.execute("PRAGMA auto_vacuum").fetchone()[0] == 0
+        before = c._db.execute("PRAGMA page_count").fetchone()[0]
+        c.save()
+        assert c._vacuumed
+        assert c._db.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+        assert c._db.execute("PRAGMA page_count").fetchone()[0] < before / 2
+        for i in range(100):
+            c.write(f"again{i}", os.urandom(2000).hex())
+        counter = _count_statements(c)
+        c.save()
+        assert "VACUUM" not in counter.seen
+    finally:
+        c.close()
+
+
+def test_background_eviction_also_trims(tmp_path, monkeypatch):
+    monkeypatch.setattr(Cache, "_db_path", lambda self: str(tmp_path / f"{self.name}.db"))
+    c = Cache("trimmed", max_bytes=1000, evict_interval=0.01)
+    try:
+        for key in ["a", "b", "c", "d"]:
+            c.write(key, _ROW)
+        deadline = time.monotonic() + 5
+        while len(c.read_many(["a", "b", "c", "d"])) > 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert len(c.read_many(["a", "b", "c", "d"])) <= 2
+        assert not c._vacuumed
+    finally:
+        c.close()
+
+
+def test_a_v2_database_is_copied_across_with_stored_at_as_last_use(tmp_path, monkeypatch):
+    monkeypatch.setattr(Cache, "_db_path", lambda self: str(tmp_path / f"{self.name}.db"))
+    conn = sqlite3.connect(tmp_path / "v2.db")
+    conn.execute(
+        "CREATE TABLE cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, codec INTEGER NOT NULL DEFAULT 0, "
+        "stored_at REAL NOT NULL, ttl REAL NOT NULL, "
+        "expires_at REAL GENERATED ALWAYS AS (stored_at + ttl) STORED) WITHOUT ROWID"
+    )
+    conn.execute("CREATE INDEX cache_expires_at ON cache (expires_at)")
+    conn.execute("INSERT INTO cache (key, value, codec, stored_at, ttl) VALUES ('k', '1', 0, 1234.0, 1e12)")
+    conn.execute("PRAGMA user_version = 2")
+    conn.commit()
+    conn.close()
+    with Cache("v2") as c:
+        assert c._db.execute("SELECT accessed_at, size FROM cache").fetchone() == (1234.0, 2)
+        assert c.read("k") == 1
+
+
+# --- get_or_fetch: one fetch per key in flight ------------------------------------
+
+
+def test_get_or_fetch_answers_a_hit_without_fetching(cache):
+    cache.write("k", [])
+
+    def fetch():
+        raise AssertionError("fetched on a hit")
+
+    assert cache.get_or_fetch("k", fetch) == []
+
+
+def test_get_or_fetch_writes_what_it_fetched_with_the_ttl(cache):
+    assert cache.get_or_fetch("k", lambda: {"x": 1}, ttl=60.0) == {"x": 1}
+    assert cache.read("k") == {"x": 1}
+    assert cache._conn.execute("SELECT ttl FROM cache WHERE key = 'k'").fetchone()[0] == 60.0
+
+
+def test_get_or_fetch_does_not_cache_none(cache):
+    assert cache.get_or_fetch("k", lambda: None) is None
+    assert cache.read_stale("k") is None
+
+
+def _fetch_while_others_wait(cache, fetch, callers=4):
+    """Run get_or_fetch from several threads, the first holding its fetch open until the rest are waiting."""
+    results: list = [None] * callers
+
+    def call(i):
+        try:
+            results[i] = cache.get_or_fetch("k", fetch)
+        except ValueError as exc:
+            results[i] = exc
+
+    first = threading.Thread(target=call, args=(0,))
+    first.start()
+    deadline = time.monotonic() + 5
+    while "k" not in cache._inflight and time.monotonic() < deadline:
+        time.sleep(0.001)
+    rest = [threading.Thread(target=call, args=(i,)) for i in range(1, callers)]
+    for thread in rest:
+        thread.start()
+    while cache.stats().get("k", {}).get("coalesced", 0) < callers - 1 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    return first, rest, results
+
+
+def test_concurrent_misses_share_one_fetch(cache):
+    release = threading.Event()
+    fetches = []
+
+    def fetch():
+        fetches.append(1)
+        release.wait(5)
+        return "v"
+
+    first, rest, results = _fetch_while_others_wait(cache, fetch)
+    release.set()
+    for thread in [first, *rest]:
+        thread.join()
+    assert fetches == [1]
+    assert results == ["v"] * 4
+    assert cache.stats()["k"]["coalesced"] == 3
+    assert cache._inflight == {}
+
+
+def test_a_failed_fetch_is_raised_to_every_waiter_and_then_forgotten(cache):
+    release = threading.Event()
+
+    def fetch():
+        release.wait(5)
+        raise ValueError("down")
+
+    first, rest, results = _fetch_while_others_wait(cache, fetch, callers=3)
+    release.set()
+    for thread in [first, *rest]:
+        thread.join()
+    assert all(isinstance(result, ValueError) for result in results)
+    assert cache._inflight == {}
+    assert cache.get_or_fetch("k", lambda: "retried") == "retried"
+
+
+# --- stale-while-revalidate ---------------------------------------------------------
+
+
+@pytest.fixture
+def swr_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(Cache, "_db_path", lambda self: str(tmp_path / f"{self.name}.db"))
+    with Cache("swr", refresh_budget=2) as c:
+        yield c
+
+
+def _refreshed(cache):
+    """Wait for the refreshes queued so far. There is one worker, so they run in order."""
+    assert cache._refresher is not None
+    cache._refresher.submit(lambda: None).result(timeout=5)
+
+
+def test_an_expired_entry_is_answered_stale_and_refreshed_behind(swr_cache):
+    _inject_stale(swr_cache, "artist:a", "old", ttl=60.0, age=3600)
+    fetched_on = []
+
+    def fetch():
+        fetched_on.append(threading.current_thread().name)
+        return "new"
+
+    assert swr_cache.get_or_fetch("artist:a", fetch, revalidate=True) == "old"
+    _refreshed(swr_cache)
+    assert fetched_on == ["cache-swr-refresh_0"]
+    assert swr_cache.read("artist:a") == "new"
+    assert swr_cache.stats()["artist:"]["revalidated"] == 1
+
+
+def test_revalidation_is_opt_in(swr_cache):
+    _inject_stale(swr_cache, "artist:a", "old", ttl=60.0, age=3600)
+    assert swr_cache.get_or_fetch("artist:a", lambda: "new") == "new"
+    assert swr_cache._refresher is None
+
+
+def test_nothing_stale_is_fetched_in_line(swr_cache):
+    assert swr_cache.get_or_fetch("artist:a", lambda: "new", revalidate=True) == "new"
+    assert swr_cache._refresher is None
+
+
+def test_past_the_refresh_budget_an_expired_entry_is_fetched_in_line(swr_cache):
+    for key in ["a", "b", "c"]:
+        _inject_stale(swr_cache, key, "old", ttl=60.0, age=3600)
+    assert swr_cache.get_or_fetch("a", lambda: "new", revalidate=True) == "old"
+    assert swr_cache.get_or_fetch("b", lambda: "new", revalidate=True) == "old"
+    assert swr_cache.get_or_fetch("c", lambda: "new", revalidate=True) == "new"
+
+
+def test_a_key_being_refreshed_is_answered_stale_without_spending_budget(swr_cache):
+    _inject_stale(swr_cache, "a", "old", ttl=60.0, age=3600)
+    release = threading.Event()
+
+    def fetch():
+        release.wait(5)
+        return "new"
+
+    assert swr_cache.get_or_fetch("a", fetch, revalidate=True) == "old"
+    assert swr_cache.get_or_fetch("a", fetch, revalidate=True) == "old"
+    assert swr_cache._refresh_budget == 1
+    release.set()
+    _refreshed(swr_cache)
+
+
+def test_a_failed_refresh_leaves_the_stale_entry(swr_cache):
+    _inject_stale(swr_cache, "a", "old", ttl=60.0, age=3600)
+
+    def fetch():
+        raise ValueError("down")
+
+    assert swr_cache.get_or_fetch("a", fetch, revalidate=True) == "old"
+    _refreshed(swr_cache)
+    assert swr_cache.read_stale("a") == "old"
+    assert swr_cache._inflight == {}
+
+
+def test_close_drops_refreshes_still_queued(tmp_path, monkeypatch):
+    monkeypatch.setattr(Cache, "_db_path", lambda self: str(tmp_path / f"{self.name}.db"))
+    c = Cache("queued", refresh_budget=2)
+    _inject_stale(c, "a", "old", ttl=60.0, age=3600)
+    _inject_stale(c, "b", "old", ttl=60.0, age=3600)
+    running = threading.Event()
+    fetched = []
+
+    def slow():
+        running.set()
+        time.sleep(0.05)
+        return "new"
+
+    c.get_or_fetch("a", slow, revalidate=True)
+    c.get_or_fetch("b", lambda: fetched.append("b"), revalidate=True)
+    running.wait(5)
+    c.close()
+    assert fetched == []
+    assert c._inflight == {}
+
+
+# --- snapshots: export and import ---------------------------------------------------
+
+
+def test_a_snapshot_round_trips_through_a_fresh_cache(cache, tmp_path):
+    cache.write("a", {"x": 1})
+    cache.write("big", _LARGE)
+    snapshot = tmp_path / "snap.db.gz"
+    assert cache.export_snapshot(snapshot) == 2
+    assert stat.S_IMODE(os.stat(snapshot).st_mode) == 0o600
+    assert not (tmp_path / "snap.db.gz.partial").exists()
+    with Cache("fresh") as fresh:
+        assert fresh.import_snapshot(snapshot) == 2
+        assert fresh.read("a") == {"x": 1}
+        assert fresh.read("big") == _LARGE
+
+
+def test_an_export_includes_changes_waiting_for_their_group_commit(behind_cache, tmp_path):
+    behind_cache.write("a", 1)
+    assert behind_cache._pending == 1
+    assert behind_cache.export_snapshot(tmp_path / "snap.gz") == 1
+
+
+def test_a_snapshot_is_one_compressed_sqlite_file(cache, tmp_path):
+    import gzip
+
+    cache.write("a", 1)
+    cache.export_snapshot(tmp_path / "snap.gz")
+    (tmp_path / "snap.db").write_bytes(gzip.decompress((tmp_path / "snap.gz").read_bytes()))
+    conn = sqlite3.connect(tmp_path / "snap.db")
+    try:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+        assert conn.execute("PRAGMA freelist_count").fetchone()[0] == 0
+    finally:
+        conn.close()
+
+
+def test_an_import_replaces_what_was_there(cache, tmp_path):
+    cache.write("a", 1)
+    cache.export_snapshot(tmp_path / "snap.gz")
+    cache.write("a", 2)
+    cache.write("b", 3)
+    cache.import_snapshot(tmp_path / "snap.gz")
+    assert cache.read("a") == 1
+    assert cache.read("b") is None
+
+
+def test_a_merge_keeps_whichever_side_stored_last(cache, tmp_path):
+    _inject_stale(cache, "newer-here", "snapshot", ttl=1e9, age=3600)
+    cache.write("newer-there", "snapshot")
+    cache.write("only-there", "snapshot")
+    cache.export_snapshot(tmp_path / "snap.gz")
+    with Cache("other") as other:
+        other.write("newer-here", "local")
+        _inject_stale(other, "newer-there", "local", ttl=1e9, age=3600)
+        other.write("only-here", "local")
+        assert other.import_snapshot(tmp_path / "snap.gz", merge=True) == 2
+        assert other.read("newer-here") == "local"
+        assert other.read("newer-there") == "snapshot"
+        assert other.read("only-there") == "snapshot"
+        assert other.read("only-here") == "local"
+
+
+def test_an_import_drops_what_memory_held(memory_cache, tmp_path):
+    memory_cache.write("a", 1)
+    memory_cache.export_snapshot(tmp_path / "snap.gz")
+    memory_cache.write("a", 2)
+    assert memory_cache.read("a") == 2
+    memory_cache.import_snapshot(tmp_path / "snap.gz")
+    assert memory_cache.read("a") == 1
+
+
+def test_an_older_snapshot_is_migrated_on_import(cache, tmp_path):
+    import gzip
+
+    conn = sqlite3.connect(tmp_path / "old.db")
+    conn.execute("CREATE TABLE cache (key TEXT PRIMARY KEY, value TEXT, stored_at REAL, ttl REAL)")
+    conn.execute("INSERT INTO cache VALUES ('k', '1', ?, 3600)", (time.time(),))
+    conn.commit()
+    conn.close()
+    (tmp_path / "old.gz").write_bytes(gzip.compress((tmp_path / "old.db").read_bytes()))
+    assert cache.import_snapshot(tmp_path / "old.gz") == 1
+    assert cache.read("k") == 1
+
+
+@pytest.mark.parametrize("content", [b"not gzip at all", b"\x1f\x8b\x08\x00truncated"])
+def test_a_file_that_is_not_a_snapshot_is_refused(cache, tmp_path, content):
+    cache.write("a", 1)
+    (tmp_path / "bad.gz").write_bytes(content)
+    with pytest.raises(ValueError, match="not a cache snapshot"):
+        cache.import_snapshot(tmp_path / "bad.gz")
+    assert cache.read("a") == 1
+
+
+def test_a_compressed_file_that_is_not_sqlite_is_refused(cache, tmp_path):
+    import gzip
+
+    (tmp_path / "bad.gz").write_bytes(gzip.compress(b"hello" * 1000))
+    with pytest.raises(ValueError, match="not a usable cache snapshot"):
+        cache.import_snapshot(tmp_path / "bad.gz")
+    assert not cache._degraded
+
+
+def test_a_degraded_cache_refuses_to_export(broken_cache, tmp_path):
+    broken_cache.read("a")
+    with pytest.raises(CacheUnavailableError, match="cannot be exported"):
+        broken_cache.export_snapshot(tmp_path / "snap.gz")
+
+
+# --- negative entries: what the service said is not there ---------------------------
+
+
+def test_absent_reads_back_as_absent_not_as_a_miss(cache):
+    cache.write("artist:gone", ABSENT)
+    assert cache.read("artist:gone") is ABSENT
+    assert cache.read("artist:never-asked") is None
+    assert not ABSENT
+
+
+def test_absent_is_stored_apart_from_every_value(cache):
+    cache.write("artist:gone", ABSENT)
+    cache.write("artist:empty", "")
+    assert _stored(cache, "artist:gone") == ("", 2)
+    assert cache.read("artist:empty") == ""
+
+
+def test_absent_lasts_its_own_shorter_ttl(cache):
+    cache.write("artist:gone", ABSENT)
+    ttl = cache._conn.execute("SELECT ttl FROM cache WHERE key = 'artist:gone'").fetchone()[0]
+    assert ttl == CACHE_ABSENT_CUTOFF < cache.cutoff
+
+
+def test_an_expired_absent_is_a_miss_again(cache):
+    _inject_stale(cache, "artist:gone", ABSENT, ttl=60.0, age=3600)
+    assert cache.read("artist:gone") is None
+    assert cache.read_stale("artist:gone") is ABSENT
+
+
+def test_read_many_and_prefetch_answer_absent(cache):
+    cache.write("artist:gone", ABSENT)
+    cache.write("artist:here", {"name": "here"})
+    assert cache.read_many(["artist:gone", "artist:here"]) == {"artist:gone": ABSENT, "artist:here": {"name": "here"}}
+    assert cache.prefetch(["artist:gone"]) == {"artist:gone": ABSENT}
+    assert cache.read("artist:gone") is ABSENT
+
+
+def test_the_memory_tier_remembers_absent(memory_cache):
+    memory_cache.write("artist:gone", ABSENT)
+    memory_cache.read("artist:gone")
+    assert memory_cache._memory["artist:gone"][0] is ABSENT
+    assert memory_cache.read("artist:gone") is ABSENT
+
+
+def test_absent_survives_a_snapshot(cache, tmp_path):
+    cache.write("artist:gone", ABSENT)
+    cache.export_snapshot(tmp_path / "snap.gz")
+    with Cache("other") as other:
+        other.import_snapshot(tmp_path / "snap.gz")
+        assert other.read("artist:gone") is ABSENT
+
+
+def test_get_or_fetch_caches_absent_and_answers_none_without_asking_again(cache):
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return ABSENT
+
+    assert cache.get_or_fetch("artist:gone", fetch, ttl=1e9) is None
+    assert cache.get_or_fetch("artist:gone", fetch, ttl=1e9) is None
+    assert calls == [1]
+    ttl = cache._conn.execute("SELECT ttl FROM cache WHERE key = 'artist:gone'").fetchone()[0]
+    assert ttl == cache.absent_ttl
+
+
+def test_get_or_fetch_asks_again_once_absent_expires(cache):
+    _inject_stale(cache, "artist:gone", ABSENT, ttl=60.0, age=3600)
+    assert cache.get_or_fetch("artist:gone", lambda: {"name": "back"}) == {"name": "back"}
+
+
+def test_get_or_fetch_touches_what_a_fetcher_answers_unchanged_for(cache):
+    _inject_stale(cache, "artist:a:albums", ["old"], ttl=60.0, age=3600)
+    assert cache.get_or_fetch("artist:a:albums", lambda: UNCHANGED) == ["old"]
+    assert cache.read("artist:a:albums") == ["old"]
+    counts = cache.stats()["artist:"]
+    assert counts["touches"] == 1
+    assert counts["writes"] == 1
+
+
+def test_get_or_fetch_answers_none_for_unchanged_with_nothing_cached(cache):
+    assert cache.get_or_fetch("artist:a:albums", lambda: UNCHANGED) is None
+    assert cache.read_stale("artist:a:albums") is None
+
+
+def test_an_expired_absent_is_not_answered_stale(swr_cache):
+    _inject_stale(swr_cache, "artist:gone", ABSENT, ttl=60.0, age=3600)
+    assert swr_cache.get_or_fetch("artist:gone", lambda: {"name": "back"}, revalidate=True) == {"name": "back"}
+    assert swr_cache._refresher is None
+
+
+def test_absent_ttl_is_configurable(tmp_path, monkeypatch):
+    monkeypatch.setattr(Cache, "_db_path", lambda self: str(tmp_path / f"{self.name}.db"))
+    with Cache("short", absent_ttl=60.0) as c:
+        c.write("artist:gone", ABSENT)
+        assert c._db.execute("SELECT ttl FROM cache").fetchone()[0] == 60.0
+
+
+# --- projection: only the fields the parsers read -----------------------------------
+
+
+def _names_only(value):
+    return [{"name": entry["name"]} for entry in value]
+
+
+def _names_and_images(value):
+    return [{"name": entry["name"], "images": entry["images"]} for entry in value]
+
+
+_NAMES = Projection(1, _names_only)
+_WHOLE = [{"name": "a", "images": ["x" * 100]}, {"name": "b", "images": []}]
+
+
+def _projection_of(cache, key):
+    return cache._db.execute("SELECT projection FROM cache WHERE key = ?", (key,)).fetchone()[0]
+
+
+def test_get_or_fetch_writes_the_projection_with_its_version(cache):
+    assert cache.get_or_fetch("artist:a:albums", lambda: _WHOLE, projection=_NAMES) == [{"name": "a"}, {"name": "b"}]
+    assert cache.read("artist:a:albums") == [{"name": "a"}, {"name": "b"}]
+    assert _projection_of(cache, "artist:a:albums") == 1
+
+
+def test_a_value_stored_whole_is_projected_in_place_on_read(cache):
+    _inject_stale(cache, "artist:a:albums", _WHOLE, ttl=7200.0, age=3600)
+    before = cache._db.execute("SELECT stored_at, ttl FROM cache").fetchone()
+    assert cache.get_or_fetch("artist:a:albums", list, projection=_NAMES) == [{"name": "a"}, {"name": "b"}]
+    assert cache._db.execute("SELECT stored_at, ttl FROM cache").fetchone() == before
+    assert _projection_of(cache, "artist:a:albums") == 1
+    assert cache.read("artist:a:albums") == [{"name": "a"}, {"name": "b"}]
+    assert cache.stats()["artist:"]["reprojected"] == 1
+
+
+def test_a_value_projected_in_place_is_not_projected_again(cache):
+    cache.write("artist:a:albums", _WHOLE)
+    calls = []
+
+    def project(value):
+        calls.append(1)
+        return _names_only(value)
+
+    for _ in range(3):
+        cache.get_or_fetch("artist:a:albums", list, projection=Projection(1, project))
+    assert calls == [1]
+
+
+def test_a_value_projected_by_another_version_is_fetched_again(cache):
+    cache.write("artist:a:albums", [{"name": "a"}], projection=1)
+    widened = Projection(2, _names_and_images)
+    assert cache.get_or_fetch("artist:a:albums", lambda: _WHOLE, projection=widened) == [
+        {"name": "a", "images": ["x" * 100]},
+        {"name": "b", "images": []},
+    ]
+    assert _projection_of(cache, "artist:a:albums") == 2
+
+
+def test_a_stale_value_stored_whole_is_answered_projected(swr_cache):
+    _inject_stale(swr_cache, "artist:a:albums", _WHOLE, ttl=60.0, age=3600)
+    answer = swr_cache.get_or_fetch("artist:a:albums", lambda: _WHOLE, revalidate=True, projection=_NAMES)
+    assert answer == [{"name": "a"}, {"name": "b"}]
+    _refreshed(swr_cache)
+    assert _projection_of(swr_cache, "artist:a:albums") == 1
+
+
+def test_without_a_projection_values_are_stored_whole(cache):
+    cache.get_or_fetch("artist:a:albums", lambda: _WHOLE)
+    assert cache.read("artist:a:albums") == _WHOLE
+    assert _projection_of(cache, "artist:a:albums") == 0
+
+
+def test_absent_is_never_projected(cache):
+    assert cache.get_or_fetch("artist:gone", lambda: ABSENT, projection=_NAMES) is None
+    assert cache.get_or_fetch("artist:gone", lambda: _WHOLE, projection=_NAMES) is None
+
+
+def test_a_v3_database_gains_the_projection_column_in_place(tmp_path, monkeypatch):
+    monkeypatch.setattr(Cache, "_db_path", lambda self: str(tmp_path / f"{self.name}.db"))
+    conn = sqlite3.connect(tmp_path / "v3.db")
+    conn.execute(
+        "CREATE TABLE cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, codec INTEGER NOT NULL DEFAULT 0, "
+        "stored_at REAL NOT NULL, ttl REAL NOT NULL, accessed_at REAL NOT NULL DEFAULT 0, "
+        "expires_at REAL GENERATED ALWAYS AS (stored_at + ttl) STORED, "
+        "size INTEGER GENERATED ALWAYS AS (length(key) + length(value)) STORED) WITHOUT ROWID"
+    )
+    conn.execute(
+        "INSERT INTO cache (key, value, codec, stored_at, ttl, accessed_at) VALUES ('k', '1', 0, 1.0, 1e12, 5.0)"
+    )
+    conn.execute("PRAGMA user_version = 3")
+    conn.commit()
+    conn.close()
+    with Cache("v3") as c:
+        assert c._db.execute("SELECT accessed_at, projection FROM cache").fetchone() == (5.0, 0)
+        assert c._db.execute("PRAGMA user_version").fetchone()[0] == 5
+        assert c.read("k") == 1
+        assert c._db.execute("SELECT count(*) FROM tracks").fetchone() == (0,)
+
+
+# --- invalidation: everything under a key prefix -----------------------------------
+
+
+def test_invalidate_prefix_drops_only_the_keys_under_it(cache):
+    for key in ["artist:a", "artist:a:albums", "artist:ab", "album:x"]:
+        cache.write(key, 1)
+    assert cache.invalidate_prefix("artist:a:") == 1
+    assert cache.invalidate_prefix("artist:a") == 2
+    assert cache.read("album:x") == 1
+
+
+def test_invalidate_prefix_of_nothing_drops_everything(cache):
+    cache.write("a", 1)
+    _inject_stale(cache, "b", 2, ttl=60.0, age=3600)
+    assert cache.invalidate_prefix("") == 2
+    assert cache.read_stale("b") is None
+
+
+def test_invalidate_prefix_drops_staged_and_remembered_rows(memory_cache):
+    memory_cache.write("album:x", 1)
+    memory_cache.write("album:y", 2)
+    memory_cache.read("album:x")
+    memory_cache.prefetch(["album:y"])
+    memory_cache.invalidate_prefix("album:")
+    assert memory_cache.read("album:x") is None
+    assert memory_cache.read("album:y") is None
+
+
+def test_invalidate_prefix_runs_in_chunks(cache, monkeypatch):
+    import shuffleupagus.core.cache as cache_mod
+
+    monkeypatch.setattr(cache_mod, "_EVICT_CHUNK", 2)
+    for i in range(5):
+        cache.write(f"album:{i}", i)
+    counter = _count_statements(cache)
+    assert cache.invalidate_prefix("album:") == 5
+    assert counter.statements == 3
+
+
+def test_invalidate_prefix_is_a_range_on_the_primary_key(cache):
+    plan = cache._conn.execute(
+        "EXPLAIN QUERY PLAN SELECT key FROM cache WHERE key >= ? AND key < ? LIMIT ?", ("album:", "album;", 10)
+    ).fetchall()
+    assert any("PRIMARY KEY" in row[-1] for row in plan)
+
+
+@pytest.mark.parametrize(
+    "prefix, end",
+    [
+        ("album:", "album;"),
+        ("a\ud7ff", "a\ue000"),
+        ("a\U0010ffff", "b"),
+        ("\U0010ffff", None),
+        ("", None),
+    ],
+)
+def test_prefix_end_bounds_every_key_under_the_prefix(prefix, end):
+    assert _prefix_end(prefix) == end
+
+
+# --- spreading expiry: jittered TTLs and refreshing ahead ---------------------------
+
+
+def _ttl_of(cache, key):
+    return cache._conn.execute("SELECT ttl FROM cache WHERE key = ?", (key,)).fetchone()[0]
+
+
+def test_a_default_ttl_is_jittered_within_the_bound(tmp_path, monkeypatch):
+    monkeypatch.setattr(Cache, "_db_path", lambda self: str(tmp_path / f"{self.name}.db"))
+    with Cache("jitter", cutoff=1000.0, ttl_jitter=0.1) as c:
+        for i in range(50):
+            c.write(f"k{i}", i)
+        c.write("gone", ABSENT)
+        ttls = {_ttl_of(c, f"k{i}") for i in range(50)}
+        assert len(ttls) > 1
+        assert all(900.0 <= ttl <= 1100.0 for ttl in ttls)
+        assert 0.9 * c.absent_ttl <= _ttl_of(c, "gone") <= 1.1 * c.absent_ttl
+
+
+def test_an_explicit_ttl_is_not_jittered(tmp_path, monkeypatch):
+    monkeypatch.setattr(Cache, "_db_path", lambda self: str(tmp_path / f"{self.name}.db"))
+    with Cache("jitter", ttl_jitter=0.5) as c:
+        c.write("window", 1, ttl=30.0)
+        assert _ttl_of(c, "window") == 30.0
+
+
+def test_without_jitter_every_entry_gets_the_cutoff(cache):
+    cache.write("k", 1)
+    assert _ttl_of(cache, "k") == CACHE_DEFAULT_CUTOFF
+
+
+@pytest.fixture
+def ahead_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(Cache, "_db_path", lambda self: str(tmp_path / f"{self.name}.db"))
+    with Cache("ahead", cutoff=1000.0, refresh_ahead=2) as c:
+        yield c
+
+
+def _aged(cache, key, age, ttl=1000.0):
+    _inject_stale(cache, key, key, ttl=ttl, age=age)
+
+
+def test_expire_ahead_brings_the_oldest_entries_due(ahead_cache):
+    _aged(ahead_cache, "a", 900)
+    _aged(ahead_cache, "b", 700)
+    _aged(ahead_cache, "c", 800)
+    assert ahead_cache.expire_ahead() == 2
+    assert ahead_cache.read("a") is None
+    assert ahead_cache.read("c") is None
+    assert ahead_cache.read("b") == "b"
+    assert ahead_cache.read_stale("a") == "a"
+
+
+def test_expire_ahead_takes_the_first_keys_before_older_ones(ahead_cache):
+    _aged(ahead_cache, "a", 900)
+    _aged(ahead_cache, "b", 800)
+    _aged(ahead_cache, "vip", 600)
+    assert ahead_cache.expire_ahead(["vip", "ghost"]) == 2
+    assert ahead_cache.read("vip") is None
+    assert ahead_cache.read("a") is None
+    assert ahead_cache.read("b") == "b"
+
+
+def test_expire_ahead_leaves_young_short_and_expired_entries(ahead_cache):
+    _aged(ahead_cache, "young", 400)
+    _aged(ahead_cache, "window", 40, ttl=60.0)
+    _aged(ahead_cache, "old", 2000)
+    ahead_cache.write("permanent", 1, ttl=10**12)
+    assert ahead_cache.expire_ahead(["young", "window"]) == 0
+    assert ahead_cache.read("young") == "young"
+    assert ahead_cache.read("window") == "window"
+
+
+def test_expire_ahead_drops_what_memory_holds(tmp_path, monkeypatch):
+    monkeypatch.setattr(Cache, "_db_path", lambda self: str(tmp_path / f"{self.name}.db"))
+    with Cache("ahead", cutoff=1000.0, refresh_ahead=1, memory_entries=10) as c:
+        _aged(c, "album:a", 900)
+        assert c.read("album:a") == "album:a"
+        assert c.expire_ahead() == 1
+        assert c.read("album:a") is None
+        assert c.stats()["album:"]["advanced"] == 1
+
+
+def test_expire_ahead_is_off_by_default(cache):
+    _inject_stale(cache, "a", 1, ttl=CACHE_DEFAULT_CUTOFF, age=0.9 * CACHE_DEFAULT_CUTOFF)
+    assert cache.expire_ahead() == 0
+    assert cache.read("a") == 1
+
+
+# --- TTL policy: a lifetime per kind of key -----------------------------------------
+
+
+@pytest.fixture
+def policy_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(Cache, "_db_path", lambda self: str(tmp_path / f"{self.name}.db"))
+    policy = {"album:": 500.0, "album:*:tracks": 900.0, "top-tracks:*": 50.0}
+    with Cache("policy", cutoff=100.0, ttl_policy=policy) as c:
+        yield c
+
+
+@pytest.mark.parametrize(
+    "key, ttl",
+    [
+        ("album:x", 500.0),
+        ("album:x:tracks", 900.0),
+        ("album::tracks", 900.0),
+        ("album:tracks", 500.0),
+        ("top-tracks:x", 50.0),
+        ("artist:x", 100.0),
+        ("albums", 100.0),
+    ],
+)
+def test_the_most_specific_pattern_sets_the_ttl(policy_cache, key, ttl):
+    policy_cache.write(key, 1)
+    assert _ttl_of(policy_cache, key) == ttl
+
+
+def test_an_explicit_ttl_or_absent_overrides_the_policy(policy_cache):
+    policy_cache.write("album:x", 1, ttl=7.0)
+    policy_cache.write("album:y", ABSENT)
+    assert _ttl_of(policy_cache, "album:x") == 7.0
+    assert _ttl_of(policy_cache, "album:y") == policy_cache.absent_ttl
+
+
+def test_get_or_fetch_writes_under_the_policy(policy_cache):
+    policy_cache.get_or_fetch("album:x:tracks", lambda: [1])
+    assert _ttl_of(policy_cache, "album:x:tracks") == 900.0
+
+
+def test_a_pattern_with_two_stars_is_refused(tmp_path, monkeypatch):
+    monkeypatch.setattr(Cache, "_db_path", lambda self: str(tmp_path / f"{self.name}.db"))
+    with pytest.raises(ValueError, match="at most one"):
+        Cache("policy", ttl_policy={"a:*:*": 1.0})
+
+
+def test_get_or_fetch_works_the_ttl_out_from_what_it_writes(policy_cache):
+    seen = []
+
+    def ttl(value):
+        seen.append(value)
+        return 42.0
+
+    policy_cache.get_or_fetch("artist:a:albums", lambda: _WHOLE, ttl=ttl, projection=_NAMES)
+    assert seen == [[{"name": "a"}, {"name": "b"}]]
+    assert _ttl_of(policy_cache, "artist:a:albums") == 42.0
+
+
+def test_a_worked_out_ttl_is_jittered(tmp_path, monkeypatch):
+    monkeypatch.setattr(Cache, "_db_path", lambda self: str(tmp_path / f"{self.name}.db"))
+    with Cache("jitter", ttl_jitter=0.5) as c:
+        for i in range(20):
+            c.get_or_fetch(f"k{i}", lambda: 1, ttl=lambda _: 1000.0)
+        ttls = {_ttl_of(c, f"k{i}") for i in range(20)}
+        assert len(ttls) > 1
+        assert all(500.0 <= ttl <= 1500.0 for ttl in ttls)
+
+
+def test_absent_is_not_given_to_a_worked_out_ttl(cache):
+    def ttl(_value):
+        raise AssertionError("called for ABSENT")
+
+    assert cache.get_or_fetch("gone", lambda: ABSENT, ttl=ttl) is None
+    assert _ttl_of(cache, "gone") == cache.absent_ttl
+
+
+# --- sweeping: listing keys and compacting ------------------------------------------
+
+
+def test_keys_lists_a_prefix_in_key_order_expired_or_not(cache):
+    cache.write("artist:b", 1)
+    _inject_stale(cache, "artist:a", 1, ttl=60.0, age=3600)
+    cache.write("album:x", 1)
+    assert cache.keys("artist:") == ["artist:a", "artist:b"]
+    assert cache.keys() == ["album:x", "artist:a", "artist:b"]
+
+
+def test_keys_sees_changes_not_yet_committed(tmp_path, monkeypatch):
+    monkeypatch.setattr(Cache, "_db_path", lambda self: str(tmp_path / f"{self.name}.db"))
+    with Cache("grouped", write_behind=100) as c:
+        c.write("k", 1)
+        assert c.keys() == ["k"]
+
+
+def test_compact_gives_deleted_space_back(cache):
+    for i in range(100):
+        cache.write(f"k{i}", os.urandom(2000).hex())
+    before = cache._db.execute("PRAGMA page_count").fetchone()[0]
+    cache.invalidate_prefix("")
+    cache.compact()
+    assert cache._db.execute("PRAGMA freelist_count").fetchone()[0] == 0
+    assert cache._db.execute("PRAGMA page_count").fetchone()[0] < before
+
+
+# --- sharing: a tier behind the file that other processes reach ---------------------
+
+
+@pytest.fixture
+def shared_pair(tmp_path, monkeypatch):
+    """Two caches in separate files, as two runners would have, sharing one backend."""
+    monkeypatch.setattr(Cache, "_db_path", lambda self: str(tmp_path / f"{self.name}.db"))
+    shared = MemoryBackend()
+    with Cache("one", shared=shared) as one, Cache("two", shared=shared) as two:
+        yield one, two
+
+
+def test_a_write_in_one_process_is_read_in_another(shared_pair):
+    one, two = shared_pair
+    one.write("album:a", {"tracks": ["x" * 600]})
+    assert two.read("album:a") == {"tracks": ["x" * 600]}
+    assert two.stats()["album:"]["shared"] == 1
+
+
+def test_a_shared_row_is_kept_in_the_file_with_its_own_age(shared_pair):
+    one, two = shared_pair
+    one.write("k", 1, ttl=500.0)
+    two.read("k")
+    one.delete("k")
+    assert two.read("k") == 1
+    assert _ttl_of(two, "k") == 500.0
+
+
+def test_an_expired_local_row_is_answered_by_a_fresher_shared_one(shared_pair):
+    one, two = shared_pair
+    _inject_stale(two, "k", "old", ttl=60.0, age=3600)
+    one.write("k", "new")
+    assert two.read("k") == "new"
+
+
+def test_read_stale_falls_back_on_the_shared_tier(shared_pair):
+    _, two = shared_pair
+    two._shared.write("k", StoredRow('"old"', 0, time.time() - 3600, 60.0, 0))
+    assert two.read("k") is None
+    assert two.read_stale("k") == "old"
+
+
+def test_absent_is_shared_as_absent(shared_pair):
+    one, two = shared_pair
+    one.write("artist:gone", ABSENT)
+    assert two.read("artist:gone") is ABSENT
+
+
+def test_a_shared_row_that_will_not_decode_is_a_miss_and_leaves_the_file_alone(shared_pair, capsys):
+    one, two = shared_pair
+    one.write("k", 1)
+    two._shared.write("new", StoredRow(b"?", 9, time.time(), 60.0, 0))
+    two._shared.write("bad", StoredRow("not json", 0, time.time(), 60.0, 0))
+    assert two.read("new") is None
+    assert two.read_stale("bad") is None
+    assert not two._degraded
+    assert _on_disk(two, "new") is None
+    assert _on_disk(two, "bad") is None
+    assert two.read("k") == 1
+    assert capsys.readouterr().out.count("shared cache for 'two' holds rows this version cannot read") == 1
+
+
+def test_deletes_and_invalidations_reach_the_shared_tier(shared_pair):
+    one, two = shared_pair
+    for key in ("album:a", "album:b", "artist:c"):
+        one.write(key, 1)
+    one.delete("artist:c")
+    one.invalidate_prefix("album:")
+    assert two.read("album:a") is None
+    assert two.read("artist:c") is None
+
+
+def test_expire_ahead_takes_the_shared_copy_due_too(tmp_path, monkeypatch):
+    monkeypatch.setattr(Cache, "_db_path", lambda self: str(tmp_path / f"{self.name}.db"))
+    with Cache("ahead", cutoff=1000.0, refresh_ahead=1, shared=MemoryBackend()) as c:
+        _aged(c, "a", 900)
+        assert c.expire_ahead() == 1
+        assert c.read("a") is None
+
+
+def test_an_unreachable_shared_tier_is_reported_once_and_dropped(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(Cache, "_db_path", lambda self: str(tmp_path / f"{self.name}.db"))
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    with Cache("lonely", shared=RespBackend(f"redis://127.0.0.1:{port}", namespace="lonely", timeout=1)) as c:
+        c.write("k", 1)
+        assert c.read("k") == 1
+        assert c.read("missing") is None
+        assert c._shared is None
+    assert capsys.readouterr().out.count("shared cache for 'lonely' is unreachable") == 1
+
+
+# --- several processes on one file: lock contention and leases ----------------------
+
+
+class _LockedFor:
+    """The real connection, except that the next `times` statements or commits find the database locked."""
+
+    def __init__(self, conn, times):
+        self.conn = conn
+        self.times = times
+
+    def _maybe_locked(self):
+        if self.times:
+            self.times -= 1
+            raise sqlite3.OperationalError("database is locked")
+
+    def execute(self, *args):
+        self._maybe_locked()
+        return self.conn.execute(*args)
+
+    def commit(self):
+        self._maybe_locked()
+        self.conn.commit()
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+
+def test_a_locked_write_is_tried_again(cache):
+    cache._conn = _LockedFor(cache._conn, times=2)
+    cache.write("k", 1)
+    assert cache.read("k") == 1
+    assert not cache._degraded
+    cache._conn = cache._conn.conn
+
+
+def test_a_write_still_locked_after_the_retries_is_skipped_not_fatal(cache, capsys):
+    cache._conn = _LockedFor(cache._conn, times=3)
+    assert cache.write("k", 1) == 1
+    assert not cache._degraded
+    cache._conn = cache._conn.conn
+    assert cache.read("k") is None
+    cache.write("k", 2)
+    assert cache.read("k") == 2
+    out = capsys.readouterr().out
+    assert "is busy, skipped writing" in out
+    assert "Delete" not in out
+
+
+def test_a_required_write_still_locked_raises(cache):
+    cache._conn = _LockedFor(cache._conn, times=3)
+    with pytest.raises(CacheUnavailableError):
+        cache.write("k", 1, required=True)
+    cache._conn = cache._conn.conn
+
+
+def test_another_process_holding_the_lock_only_delays_this_one(tmp_path, monkeypatch):
+    monkeypatch.setattr(Cache, "_db_path", lambda self: str(tmp_path / f"{self.name}.db"))
+    with Cache("busy", busy_timeout=0.05) as c:
+        other = sqlite3.connect(tmp_path / "busy.db", isolation_level=None)
+        other.execute("BEGIN IMMEDIATE")
+        try:
+            assert c.write("k", 1) == 1
+            assert c.read("k") is None
+        finally:
+            other.execute("ROLLBACK")
+            other.close()
+        c.write("k", 2)
+        assert c.read("k") == 2
+        assert not c._degraded
+
+
+@pytest.fixture
+def leased(tmp_path, monkeypatch):
+    """Two caches on one file, as two processes would open it, with leases on."""
+    monkeypatch.setattr(Cache, "_db_path", lambda self: str(tmp_path / f"{self.name}.db"))
+    with (
+        Cache("leased", lease_seconds=5, write_behind=100) as one,
+        Cache("leased", lease_seconds=5, write_behind=100) as two,
+    ):
+        yield one, two
+
+
+def test_a_second_process_waits_for_the_first_ones_fetch(leased):
+    one, two = leased
+    fetching = threading.Event()
+    release = threading.Event()
+    fetched = []
+
+    def slow():
+        fetching.set()
+        release.wait(5)
+        fetched.append("one")
+        return {"from": "one"}
+
+    leader = threading.Thread(target=one.get_or_fetch, args=("artist:a", slow))
+    leader.start()
+    fetching.wait(5)
+    answers = []
+    waiter = threading.Thread(
+        target=lambda: answers.append(two.get_or_fetch("artist:a", lambda: fetched.append("two")))
+    )
+    waiter.start()
+    time.sleep(0.2)
+    release.set()
+    leader.join(5)
+    waiter.join(5)
+    assert answers == [{"from": "one"}]
+    assert fetched == ["one"]
+
+
+def test_a_waiter_fetches_itself_when_the_holder_fails(leased):
+    one, two = leased
+    fetching = threading.Event()
+    release = threading.Event()
+
+    def failing():
+        fetching.set()
+        release.wait(5)
+        raise RuntimeError("api down")
+
+    def lead():
+        with contextlib.suppress(RuntimeError):
+            one.get_or_fetch("k", failing)
+
+    leader = threading.Thread(target=lead)
+    leader.start()
+    fetching.wait(5)
+    answers = []
+    waiter = threading.Thread(target=lambda: answers.append(two.get_or_fetch("k", lambda: "two's")))
+    waiter.start()
+    time.sleep(0.2)
+    release.set()
+    leader.join(5)
+    waiter.join(5)
+    assert answers == ["two's"]
+
+
+def test_a_lease_past_its_time_is_taken_over(leased):
+    # two, because it closes first: one's grouped write would hold the
+    # write lock while two's teardown waited for it.
+    _, two = leased
+    two._leases.execute("INSERT INTO leases (key, owner, expires_at) VALUES ('k', 'ghost', ?)", (time.time() - 1,))
+    assert two.get_or_fetch("k", lambda: 1) == 1
+    assert two._leases.execute("SELECT count(*) FROM leases").fetchone()[0] == 0
+
+
+def test_leases_are_off_by_default(cache, tmp_path):
+    cache.get_or_fetch("k", lambda: 1)
+    assert cache._leases is None
+    assert not (tmp_path / "test.leases.db").exists()
+
+
+# --- catalogs: an artist's tracks as rows, current while their sources are ---
+
+
+def _cataloged(id, name="Song", duration_ms=120_000, album_id="alb1", dedupe_hash=None):
+    return CatalogTrack(id, name, duration_ms, None, dedupe_hash or id, album_id, "Album", None)
+
+
+@pytest.fixture
+def cataloged(cache):
+    cache.write("artist:a:albums", [{"id": "alb1"}])
+    cache.write("album:alb1:tracks", [])
+    tracks = [
+        _cataloged("t1", dedupe_hash="same"),
+        _cataloged("t2", dedupe_hash="same"),
+        _cataloged("t3", duration_ms=600_000),
+        _cataloged("t4", album_id="alb2"),
+        _cataloged("t5"),
+    ]
+    sources = ["artist:a:albums", "album:alb1:tracks", "album:alb2:tracks"]
+    assert cache.store_catalog("a", tracks, sources, time.time(), optional=["album:alb2:tracks"])
+    return cache
+
+
+def test_a_catalog_is_not_kept_with_a_source_missing_that_is_not_optional(cache):
+    cache.write("artist:a:albums", [{"id": "alb1"}])
+    assert not cache.store_catalog("a", [_cataloged("t1")], ["artist:a:albums", "album:alb1:tracks"], time.time())
+    assert not cache.has_catalog("a")
+
+
+def test_a_catalog_answers_the_first_of_each_dedupe_hash_within_the_length(cataloged):
+    assert [track.id for track in cataloged.catalog("a", 480_000)] == ["t1", "t4", "t5"]
+    assert cataloged.catalog("a", 480_000)[0] == _cataloged("t1", dedupe_hash="same")
+
+
+def test_a_catalog_leaves_out_what_is_excluded(cataloged):
+    assert [t.id for t in cataloged.catalog("a", 480_000, excluded_ids=["t1"])] == ["t2", "t4", "t5"]
+    assert [t.id for t in cataloged.catalog("a", 480_000, excluded_albums=["alb2"])] == ["t1", "t5"]
+    assert [t.id for t in cataloged.catalog("a", 480_000, excluded_hashes=["same", "t5"])] == ["t4"]
+
+
+def test_an_artist_without_a_catalog_answers_none(cache):
+    assert cache.catalog("nobody", 480_000) is None
+    assert not cache.has_catalog("nobody")
+
+
+@pytest.mark.parametrize(
+    "change",
+    [
+        lambda c: c.write("album:alb1:tracks", [{"id": "new"}]),
+        lambda c: c.touch("artist:a:albums"),
+        lambda c: c.delete("album:alb1:tracks"),
+        lambda c: c.write("album:alb2:tracks", []),  # missing when stored, as it may be
+    ],
+)
+def test_a_catalog_goes_stale_when_a_source_changes(cataloged, change):
+    time.sleep(0.01)
+    change(cataloged)
+    assert not cataloged.has_catalog("a")
+    assert cataloged.catalog("a", 480_000) is None
+
+
+def test_a_catalog_goes_stale_when_a_source_expires(cataloged):
+    cataloged._conn.execute("UPDATE cache SET ttl = 0 WHERE key = 'artist:a:albums'")
+    assert not cataloged.has_catalog("a")
+
+
+def test_has_catalog_is_counted_as_a_read(cataloged):
+    assert cataloged.has_catalog("a")
+    assert not cataloged.has_catalog("b")
+    cataloged.delete("artist:a:albums")
+    assert not cataloged.has_catalog("a")
+    assert cataloged.stats()["catalog:"] == {"writes": 1, "hits": 1, "misses": 1, "expired": 1}
+
+
+def test_a_catalog_not_kept_with_none_before_it_writes_nothing(cache):
+    since = time.time()
+    time.sleep(0.01)
+    cache.write("album:alb1:tracks", [])
+    statements: list[str] = []
+    cache._conn.set_trace_callback(statements.append)
+    assert not cache.store_catalog("a", [_cataloged("t1")], ["album:alb1:tracks"], since)
+    assert not [s for s in statements if s.startswith(("DELETE", "INSERT", "BEGIN"))]
+
+
+def test_a_catalog_is_not_kept_from_sources_written_since_the_build_began(cataloged):
+    since = time.time()
+    time.sleep(0.01)
+    cataloged.write("album:alb1:tracks", [])
+    assert not cataloged.store_catalog("a", [_cataloged("t9")], ["artist:a:albums", "album:alb1:tracks"], since)
+    assert cataloged.catalog("a", 480_000) is None
+    assert cataloged._conn.execute("SELECT count(*) FROM tracks").fetchone() == (0,)
+
+
+def test_a_catalog_is_not_kept_from_an_expired_source(cache):
+    _inject_stale(cache, "artist:a:albums", [], ttl=60.0, age=3600)
+    assert not cache.store_catalog("a", [_cataloged("t1")], ["artist:a:albums"], time.time())
+
+
+def test_save_drops_stale_catalogs_and_keeps_current_ones(cataloged):
+    cataloged.write("album:b:tracks", [])
+    assert cataloged.store_catalog("b", [_cataloged("b1")], ["album:b:tracks"], time.time())
+    time.sleep(0.01)
+    cataloged.touch("album:alb1:tracks")
+    cataloged.save()
+    assert cataloged._conn.execute("SELECT DISTINCT artist_id FROM tracks").fetchall() == [("b",)]
+    assert cataloged._conn.execute("SELECT DISTINCT artist_id FROM catalog_sources").fetchall() == [("b",)]
+
+
+def test_a_degraded_cache_has_no_catalog(cataloged):
+    cataloged._degraded = True
+    assert not cataloged.has_catalog("a")
+    assert cataloged.catalog("a", 480_000) is None
+    assert not cataloged.store_catalog("a", [], ["artist:a:albums"], time.time())
+
+
+# --- async: the sync methods, run on one I/O thread for an event loop ---
+
+
+def test_async_calls_answer_as_the_sync_ones_do(cache):
+    async def calls():
+        assert await cache.awrite("k", {"v": 1}) == {"v": 1}
+        await cache.awrite("gone", ABSENT)
+        return await cache.aread("k"), await cache.aread("gone"), await cache.aread_many(iter(["k", "missing"]))
+
+    assert asyncio.run(calls()) == ({"v": 1}, ABSENT, {"k": {"v": 1}})
+    assert cache.read("k") == {"v": 1}
+
+
+async def _hold_io(cache, gate):
+    """Occupy cache's I/O thread until gate is set, so the calls after it queue up."""
+    started = threading.Event()
+    held = asyncio.ensure_future(cache._io.run(lambda: started.set() or gate.wait()))
+    await asyncio.to_thread(started.wait)
+    return held
+
+
+def test_async_writes_queued_together_commit_once(cache):
+    statements: list[str] = []
+    cache._conn.set_trace_callback(statements.append)
+    gate = threading.Event()
+
+    async def burst():
+        held = await _hold_io(cache, gate)
+        writes = [asyncio.ensure_future(cache.awrite(f"k{i}", i)) for i in range(10)]
+        await asyncio.sleep(0)
+        gate.set()
+        await asyncio.gather(held, *writes)
+
+    asyncio.run(burst())
+    assert statements.count("COMMIT") == 1
+    assert cache.read_many([f"k{i}" for i in range(10)]) == {f"k{i}": i for i in range(10)}
+
+
+def test_async_calls_keep_required_and_degraded_semantics(broken_cache):
+    async def calls():
+        assert await broken_cache.aread("k") is None
+        assert await broken_cache.awrite("k", 1) == 1
+        with pytest.raises(CacheUnavailableError, match="cannot be rebuilt"):
+            await broken_cache.aread("k", required=True)
+        with pytest.raises(CacheUnavailableError, match="cannot be rebuilt"):
+            await broken_cache.awrite("k", 1, required=True)
+
+    asyncio.run(calls())
+
+
+def test_close_runs_the_async_calls_already_queued(tmp_path, monkeypatch):
+    monkeypatch.setattr(Cache, "_db_path", lambda self: str(tmp_path / f"{self.name}.db"))
+
+    async def write_then_close():
+        cache = Cache("queued")
+        pending = asyncio.ensure_future(cache.awrite("k", 1))
+        await asyncio.sleep(0)
+        cache.close()
+        assert await pending == 1
+        with pytest.raises(CacheClosedError):
+            await cache.aread("k")
+
+    asyncio.run(write_then_close())
+    with Cache("queued") as reopened:
+        assert reopened.read("k") == 1
+
+
+def test_an_async_call_cancelled_before_its_turn_is_skipped(cache):
+    gate = threading.Event()
+
+    async def cancel():
+        held = await _hold_io(cache, gate)
+        write = asyncio.ensure_future(cache.awrite("k", 1))
+        await asyncio.sleep(0)
+        write.cancel()
+        # The queued call is cancelled from a callback on the loop; once the
+        # task has finished cancelling, that has run.
+        with contextlib.suppress(asyncio.CancelledError):
+            await write
+        gate.set()
+        await held
+
+    asyncio.run(cancel())
+    cache._io.stop()
+    assert cache.read("k") is None
@@ -19,6 +19,7 @@ import pytest
 from hypothesis import given
 from hypothesis import strategies as st
 
+from shuffleupagus.core import cache as cache_module
 from shuffleupagus.core.cache import Cache, CacheClosedError, CacheUnavailableError
 
 # The errors a caller is allowed to see. Anything else escaping is the bug.
@@ -36,7 +37,11 @@ def _temp_cache_dir(tmp_path_factory):
     directory = tmp_path_factory.mktemp("cache-properties")
     original = Cache._db_path
     Cache._db_path = lambda self: str(directory / f"{self.name}.db")  # type: ignore[method-assign]
+    # A locked database is retried after a pause, not degraded, and here the
+    # lock never goes away: the pauses would only slow every example down.
+    backoff, cache_module._LOCK_BACKOFF = cache_module._LOCK_BACKOFF, 0.0
     yield
+    cache_module._LOCK_BACKOFF = backoff
     Cache._db_path = original  # type: ignore[method-assign]
 
 
@@ -52,6 +57,7 @@ def _degraded_cache(name: str, error: Exception) -> Cache:
     cache: Any = Cache(name)
     cache._conn.close()
     cache._conn = _Broken(error)
+    cache._open_reader = lambda: cache._conn
     return cache
 
 
@@ -71,18 +77,27 @@ class _Broken:
         raise self.error
 
 
+def _batched_write(cache: Cache, key: str) -> None:
+    with cache.batch():
+        cache.write(key, {"v": 1})
+
+
 # Every entry point, named so a failure says which one broke the invariant.
 _OPERATIONS = {
     "read": lambda c, k: c.read(k),
     "read_stale": lambda c, k: c.read_stale(k),
+    "read_many": lambda c, k: c.read_many([k, k + "2"]),
+    "prefetch": lambda c, k: c.prefetch([k]),
     "write": lambda c, k: c.write(k, {"v": 1}),
     "touch": lambda c, k: c.touch(k),
+    "batch": _batched_write,
     "delete": lambda c, k: c.delete(k),
     "clean": lambda c, k: c._clean(),
     "save": lambda c, k: c.save(),
     "close": lambda c, k: c.close(),
     "read_required": lambda c, k: c.read(k, required=True),
     "read_stale_required": lambda c, k: c.read_stale(k, required=True),
+    "read_many_required": lambda c, k: c.read_many([k], required=True),
     "write_required": lambda c, k: c.write(k, {"v": 1}, required=True),
 }
 
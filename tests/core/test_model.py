@@ -1,8 +1,15 @@
+import datetime
+import logging
+import sys
+import time
 from concurrent.futures import ThreadPoolExecutor
-from typing import cast
+from typing import Any, ClassVar, cast
 
 import pytest
 
+from shuffleupagus.core import model as core_model
+from shuffleupagus.core.backend import RespBackend
+from shuffleupagus.core.cache import CACHE_ABSENT_CUTOFF
 from shuffleupagus.core.model import (
     MAX_ARTIST_TRACKS,
     MAX_TOP_TRACKS,
@@ -12,6 +19,7 @@ from shuffleupagus.core.model import (
     Service,
     ShufObject,
     Track,
+    _IdentityMap,
 )
 
 # --- ShufObject ---
@@ -110,6 +118,13 @@ def test_track_dedupe_hash_differs_for_different_duration():
     assert t1.dedupe_hash != t2.dedupe_hash
 
 
+def test_track_dedupe_hash_is_worked_out_on_first_use():
+    t = Track("t", "Café, Again!", 120_999)
+    assert t._dedupe_hash is None
+    assert t.dedupe_hash == "cafe again:120000"
+    assert t._dedupe_hash == "cafe again:120000"
+
+
 def test_track_str():
     t = _make_track(name="My Track")
     assert "My Track" in str(t)
@@ -121,6 +136,17 @@ def test_track_is_excluded():
     assert not t.is_excluded(["other"])
 
 
+@pytest.mark.parametrize(
+    "obj",
+    [Artist("a", "A"), Album("b", "B", "2020"), Track("t", "T", 1000, "ISRC", Album("b", "B"), [Artist("a", "A")])],
+    ids=type,
+)
+def test_model_objects_are_slotted(obj):
+    assert not hasattr(obj, "__dict__")
+    with pytest.raises(AttributeError):
+        obj.misspelt = 1
+
+
 # --- generate_playlist (via a minimal stub service) ---
 
 
@@ -138,6 +164,16 @@ class _StubService:
     # Return types are the widest a subclass may narrow to. Without them the
     # checker infers them from these bodies alone, and every override below
     # then reads as incompatible.
+    def _prefetch(self, artist_id) -> dict:
+        return {}
+
+    # No cache, so never a catalog: every artist goes through get_artist_tracks.
+    def _has_catalog(self, artist_id) -> bool:
+        return False
+
+    def _store_catalog(self, artist_id, tracks, since, prefetched) -> bool:
+        return False
+
     def get_artist(self, artist) -> Artist | None:
         return Artist(artist, artist)
 
@@ -250,3 +286,519 @@ def test_generate_playlist_returns_unique_ids():
     svc = _StubService()
     result = svc.generate_playlist(["a1", "a2"])
     assert len(result) == len(set(result))
+
+
+# --- prefetch ---
+
+
+class _PrefetchCache:
+    """Records each prefetch round and answers from a fixed set of rows."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.rounds: list[list[str]] = []
+
+    def prefetch(self, keys):
+        self.rounds.append(list(keys))
+        return {key: self.rows[key] for key in keys if key in self.rows}
+
+
+class _ChainService(Service):
+    """Each round reveals the next: artist -> album list -> tracklists."""
+
+    name = "test"
+
+    def __init__(self, rows):
+        self.fake = _PrefetchCache(rows)
+        self.cache = cast("Any", self.fake)
+
+    def _artist_cache_keys(self, artist_id, known):
+        keys = ["artist:" + artist_id, "artist:" + artist_id + ":albums"]
+        keys += ["album:" + id + ":tracks" for id in self._cached_ids(known.get(keys[1]), "id")]
+        return keys
+
+
+def test_prefetch_follows_what_each_round_reveals():
+    svc = _ChainService({"artist:a1": {}, "artist:a1:albums": [{"id": "x"}, {"id": "y"}]})
+    svc._prefetch("a1")
+    assert svc.fake.rounds == [
+        ["artist:a1", "artist:a1:albums"],
+        ["album:x:tracks", "album:y:tracks"],
+    ]
+
+
+def test_prefetch_stops_when_nothing_new_is_revealed():
+    svc = _ChainService({})
+    svc._prefetch("a1")
+    assert len(svc.fake.rounds) == 1
+
+
+def test_prefetch_is_a_no_op_for_a_service_without_keys():
+    svc = Service.__new__(Service)
+    svc._prefetch("a1")  # no cache attribute: nothing may reach for one
+
+
+@pytest.mark.parametrize(
+    "items, expected",
+    [
+        ([{"id": "a"}, {"id": "b"}], ["a", "b"]),
+        ([{"id": "a"}, {"id": 3}, "junk", {"other": "c"}], ["a"]),
+        ({"id": "a"}, []),
+        (None, []),
+    ],
+)
+def test_cached_ids_skips_what_it_does_not_recognize(items, expected):
+    assert Service._cached_ids(items, "id") == expected
+
+
+def test_cached_ids_walks_a_path():
+    assert Service._cached_ids([{"album": {"id": "x"}}, {"album": "flat"}], "album", "id") == ["x"]
+
+
+# --- cache options ---
+
+
+class _ConfiguredService(Service):
+    name = "configured"
+
+
+class _Config:
+    def __init__(self, settings):
+        self.settings = settings
+
+    def service(self, name):
+        return self.settings
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    from shuffleupagus.core.cache import Cache
+
+    monkeypatch.setattr(Cache, "_db_path", lambda self: str(tmp_path / f"{self.name}.db"))
+
+
+@pytest.mark.usefixtures("cache_dir")
+def test_cache_write_behind_reaches_the_cache():
+    svc = _ConfiguredService(cast("Any", _Config({"cache-write-behind": 50})))
+    try:
+        assert svc.cache._write_behind == 50
+    finally:
+        svc.close()
+
+
+@pytest.mark.usefixtures("cache_dir")
+def test_cache_write_behind_defaults_off():
+    svc = _ConfiguredService(cast("Any", _Config({})))
+    try:
+        assert svc.cache._write_behind == 0
+    finally:
+        svc.close()
+
+
+@pytest.mark.parametrize("value", [-1, 2.5, "10", True])
+@pytest.mark.usefixtures("cache_dir")
+def test_cache_write_behind_must_be_a_whole_number(value):
+    with pytest.raises(ValueError, match="cache-write-behind"):
+        _ConfiguredService(cast("Any", _Config({"cache-write-behind": value})))
+
+
+@pytest.mark.usefixtures("cache_dir")
+def test_cache_ttl_jitter_defaults_off_and_can_be_turned_on():
+    on = _ConfiguredService(cast("Any", _Config({"cache-ttl-jitter": 10})))
+    off = _ConfiguredService(cast("Any", _Config({})))
+    try:
+        assert on.cache._ttl_jitter == 0.1
+        assert off.cache._ttl_jitter == 0
+    finally:
+        on.close()
+        off.close()
+
+
+@pytest.mark.parametrize("value", [100, -5, 2.5])
+@pytest.mark.usefixtures("cache_dir")
+def test_cache_ttl_jitter_must_be_a_percentage_below_100(value):
+    with pytest.raises(ValueError, match="cache-ttl-jitter"):
+        _ConfiguredService(cast("Any", _Config({"cache-ttl-jitter": value})))
+
+
+class _PolicyService(Service):
+    name = "policy"
+    cache_ttl_policy: ClassVar[dict[str, float]] = {"album:": 1000.0, "top-tracks:": 10.0}
+
+
+@pytest.mark.usefixtures("cache_dir")
+def test_cache_ttl_policy_adds_to_and_overrides_the_service_table():
+    svc = _PolicyService(cast("Any", _Config({"cache-ttl-policy": {"top-tracks:": 2, "artist:*:albums": 0.5}})))
+    try:
+        assert svc.cache._lifetime("album:x:tracks") == 1000.0
+        assert svc.cache._lifetime("top-tracks:x") == 2 * 24 * 60 * 60
+        assert svc.cache._lifetime("artist:x:albums") == 12 * 60 * 60
+        assert svc.cache._lifetime("artist:x") == svc.cache_cutoff
+    finally:
+        svc.close()
+
+
+@pytest.mark.parametrize("value", [7, {"album:": 0}, {"album:": "long"}, {"album:": True}])
+@pytest.mark.usefixtures("cache_dir")
+def test_cache_ttl_policy_must_map_patterns_to_positive_days(value):
+    with pytest.raises(ValueError, match="cache-ttl-policy"):
+        _PolicyService(cast("Any", _Config({"cache-ttl-policy": value})))
+
+
+def _released(*days_ago):
+    today = datetime.datetime.now(tz=datetime.UTC).date()
+    return [Album(f"alb{i}", "Album", today - datetime.timedelta(days=d)) for i, d in enumerate(days_ago)]
+
+
+_DAY = 24 * 60 * 60
+
+
+@pytest.mark.parametrize(
+    "albums, days",
+    [
+        (_released(3650), 90),
+        (_released(0, 7, 14, 21), 1),
+        (_released(16, 60, 90, 120), 2),  # monthly: an eighth of the usual gap
+        (_released(8, 800, 1600), 1),  # just released, after years: an eighth of the time since
+        (_released(-30), 1),  # announced, not out yet
+        (_released(400, 400, 800), 50),  # one date per release, however many albums share it
+    ],
+)
+@pytest.mark.usefixtures("cache_dir")
+def test_release_ttl_follows_the_artists_pace(albums, days):
+    svc = _ConfiguredService(cast("Any", _Config({})))
+    try:
+        assert svc._release_ttl(albums) == pytest.approx(days * _DAY)
+        assert svc._fingerprint_ttl(albums) == pytest.approx(2 * days * _DAY)
+    finally:
+        svc.close()
+
+
+@pytest.mark.usefixtures("cache_dir")
+def test_release_ttl_without_dates_is_the_cutoff():
+    svc = _ConfiguredService(cast("Any", _Config({})))
+    try:
+        assert svc._release_ttl([Album("alb1", "Album")]) == svc.cache.cutoff
+    finally:
+        svc.close()
+
+
+class _SweptService(Service):
+    name = "swept"
+
+    def _artist_cache_keys(self, artist_id, known):
+        keys = ["artist:" + artist_id, "artist:" + artist_id + ":albums"]
+        keys += ["album:" + id + ":tracks" for id in self._cached_ids(known.get(keys[1]), "id")]
+        return keys
+
+
+@pytest.mark.usefixtures("cache_dir")
+def test_sweep_orphans_drops_what_only_removed_artists_reach():
+    svc = _SweptService(cast("Any", _Config({})))
+    try:
+        for key, value in [
+            ("artist:kept", {}),
+            ("artist:kept:albums", [{"id": "shared"}]),
+            ("album:shared:tracks", []),
+            ("artist:gone", {}),
+            ("artist:gone:albums", [{"id": "shared"}, {"id": "own"}]),
+            ("album:own:tracks", []),
+            ("artist:featured", {}),
+            ("rate_limit_until", 0),
+        ]:
+            svc.cache.write(key, value)
+        assert svc.sweep_orphans(["kept"]) == 3
+        assert svc.cache.keys() == [
+            "album:shared:tracks",
+            "artist:featured",
+            "artist:kept",
+            "artist:kept:albums",
+            "rate_limit_until",
+        ]
+    finally:
+        svc.close()
+
+
+@pytest.mark.usefixtures("cache_dir")
+def test_sweep_orphans_with_nothing_removed_leaves_the_file_alone(monkeypatch):
+    svc = _SweptService(cast("Any", _Config({})))
+    try:
+        svc.cache.write("artist:kept:albums", [])
+        monkeypatch.setattr(svc.cache, "compact", lambda: pytest.fail("compacted with nothing swept"))
+        assert svc.sweep_orphans(["kept"]) == 0
+    finally:
+        svc.close()
+
+
+class _AheadService(Service):
+    name = "ahead"
+
+    def _artist_cache_keys(self, artist_id, known):
+        return ["artist:" + artist_id, "artist:" + artist_id + ":albums"]
+
+
+@pytest.mark.usefixtures("cache_dir")
+def test_expire_ahead_refreshes_vip_artists_first():
+    svc = _AheadService(cast("Any", _Config({"cache-refresh-ahead": 2})))
+    try:
+        now = time.time()
+        for key, age in [("artist:old", 0.8), ("artist:vip", 0.6), ("artist:vip:albums", 0.7)]:
+            svc.cache.write(key, 1)
+            svc.cache._db.execute("UPDATE cache SET stored_at = ? WHERE key = ?", (now - age * svc.cache_cutoff, key))
+        svc.cache._db.commit()
+        assert svc.expire_ahead(["vip"]) == 2
+        assert svc.cache.read("artist:old") == 1
+        assert svc.cache.read("artist:vip") is None
+    finally:
+        svc.close()
+
+
+class _CatalogService(Service):
+    """Reads its albums and tracklists through the cache, counting each walk of them."""
+
+    name = "catalog"
+    tracklist_walks = 0
+    # Albums whose tracklist fetch answers None, as a failed one does.
+    failing: frozenset[str] = frozenset()
+
+    def _artist_cache_keys(self, artist_id, known):
+        keys = ["artist:" + artist_id + ":albums", "top-tracks:" + artist_id]
+        keys += ["album:" + id + ":tracks" for id in self._cached_ids(known.get(keys[0]), "id")]
+        return keys
+
+    def get_artist(self, artist):
+        return Artist(artist, artist)
+
+    def get_artist_top_tracks(self, artist):
+        names = self.cache.get_or_fetch("top-tracks:" + artist.id, lambda: ["Top"])
+        return [Track(name, name, 130_000, album=Album("alb1", "One")) for name in names]
+
+    def get_artist_tracks(self, artist):
+        self.tracklist_walks += 1
+        tracks = []
+        for album in self.cache.get_or_fetch("artist:a:albums", lambda: [{"id": "alb1"}, {"id": "alb2"}]):
+            listed = self.cache.get_or_fetch(
+                "album:" + album["id"] + ":tracks",
+                lambda album=album: (
+                    None
+                    if album["id"] in self.failing
+                    else {
+                        "alb1": [["a", "Song", 120_000], ["b", "Song", 120_500], ["c", "Long", 540_000]],
+                        "alb2": [["d", "Other", 100_000], ["e", "Skipped", 100_000]],
+                    }[album["id"]]
+                ),
+            )
+            tracks += [Track(id, name, ms, album=Album(album["id"], album["id"])) for id, name, ms in listed or []]
+        return tracks
+
+
+@pytest.mark.usefixtures("cache_dir")
+def test_collect_tracks_answers_a_warm_artist_from_its_catalog():
+    svc = _CatalogService(cast("Any", _Config({"cache-ttl-jitter": 0})))
+    try:
+        runs = [svc.collect_tracks(["a"], excluded_track_ids=["e"]) for _ in range(3)]
+        # Fetched on the first run, so only the second, reading it all back
+        # unchanged, may keep a catalog; the third answers from it.
+        assert svc.tracklist_walks == 2
+        assert [{t.id for t in run["a"]} for run in runs] == [{"Top", "a", "d"}] * 3
+        assert svc.cache.stats()["catalog:"] == {"misses": 2, "writes": 1, "hits": 1}
+        assert {t.id for t in svc.collect_tracks(["a"], excluded_album_ids=["alb2"])["a"]} == {"Top", "a"}
+        assert svc.tracklist_walks == 2
+    finally:
+        svc.close()
+
+
+@pytest.mark.usefixtures("cache_dir")
+def test_a_tracklist_that_failed_to_fetch_keeps_the_catalog_from_being_stored():
+    svc = _CatalogService(cast("Any", _Config({"cache-ttl-jitter": 0})))
+    try:
+        svc.failing = frozenset({"alb2"})
+        svc.collect_tracks(["a"])
+        svc.collect_tracks(["a"])
+        assert "writes" not in svc.cache.stats()["catalog:"]
+        svc.failing = frozenset()
+        assert {t.id for t in svc.collect_tracks(["a"])["a"]} == {"Top", "a", "d", "e"}
+        assert svc.tracklist_walks == 3
+    finally:
+        svc.close()
+
+
+@pytest.mark.usefixtures("cache_dir")
+def test_a_run_that_keeps_no_catalog_hashes_only_the_candidates(monkeypatch):
+    svc = _CatalogService(cast("Any", _Config({"cache-ttl-jitter": 0})))
+    try:
+        cleaned: list[str] = []
+        monkeypatch.setattr(core_model, "_dedupe_name", lambda name: cleaned.append(name) or name)
+        svc.collect_tracks(["a"])
+        assert "writes" not in svc.cache.stats()["catalog:"]
+        assert "Long" not in cleaned
+    finally:
+        svc.close()
+
+
+@pytest.mark.usefixtures("cache_dir")
+def test_storing_a_catalog_reads_no_row_a_second_time():
+    svc = _CatalogService(cast("Any", _Config({"cache-ttl-jitter": 0})))
+    try:
+        svc.collect_tracks(["a"])
+        before = svc.cache.stats()["album:"].get("hits", 0)
+        svc.collect_tracks(["a"])
+        assert svc.cache.stats()["catalog:"]["writes"] == 1
+        # Each of the two tracklists read once, by get_artist_tracks.
+        assert svc.cache.stats()["album:"]["hits"] - before == 2
+    finally:
+        svc.close()
+
+
+@pytest.mark.usefixtures("cache_dir")
+def test_tracks_from_a_catalog_carry_its_dedupe_hash(monkeypatch):
+    svc = _CatalogService(cast("Any", _Config({"cache-ttl-jitter": 0})))
+    try:
+        svc.collect_tracks(["a"])
+        svc.collect_tracks(["a"])
+        cleaned: list[str] = []
+        monkeypatch.setattr(core_model, "_dedupe_name", lambda name: cleaned.append(name) or name)
+        tracks = svc.collect_tracks(["a"])["a"]
+        assert svc.tracklist_walks == 2
+        # Only the top track, which is built afresh, is cleaned again.
+        assert cleaned == ["Top"]
+        assert "song:120000" in {t.dedupe_hash for t in tracks}
+    finally:
+        svc.close()
+
+
+@pytest.mark.usefixtures("cache_dir")
+def test_cache_memory_budgets_reach_the_cache():
+    svc = _ConfiguredService(cast("Any", _Config({"cache-memory-entries": 100, "cache-memory-mb": 2})))
+    try:
+        assert svc.cache._memory_entries == 100
+        assert svc.cache._memory_bytes == 2 * 1024 * 1024
+    finally:
+        svc.close()
+
+
+@pytest.mark.usefixtures("cache_dir")
+def test_cache_evict_interval_starts_background_eviction():
+    svc = _ConfiguredService(cast("Any", _Config({"cache-evict-interval": 60})))
+    try:
+        assert svc.cache._evictor is not None
+        assert svc.cache._evictor.is_alive()
+    finally:
+        svc.close()
+    assert not svc.cache._evictor.is_alive()
+
+
+@pytest.mark.usefixtures("cache_dir")
+def test_close_logs_the_cache_summary(caplog):
+    svc = _ConfiguredService(cast("Any", _Config({})))
+    svc.cache.read("artist:a")
+    with caplog.at_level(logging.INFO):
+        svc.close()
+    assert "* cache artist: 0 hits, 1 misses" in caplog.text
+
+
+@pytest.mark.usefixtures("cache_dir")
+def test_interned_objects_are_one_per_id_until_close():
+    svc = _ConfiguredService(cast("Any", _Config({})))
+    builds = []
+
+    def build():
+        builds.append(1)
+        # A fresh string, as a decoded response gives, not the constant.
+        return Artist(b"a1".decode(), "A")
+
+    first = svc._interned(Artist, "a1", build)
+    assert svc._interned(Artist, "a1", build) is first
+    assert len(builds) == 1
+    assert first is not None
+    assert first.id is sys.intern("a1")
+    assert svc._interned(Album, "a1", lambda: Album("a1", "A")) is not first
+    svc.close()
+    assert svc._interned(Artist, "a1", build) is not first
+
+
+@pytest.mark.usefixtures("cache_dir")
+def test_interned_does_not_keep_a_none():
+    svc = _ConfiguredService(cast("Any", _Config({})))
+    try:
+        assert svc._interned(Artist, "a1", lambda: None) is None
+        assert svc._interned(Artist, "a1", lambda: Artist("a1", "A")) is not None
+    finally:
+        svc.close()
+
+
+def test_identity_map_forgets_the_least_recently_used():
+    identities = _IdentityMap(2)
+    a, b, c = Artist("a", "A"), Artist("b", "B"), Artist("c", "C")
+    identities.add(Artist, "a", a)
+    identities.add(Artist, "b", b)
+    assert identities.get(Artist, "a") is a
+    identities.add(Artist, "c", c)
+    assert len(identities) == 2
+    assert identities.get(Artist, "b") is None
+    assert identities.get(Artist, "a") is a
+    # A second add for an ID keeps the first object, as a racing thread would.
+    assert identities.add(Artist, "a", Artist("a", "A")) is a
+
+
+@pytest.mark.usefixtures("cache_dir")
+def test_max_cache_mb_reaches_the_cache():
+    svc = _ConfiguredService(cast("Any", _Config({"max-cache-mb": 500})))
+    try:
+        assert svc.cache._max_bytes == 500 * 1024 * 1024
+    finally:
+        svc.close()
+
+
+@pytest.mark.usefixtures("cache_dir")
+def test_cache_refresh_budget_reaches_the_cache():
+    svc = _ConfiguredService(cast("Any", _Config({"cache-refresh-budget": 25})))
+    try:
+        assert svc.cache._refresh_budget == 25
+    finally:
+        svc.close()
+
+
+@pytest.mark.usefixtures("cache_dir")
+def test_cache_absent_hours_reaches_the_cache():
+    svc = _ConfiguredService(cast("Any", _Config({"cache-absent-hours": 2})))
+    try:
+        assert svc.cache.absent_ttl == 2 * 60 * 60
+    finally:
+        svc.close()
+
+
+@pytest.mark.usefixtures("cache_dir")
+def test_cache_absent_hours_defaults_to_a_day():
+    svc = _ConfiguredService(cast("Any", _Config({})))
+    try:
+        assert svc.cache.absent_ttl == CACHE_ABSENT_CUTOFF
+    finally:
+        svc.close()
+
+
+@pytest.mark.usefixtures("cache_dir")
+def test_cache_shared_puts_a_resp_backend_behind_the_cache():
+    svc = _ConfiguredService(cast("Any", _Config({"cache-shared": "redis://cache.internal:6380/1"})))
+    try:
+        assert isinstance(svc.cache._shared, RespBackend)
+        assert svc.cache._shared._address == ("cache.internal", 6380)
+    finally:
+        svc.close()
+    with _ConfiguredService(cast("Any", _Config({}))) as plain:
+        assert plain.cache._shared is None
+
+
+@pytest.mark.usefixtures("cache_dir")
+def test_cache_busy_and_lease_seconds_reach_the_cache():
+    svc = _ConfiguredService(cast("Any", _Config({"cache-busy-seconds": 3, "cache-lease-seconds": 120})))
+    try:
+        assert svc.cache._busy_timeout == 3
+        assert svc.cache._lease_seconds == 120
+        assert svc.cache._leases is not None
+    finally:
+        svc.close()
+    with _ConfiguredService(cast("Any", _Config({}))) as default:
+        assert default.cache._busy_timeout == 2
+        assert default.cache._lease_seconds == 0
+        assert default.cache._leases is None
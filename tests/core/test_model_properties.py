@@ -2,6 +2,7 @@
 
 import datetime
 import string
+import unicodedata
 
 import pytest
 from hypothesis import given
@@ -50,6 +51,14 @@ def test_dedupe_hash_is_case_insensitive(name, duration_ms):
     assert t_original.dedupe_hash == t_casefolded.dedupe_hash
 
 
+@given(name=_track_name, duration_ms=_duration_ms)
+def test_dedupe_hash_cleans_names_as_a_character_by_character_filter_would(name, duration_ms):
+    """The translate table drops exactly the nonspacing marks and ASCII punctuation."""
+    cleaned = unicodedata.normalize("NFKD", name).casefold().strip()
+    cleaned = "".join(c for c in cleaned if unicodedata.category(c) != "Mn" and c not in string.punctuation)
+    assert _make_track(name, duration_ms).dedupe_hash == f"{cleaned}:{duration_ms - duration_ms % 2000}"
+
+
 _ascii_non_punct_name = st.text(
     min_size=0,
     max_size=200,
@@ -37,6 +37,10 @@ def test_artist_sanitize_id():
     assert AppleMusicArtist.sanitize_id("https://music.apple.com/us/artist/99") == "99"
 
 
+def test_artist_matches_a_url():
+    assert AppleMusicArtist("99", "A").matches("https://music.apple.com/us/artist/name/99")
+
+
 # --- AppleMusicAlbum ---
 
 
@@ -181,3 +185,16 @@ def test_track_from_dict_wrong_duration_type():
 def test_track_from_dict_reports_the_service():
     with pytest.raises(ApiResponseError, match="Apple Music"):
         AppleMusicTrack.from_dict({})
+
+
+@pytest.mark.parametrize(
+    "obj",
+    [
+        AppleMusicArtist("a", "A"),
+        AppleMusicAlbum("b", "B"),
+        AppleMusicTrack("t", "T", 1000, "ISRC", album=AppleMusicAlbum("b", "B")),
+    ],
+    ids=type,
+)
+def test_model_objects_are_slotted(obj):
+    assert not hasattr(obj, "__dict__")
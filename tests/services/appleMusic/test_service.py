@@ -10,7 +10,9 @@ import pytest
 import requests
 
 from shuffleupagus.core.apiresponse import ApiResponseError
-from shuffleupagus.core.cache import Cache
+from shuffleupagus.core.cache import ABSENT, Cache
+from shuffleupagus.core.model import _candidates
+from shuffleupagus.services.appleMusic.model import AppleMusicAlbum, AppleMusicTrack
 from shuffleupagus.services.appleMusic.service import (
     AppleMusicService,
     _applescript_count,
@@ -1095,6 +1097,50 @@ def test_a_404_still_means_not_found(svc):
     assert svc.get_artist("a1") is None
 
 
+def test_a_song_is_cached_with_only_the_fields_it_is_read_by(svc):
+    song = {
+        "id": "t1",
+        "type": "songs",
+        "href": "/v1/catalog/us/songs/t1",
+        "attributes": {
+            "name": "Song",
+            "durationInMillis": 1000,
+            "isrc": "X",
+            "artwork": {"url": "a"},
+            "previews": [{"url": "p"}],
+        },
+        "relationships": {"artists": {"href": "/v1", "data": [{"id": "a1", "type": "artists"}]}},
+    }
+    svc.client.song.return_value = {"data": [song]}
+    svc.client.artist.return_value = {"data": [{"id": "a1", "attributes": {"name": "Artist"}}]}
+    svc._get_track_by_id("t1")
+    assert svc.cache.read("track:t1") == {
+        "data": [
+            {
+                "id": "t1",
+                "attributes": {"name": "Song", "durationInMillis": 1000, "isrc": "X"},
+                "relationships": {"artists": {"data": [{"id": "a1"}]}},
+            }
+        ]
+    }
+
+
+def test_a_404_is_remembered_rather_than_asked_again(svc):
+    svc.client.artist.side_effect = _http_error(404)
+    assert svc.get_artist("a1") is None
+    assert svc.get_artist("a1") is None
+    assert svc.client.artist.call_count == 1
+    assert svc.cache.read("artist:a1") is ABSENT
+
+
+def test_a_missing_album_list_is_remembered_as_empty(svc):
+    svc.client.artist_relationship.side_effect = _http_error(404)
+    artist = MagicMock(id="a1", name="Artist")
+    assert svc.get_artist_albums(artist) == []
+    assert svc.get_artist_albums(artist) == []
+    assert svc.client.artist_relationship.call_count == 1
+
+
 @pytest.mark.parametrize("status", [500, 502, 503])
 def test_a_server_error_is_not_a_missing_artist(svc, status):
     """Answering None here silently drops the artist from the playlist."""
@@ -1246,3 +1292,46 @@ def test_login_reads_the_key_from_the_config_dir(svc, tmp_path):
     get_path.assert_called_once_with("authkey.p8")
     passed_key = client.call_args.kwargs["secret_key"]
     assert passed_key == "secret-contents"
+
+
+# ---------------------------------------------------------------------------
+# prefetch
+# ---------------------------------------------------------------------------
+
+
+def test_artist_cache_keys_follow_albums_and_top_tracks(svc):
+    known = {
+        "artist:a1:albums": {"data": [{"id": "alb1"}]},
+        "top-tracks:a1": {"data": [{"id": "t1"}, {"id": "t2"}]},
+    }
+    assert svc._artist_cache_keys("a1", known) == [
+        "artist:a1",
+        "artist:a1:albums",
+        "top-tracks:a1",
+        "album:alb1:tracks",
+        "track:t1",
+        "track:t2",
+    ]
+
+
+# ---------------------------------------------------------------------------
+# catalog
+# ---------------------------------------------------------------------------
+
+
+def test_url_exclusions_drop_the_same_tracks_with_or_without_a_catalog(svc):
+    kept, dropped = AppleMusicAlbum("100", "Kept", "2020-01-01"), AppleMusicAlbum("200", "Dropped", "2021-01-01")
+    tracks = [
+        AppleMusicTrack("1", "One", 120_000, "ISRC1", album=kept),
+        AppleMusicTrack("2", "Two", 130_000, "ISRC2", album=kept),
+        AppleMusicTrack("3", "Three", 140_000, "ISRC3", album=dropped),
+    ]
+    excluded_albums = ["https://music.apple.com/us/album/dropped/200"]
+    excluded_tracks = ["https://music.apple.com/us/song/one/1?l=en"]
+
+    cold = _candidates(tracks, [], excluded_albums, excluded_tracks)
+    assert svc._store_catalog("a1", tracks, time.time(), svc._prefetch("a1"))
+    warm = svc._cataloged_tracks("a1", [], excluded_albums, excluded_tracks)
+
+    assert warm is not None
+    assert {t.id for t in cold} == {t.id for t in warm} == {"2"}
@@ -214,3 +214,12 @@ def test_track_from_dict_absent_isrc_is_allowed():
 def test_track_from_dict_reports_the_service():
     with pytest.raises(ApiResponseError, match="Spotify"):
         SpotifyTrack.from_dict({})
+
+
+@pytest.mark.parametrize(
+    "obj",
+    [SpotifyArtist("a", "A"), SpotifyAlbum("b", "B"), SpotifyTrack("t", "T", 1000, album=SpotifyAlbum("b", "B"))],
+    ids=type,
+)
+def test_model_objects_are_slotted(obj):
+    assert not hasattr(obj, "__dict__")
@@ -1,5 +1,6 @@
 """Tests for SpotifyService with all network calls mocked."""
 
+import datetime
 import threading
 import time
 from unittest.mock import MagicMock
@@ -9,7 +10,7 @@ import spotipy
 
 from shuffleupagus.core.apiresponse import ApiResponseError
 from shuffleupagus.core.cache import Cache
-from shuffleupagus.core.model import Album, Artist, Service
+from shuffleupagus.core.model import Album, Artist, Service, _IdentityMap
 from shuffleupagus.services.spotify.service import (
     SpotifyService,
     _retry_after_seconds,
@@ -72,6 +73,42 @@ def test_get_artist_cache_miss(svc):
     svc.spotify.artist.assert_called_once_with("a1")
 
 
+def test_concurrent_misses_for_one_artist_call_the_api_once(svc):
+    """Two album-pool threads resolving the same featured artist share one fetch."""
+    waiting = threading.Event()
+
+    def artist(artist_id):
+        # Held until the second caller is queued behind this fetch.
+        waiting.wait(5)
+        return _artist_payload(artist_id, "Shared")
+
+    svc.spotify.artist.side_effect = artist
+    first = threading.Thread(target=svc.get_artist, args=("a1",))
+    first.start()
+    while "artist:a1" not in svc.cache._inflight:
+        time.sleep(0.001)
+    second = threading.Thread(target=svc.get_artist, args=("a1",))
+    second.start()
+    while not svc.cache.stats().get("artist:", {}).get("coalesced"):
+        time.sleep(0.001)
+    waiting.set()
+    first.join()
+    second.join()
+    svc.spotify.artist.assert_called_once_with("a1")
+
+
+def test_an_expired_artist_is_answered_stale_and_refreshed_behind(svc):
+    svc.cache._refresh_budget = 1
+    svc.cache.write("artist:a1", _artist_payload("a1", "Old Name"), ttl=60.0)
+    svc.cache._conn.execute("UPDATE cache SET stored_at = stored_at - 3600")
+    svc.cache._conn.commit()
+    svc.spotify.artist.return_value = _artist_payload("a1", "New Name")
+    assert svc.get_artist("a1").name == "Old Name"
+    assert svc.cache._refresher is not None
+    svc.cache._refresher.submit(lambda: None).result(timeout=5)
+    assert svc.get_artist("a1").name == "New Name"
+
+
 def test_get_artist_cache_hit(svc):
     svc.cache.write("artist:a1", _artist_payload("a1", "Cached Artist"))
     artist = svc.get_artist("a1")
@@ -79,6 +116,19 @@ def test_get_artist_cache_hit(svc):
     svc.spotify.artist.assert_not_called()
 
 
+def test_an_artist_is_cached_with_only_the_fields_it_is_read_by(svc):
+    svc.spotify.artist.return_value = {**_artist_payload("a1", "My Artist"), "images": [{"url": "x"}], "popularity": 7}
+    svc.get_artist("a1")
+    assert svc.cache.read("artist:a1") == {"id": "a1", "name": "My Artist"}
+
+
+def test_an_artist_cached_whole_is_cut_down_when_read(svc):
+    svc.cache.write("artist:a1", {**_artist_payload("a1", "Cached Artist"), "genres": ["pop"]})
+    assert svc.get_artist("a1").name == "Cached Artist"
+    assert svc.cache.read("artist:a1") == {"id": "a1", "name": "Cached Artist"}
+    svc.spotify.artist.assert_not_called()
+
+
 def test_get_artist_sanitizes_url(svc):
     svc.spotify.artist.return_value = _artist_payload("a1", "Artist")
     svc.get_artist("https://open.spotify.com/artist/a1")
@@ -134,10 +184,16 @@ def test_get_artist_albums_fingerprint_match_uses_stale(svc):
     # API confirms latest album is still alb1
     svc.spotify.artist_albums.return_value = {"items": [_album_payload("alb1")]}
 
+    written = svc.cache.stats()["artist:"]["writes"]
     albums = svc.get_artist_albums(Artist("a1", "A"))
     assert len(albums) == 1
     # Only one call (limit=1 fingerprint check), not the full refetch
     svc.spotify.artist_albums.assert_called_once_with("a1", limit=1)
+    # The stale list is touched back to fresh, not written again
+    counts = svc.cache.stats()["artist:"]
+    assert counts["touches"] == 1
+    assert counts["writes"] == written
+    assert svc.cache.read("artist:a1:albums") is not None
 
 
 def test_get_artist_albums_fingerprint_mismatch_refetches(svc):
@@ -165,6 +221,25 @@ def test_get_artist_albums_stores_fingerprint(svc):
     assert svc.cache.read_stale("fingerprint:artist:a1") == "alb1"
 
 
+def _ttl_of(svc, key):
+    return svc.cache._conn.execute("SELECT ttl FROM cache WHERE key = ?", (key,)).fetchone()[0]
+
+
+def test_a_dormant_artists_album_list_is_checked_rarely(svc):
+    svc.spotify.artist_albums.return_value = {"items": [_album_payload("alb1", release_date="2001-05-01")]}
+    svc.get_artist_albums(Artist("a1", "A"))
+    assert _ttl_of(svc, "artist:a1:albums") == 90 * 24 * 60 * 60
+    assert _ttl_of(svc, "fingerprint:artist:a1") == 2 * 90 * 24 * 60 * 60
+
+
+def test_a_prolific_artists_album_list_is_checked_daily(svc):
+    today = datetime.datetime.now(tz=datetime.UTC).date()
+    items = [_album_payload(f"alb{i}", release_date=str(today - datetime.timedelta(days=7 * i))) for i in range(4)]
+    svc.spotify.artist_albums.return_value = {"items": items}
+    svc.get_artist_albums(Artist("a1", "A"))
+    assert _ttl_of(svc, "artist:a1:albums") == 24 * 60 * 60
+
+
 # ---------------------------------------------------------------------------
 # get_album_tracks
 # ---------------------------------------------------------------------------
@@ -191,6 +266,16 @@ def test_get_album_tracks_no_isrc(svc):
     assert tracks[0].isrc is None
 
 
+def test_get_album_tracks_credits_one_artist_object_per_id(svc):
+    svc._identities = _IdentityMap(100)
+    svc.spotify.album_tracks.return_value = {"items": [_track_payload("t1"), _track_payload("t2")]}
+    svc.spotify.artist.return_value = _artist_payload()
+    first, second = svc.get_album_tracks(Album("alb1", "Album"))
+    assert first.artists[0] is second.artists[0]
+    assert svc.cache.stats()["artist:"]["misses"] == 1
+    assert "hits" not in svc.cache.stats()["artist:"]
+
+
 # ---------------------------------------------------------------------------
 # get_artist_top_tracks
 # ---------------------------------------------------------------------------
@@ -208,6 +293,16 @@ def test_get_artist_top_tracks(svc):
     assert tracks[0].album is not None
 
 
+def test_get_artist_top_tracks_share_one_album_object_per_id(svc):
+    svc._identities = _IdentityMap(100)
+    svc.spotify.artist_top_tracks.return_value = {"tracks": [_track_payload("t1"), _track_payload("t2")]}
+    svc.spotify.album.return_value = _album_payload()
+    svc.spotify.artist.return_value = _artist_payload()
+    first, second = svc.get_artist_top_tracks(Artist("a1", "A"))
+    assert first.album is second.album
+    assert svc.spotify.album.call_count == 1
+
+
 def test_get_artist_top_tracks_empty(svc):
     svc.spotify.artist_top_tracks.return_value = {"tracks": []}
     tracks = svc.get_artist_top_tracks(Artist("a1", "A"))
@@ -917,3 +1012,51 @@ def test_get_album_tracks_external_ids_without_isrc_is_allowed(svc):
     svc.spotify.album_tracks.return_value = {"items": [payload]}
     svc.spotify.artist.return_value = _artist_payload()
     assert svc.get_album_tracks(Album("alb1", "A"))[0].isrc is None
+
+
+# ---------------------------------------------------------------------------
+# prefetch
+# ---------------------------------------------------------------------------
+
+
+def test_artist_cache_keys_start_from_the_artist(svc):
+    assert svc._artist_cache_keys("a1", {}) == [
+        "artist:a1",
+        "artist:a1:albums",
+        "fingerprint:artist:a1",
+        "top-tracks:a1",
+    ]
+
+
+def test_artist_cache_keys_follow_albums_and_top_tracks(svc):
+    known = {
+        "artist:a1:albums": [_album_payload("alb1"), _album_payload("alb2")],
+        "top-tracks:a1": {"tracks": [_track_payload(album_id="alb9")]},
+    }
+    keys = svc._artist_cache_keys("a1", known)
+    assert {"album:alb1:tracks", "album:alb2:tracks", "album:alb9"} <= set(keys)
+
+
+def test_prefetch_serves_a_warm_artist_without_per_key_statements(svc):
+    svc.cache.write("artist:a1", _artist_payload("a1", "Warm"))
+    svc.cache.write("artist:a1:albums", [_album_payload("alb1")])
+    svc.cache.write("album:alb1:tracks", [])
+    svc._prefetch("a1")
+    assert set(svc.cache._staged) == {"artist:a1", "artist:a1:albums", "album:alb1:tracks"}
+    assert svc.get_artist("a1").name == "Warm"
+    assert svc.get_artist_tracks(Artist("a1", "Warm")) == []
+    assert svc.cache._staged == {}
+    svc.spotify.artist.assert_not_called()
+
+
+def test_invalidate_artist_drops_its_entries_and_tracklists_only(svc):
+    svc.cache.write("artist:a1", _artist_payload("a1", "Gone"))
+    svc.cache.write("artist:a1:albums", [_album_payload("alb1")])
+    svc.cache.write("album:alb1:tracks", [])
+    svc.cache.write("artist:a12", _artist_payload("a12", "Kept"))
+    svc.cache.write("album:alb2:tracks", [])
+    assert svc.invalidate_artist("a1") == 3
+    assert svc.cache.read("artist:a1:albums") is None
+    assert svc.cache.read("album:alb1:tracks") is None
+    assert svc.cache.read("artist:a12") is not None
+    assert svc.cache.read("album:alb2:tracks") == []
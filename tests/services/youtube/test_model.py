@@ -324,3 +324,12 @@ def test_album_from_dict_still_reads_a_year_from_type():
     album = YoutubeAlbum.from_dict({"browseId": "b1", "title": "Album", "year": "Single", "type": "2021"})
     assert album.release_date is not None
     assert album.release_date.year == 2021
+
+
+@pytest.mark.parametrize(
+    "obj",
+    [YoutubeArtist("a", "A"), YoutubeAlbum("b", "B"), YoutubeTrack("t", "T", 1000, album=YoutubeAlbum("b", "B"))],
+    ids=type,
+)
+def test_model_objects_are_slotted(obj):
+    assert not hasattr(obj, "__dict__")
@@ -10,8 +10,8 @@ import requests
 from ytmusicapi.exceptions import YTMusicServerError, YTMusicUserError
 
 from shuffleupagus.core.apiresponse import ApiResponseError
-from shuffleupagus.core.cache import Cache
-from shuffleupagus.core.model import Album, Artist
+from shuffleupagus.core.cache import ABSENT, Cache
+from shuffleupagus.core.model import Album, Artist, _IdentityMap
 from shuffleupagus.services.youtube.model import YoutubeArtist
 from shuffleupagus.services.youtube.service import YoutubeService
 
@@ -153,6 +153,17 @@ def test_get_artist_cache_hit(svc):
     svc.client.get_artist.assert_not_called()
 
 
+def test_a_credit_shares_the_artist_and_keeps_its_handle(svc):
+    svc._identities = _IdentityMap(100)
+    svc.cache.write("channel:@band", "UCabc")
+    svc.cache.write("artist:UCabc", {"channelId": "UCabc", "name": "Cached Band"})
+    by_handle = svc.get_artist("@band")
+    by_credit = svc.get_artist("UCabc")
+    assert by_credit is by_handle
+    assert by_credit is not None
+    assert by_credit.handle == "@band"
+
+
 def test_get_artist_no_yt_music_page_returns_none(svc):
     from ytmusicapi.exceptions import YTMusicServerError
 
@@ -162,6 +173,26 @@ def test_get_artist_no_yt_music_page_returns_none(svc):
     assert artist is None
 
 
+def test_an_artist_with_no_music_page_is_not_asked_for_again(svc):
+    svc.client.get_artist.side_effect = KeyError("musicImmersiveHeaderRenderer")
+    svc.cache.write("channel:@ghost", "UCghost")
+    assert svc.get_artist("@ghost") is None
+    assert svc.get_artist("@ghost") is None
+    assert svc.client.get_artist.call_count == 1
+    assert svc.cache.read("artist:UCghost") is ABSENT
+
+
+def test_an_artist_400_is_asked_for_again(svc):
+    """A 400 may be OAuth refused the browse endpoints, which switching to cookies fixes."""
+    from ytmusicapi.exceptions import YTMusicServerError
+
+    svc.client.get_artist.side_effect = YTMusicServerError("400 Bad Request")
+    svc.cache.write("channel:@oauth", "UCoauth")
+    svc.get_artist("@oauth")
+    svc.get_artist("@oauth")
+    assert svc.client.get_artist.call_count == 2
+
+
 def test_get_artist_400_logs_oauth_warning(svc, caplog):
     from ytmusicapi.exceptions import YTMusicServerError
 
@@ -298,6 +329,37 @@ def test_get_album_tracks(svc):
     assert tracks[0].duration_ms == 200_000
 
 
+def test_an_album_is_cached_with_only_the_fields_either_reader_uses(svc):
+    from shuffleupagus.core.model import Album
+
+    svc.client.get_album.return_value = {
+        "title": "Album 1",
+        "year": "2020",
+        "audioPlaylistId": "OLAK1",
+        "thumbnails": [{"url": "x", "width": 60}],
+        "description": "long text",
+        "tracks": [
+            {
+                "videoId": "vid1",
+                "title": "Song 1",
+                "duration_seconds": 200,
+                "artists": [{"id": None, "name": "Someone"}],
+                "thumbnails": [{"url": "y"}],
+                "likeStatus": "INDIFFERENT",
+            }
+        ],
+    }
+    svc.get_album_tracks(Album("MPL1", "Album 1"))
+    assert svc.cache.read("album:MPL1") == {
+        "title": "Album 1",
+        "year": "2020",
+        "audioPlaylistId": "OLAK1",
+        "tracks": [{"videoId": "vid1", "title": "Song 1", "duration_seconds": 200, "artists": [{"id": None}]}],
+    }
+    assert svc.get_album_by_id("MPL1").name == "Album 1"
+    assert svc.client.get_album.call_count == 1
+
+
 def test_get_album_tracks_cache_hit(svc):
     from shuffleupagus.core.model import Album
 
@@ -1118,6 +1180,13 @@ def test_get_album_by_id_400_raises(svc):
         svc.get_album_by_id("BAD")
 
 
+def test_get_album_by_id_for_an_album_known_absent_raises(svc):
+    svc.client.get_album.side_effect = YTMusicServerError("HTTP 400: Bad Request")
+    svc.get_album_tracks(Album("GONE", "Album"))
+    with pytest.raises(ValueError, match="does not have album GONE"):
+        svc.get_album_by_id("GONE")
+
+
 def test_get_album_by_id_other_error_raises(svc):
     svc.client.get_album.side_effect = YTMusicServerError("500 Server Error")
     with pytest.raises(YTMusicServerError):
@@ -1166,9 +1235,15 @@ def test_get_artist_albums_fingerprint_touch_extends_cache(svc):
     artist = YoutubeArtist("UCabc", "Band")
     artist.inlineAlbums = [{"browseId": "MPL1", "title": "Album", "year": "2020"}]
 
+    written = svc.cache.stats()["artist:"]["writes"]
     albums = svc.get_artist_albums(artist)
     assert len(albums) == 1
     svc.client.get_artist_albums.assert_not_called()
+    counts = svc.cache.stats()["artist:"]
+    assert counts["touches"] == 1
+    assert counts["writes"] == written
+    assert svc.cache.read("artist:UCabc:albums") is not None
+    assert svc.cache.read("fingerprint:artist:UCabc") == "MPL1"
 
 
 # ---------------------------------------------------------------------------
@@ -1202,6 +1277,23 @@ def test_get_album_tracks_non_400_reports_real_error(svc, caplog):
     assert "400" not in caplog.text
 
 
+def test_an_album_not_on_youtube_is_not_asked_for_again(svc):
+    album = Album("MPL1", "Album")
+    svc.client.get_album.side_effect = YTMusicServerError("HTTP 400: Bad Request")
+    assert svc.get_album_tracks(album) == []
+    assert svc.get_album_tracks(album) == []
+    assert svc.client.get_album.call_count == 1
+    assert svc.cache.read("album:MPL1") is ABSENT
+
+
+def test_an_album_that_failed_otherwise_is_asked_for_again(svc):
+    album = Album("MPL1", "Album")
+    svc.client.get_album.side_effect = YTMusicServerError("quotaExceeded")
+    svc.get_album_tracks(album)
+    svc.get_album_tracks(album)
+    assert svc.client.get_album.call_count == 2
+
+
 def test_get_album_tracks_resolves_artists(svc):
     album = Album("MPL1", "Album")
     svc.client.get_album.return_value = {
@@ -1489,3 +1581,46 @@ def test_verify_playlist_rejects_an_entry_without_a_video_id(svc):
     svc._data_api_get = MagicMock(return_value={"items": [{"contentDetails": {}}]})
     with pytest.raises(ApiResponseError, match="videoId is missing"):
         svc._YoutubeService__verify_playlist("pl1", ["v1"])
+
+
+# ---------------------------------------------------------------------------
+# prefetch
+# ---------------------------------------------------------------------------
+
+
+def test_artist_cache_keys_for_a_bare_channel_id(svc):
+    keys = svc._artist_cache_keys("UCabc", {"artist:UCabc:albums": [{"browseId": "MPREb_1"}]})
+    assert keys == [
+        "channel:handle:UCabc",
+        "artist:UCabc",
+        "artist:UCabc:albums",
+        "fingerprint:artist:UCabc",
+        "album:MPREb_1",
+    ]
+
+
+def test_artist_cache_keys_resolve_a_handle_first(svc):
+    assert svc._artist_cache_keys("@band", {}) == ["channel:@band"]
+    keys = svc._artist_cache_keys("@band", {"channel:@band": "UCabc"})
+    assert "artist:UCabc" in keys
+
+
+def test_artist_cache_keys_ignore_a_malformed_channel_entry(svc):
+    assert svc._artist_cache_keys("@band", {"channel:@band": {"not": "an id"}}) == ["channel:@band"]
+
+
+def test_a_removed_handle_is_swept_with_its_channel(svc):
+    for key, value in [
+        ("channel:@kept", "UCkept"),
+        ("artist:UCkept:albums", [{"browseId": "MPREb_1"}]),
+        ("album:MPREb_1", {}),
+        ("channel:@gone", "UCgone"),
+        ("channel:handle:UCgone", "/@gone"),
+        ("artist:UCgone", {}),
+        ("artist:UCgone:albums", [{"browseId": "MPREb_1"}, {"browseId": "MPREb_2"}]),
+        ("album:MPREb_2", {}),
+    ]:
+        svc.cache.write(key, value)
+    assert svc._cached_roots() == {"@kept", "@gone", "UCkept", "UCgone"}
+    assert svc.sweep_orphans(["@kept"]) == 5
+    assert svc.cache.keys() == ["album:MPREb_1", "artist:UCkept:albums", "channel:@kept"]
@@ -140,3 +140,109 @@ def test_service_close_releases_cache_even_when_eviction_fails(tmp_path, monkeyp
     with pytest.raises(RuntimeError, match="boom"):
         svc.close()
     assert svc.cache.closed is True, "connection leaked when eviction raised"
+
+
+# ---------------------------------------------------------------------------
+# cache export / import
+# ---------------------------------------------------------------------------
+
+
+def _run(monkeypatch, *argv):
+    from shuffleupagus.shuffleupagus import main
+
+    monkeypatch.setattr("sys.argv", ["shuffleupagus", *argv])
+    main()
+
+
+def _configured(monkeypatch, **svc_config):
+    """Have the commands read a configuration with svc_config for every service."""
+    config = MagicMock(**{"service.return_value": svc_config})
+    monkeypatch.setattr("shuffleupagus.shuffleupagus.Config", lambda: config)
+    return config
+
+
+def test_cache_export_then_import_warms_a_cold_cache(tmp_path, monkeypatch):
+    _configured(monkeypatch)
+    monkeypatch.setattr(Cache, "_db_path", lambda self: str(tmp_path / "warm" / f"{self.name}.db"))
+    with Cache("spotify") as warm:
+        warm.write("artist:a1", {"id": "a1"})
+    snapshot = str(tmp_path / "spotify.db.gz")
+    _run(monkeypatch, "cache", "export", "spotify", snapshot)
+
+    monkeypatch.setattr(Cache, "_db_path", lambda self: str(tmp_path / "cold" / f"{self.name}.db"))
+    _run(monkeypatch, "cache", "import", "spotify", snapshot, "--merge")
+    with Cache("spotify") as cold:
+        assert cold.read("artist:a1") == {"id": "a1"}
+
+
+def test_cache_import_of_a_bad_file_exits_non_zero(tmp_path, monkeypatch):
+    _configured(monkeypatch)
+    monkeypatch.setattr(Cache, "_db_path", lambda self: str(tmp_path / f"{self.name}.db"))
+    (tmp_path / "bad.gz").write_bytes(b"nope")
+    with pytest.raises(SystemExit) as exc:
+        _run(monkeypatch, "cache", "import", "spotify", str(tmp_path / "bad.gz"))
+    assert exc.value.code == 1
+
+
+def test_cache_commands_name_an_installed_service(monkeypatch):
+    with pytest.raises(SystemExit) as exc:
+        _run(monkeypatch, "cache", "export", "nosuchservice", "out.gz")
+    assert exc.value.code == 2
+
+
+def test_cache_invalidate_drops_a_prefix(tmp_path, monkeypatch):
+    _configured(monkeypatch)
+    monkeypatch.setattr(Cache, "_db_path", lambda self: str(tmp_path / f"{self.name}.db"))
+    with Cache("spotify") as cache:
+        cache.write("album:x", 1)
+        cache.write("artist:a1", 2)
+    _run(monkeypatch, "cache", "invalidate", "spotify", "--prefix", "album:")
+    with Cache("spotify") as cache:
+        assert cache.read("album:x") is None
+        assert cache.read("artist:a1") == 2
+
+
+def test_cache_invalidate_drops_one_artist(tmp_path, monkeypatch):
+    monkeypatch.setattr(Cache, "_db_path", lambda self: str(tmp_path / f"{self.name}.db"))
+    _configured(monkeypatch)
+    with Cache("spotify") as cache:
+        cache.write("artist:a1", 1)
+        cache.write("artist:a2", 2)
+    _run(monkeypatch, "cache", "invalidate", "spotify", "--artist", "spotify:artist:a1")
+    with Cache("spotify") as cache:
+        assert cache.read("artist:a1") is None
+        assert cache.read("artist:a2") == 2
+
+
+def test_cache_commands_open_the_cache_the_service_configures(tmp_path, monkeypatch):
+    monkeypatch.setattr(Cache, "_db_path", lambda self: str(tmp_path / f"{self.name}.db"))
+    _configured(monkeypatch, **{"cache-busy-seconds": 3})
+    opened = []
+    invalidate_prefix = Cache.invalidate_prefix
+
+    def spy(self, prefix):
+        opened.append(self._busy_timeout)
+        return invalidate_prefix(self, prefix)
+
+    monkeypatch.setattr(Cache, "invalidate_prefix", spy)
+    _run(monkeypatch, "cache", "invalidate", "spotify", "--prefix", "album:")
+    assert opened == [3]
+
+
+def test_cache_invalidate_names_what_to_drop(monkeypatch):
+    with pytest.raises(SystemExit) as exc:
+        _run(monkeypatch, "cache", "invalidate", "spotify")
+    assert exc.value.code == 2
+
+
+def test_cache_sweep_drops_artists_no_longer_configured(tmp_path, monkeypatch):
+    monkeypatch.setattr(Cache, "_db_path", lambda self: str(tmp_path / f"{self.name}.db"))
+    config = _configured(monkeypatch)
+    config.service_artists.return_value = ["a1"]
+    with Cache("spotify") as cache:
+        cache.write("artist:a1:albums", [])
+        cache.write("artist:a2:albums", [])
+    _run(monkeypatch, "cache", "sweep", "spotify")
+    config.service_artists.assert_called_once_with("spotify")
+    with Cache("spotify") as cache:
+        assert cache.keys() == ["artist:a1:albums"]